@@ -0,0 +1,472 @@
+import csv
+import os
+import threading
+from abc import ABC, abstractmethod
+
+from contrasenas import HasheadorContrasenas, COSTO_BCRYPT
+from cache import CacheLRU
+from registros import EstadisticasUsuario
+
+# Motor por defecto; la variable de entorno HABITOS_MOTOR lo sobrescribe
+CONFIG_ALMACENAMIENTO = {
+    "motor": "postgres",            # "postgres" (servidor) o "sqlite" (archivo local)
+    "ruta_sqlite": "habitos.sqlite3",
+}
+
+CONFIG_CACHE = {
+    "maximo": 512,                  # entradas antes de expulsar la menos usada
+    "ttl": 60,                      # segundos de vida de cada entrada
+}
+
+CONFIG_HASH = {
+    "costo": COSTO_BCRYPT,          # factor de coste de bcrypt
+    "procesos": 2,                  # trabajadores dedicados a hashear contraseñas
+    "ejecutor": "hilos",            # "hilos" en la aplicación; "procesos" en servidor y benchmarks
+}
+
+# Icono y color de cada categoría de hábito
+MAPEO_CATEGORIAS = {
+    "Salud": {"icono": "dumbbell", "color": "#10b981"},
+    "Aprendizaje": {"icono": "book-open", "color": "#3b82f6"},
+    "Productividad": {"icono": "trending-up", "color": "#f59e0b"},
+    "Bienestar": {"icono": "leaf", "color": "#06b6d4"}
+}
+CATEGORIA_POR_DEFECTO = {"icono": "checkbox-blank-circle", "color": "#3b82f6"}
+
+# Longitud máxima de los textos (los VARCHAR del esquema)
+LIMITES_HABITO = {"nombre": 100, "categoria": 50}
+LIMITES_USUARIO = {"nombre_usuario": 50, "email": 100}
+MAXIMO_ENTERO = 2**31 - 1           # tope de INTEGER en Postgres
+
+# Columnas que acepta la importación masiva, en este orden
+COLUMNAS_IMPORTACION = ("habito_id", "fecha", "hora_inicio", "hora_fin", "duracion_segundos", "notas")
+
+# Columnas de cada tabla en las exportaciones, en este orden
+COLUMNAS_EXPORTACION = {
+    "habitos": ("id", "usuario_id", "nombre", "descripcion", "objetivo_diario_minutos",
+                "categoria", "icono", "color", "fecha_creacion"),
+    "sesiones": ("id", "habito_id", "fecha", "hora_inicio", "hora_fin", "duracion_segundos",
+                 "completada", "notas"),
+}
+
+
+def validar_habito(nombre, descripcion="", objetivo_minutos=30, categoria="Salud"):
+    """Lanza ValueError si el servidor rechazaría estos datos. Se comprueba
+    antes de anotarlos en el diario: una entrada que nunca entra no debe
+    quedarse reintentándose."""
+    if not isinstance(nombre, str) or not nombre.strip():
+        raise ValueError("El nombre es obligatorio")
+    if not isinstance(descripcion, str):
+        raise ValueError("La descripción debe ser texto")
+    if not isinstance(categoria, str):
+        raise ValueError("La categoría debe ser texto")
+    for campo, valor in (("nombre", nombre), ("categoria", categoria)):
+        if len(valor) > LIMITES_HABITO[campo]:
+            raise ValueError(f"'{campo}' admite como mucho {LIMITES_HABITO[campo]} caracteres")
+    if isinstance(objetivo_minutos, bool) or not isinstance(objetivo_minutos, int) \
+            or not 1 <= objetivo_minutos <= MAXIMO_ENTERO:
+        raise ValueError("El objetivo diario debe ser un número entero positivo")
+
+
+def totalizar_resumen(habitos, racha_total=0):
+    """Totales del panel de inicio a partir de las filas de sus hábitos
+    (cada una con total_sesiones, total_segundos, minutos_hoy y objetivo).
+    La pantalla lo usa también para recalcular tras un cambio sin volver
+    a consultar."""
+    resumen = {
+        'total_habitos': len(habitos),
+        'total_sesiones': 0,
+        'total_segundos': 0,
+        'racha_total': racha_total,
+        'minutos_hoy': 0,
+        'progreso_general': 0,
+        'habitos': habitos
+    }
+    total_objetivo = 0
+    total_realizado = 0
+
+    for habito in habitos:
+        objetivo = habito.get('objetivo_diario_minutos', 30)
+        total_objetivo += objetivo
+        total_realizado += min(habito['minutos_hoy'], objetivo)  # Máximo el objetivo
+
+        resumen['total_sesiones'] += habito['total_sesiones']
+        resumen['total_segundos'] += habito['total_segundos']
+        resumen['minutos_hoy'] += habito['minutos_hoy']
+
+    if total_objetivo > 0:
+        resumen['progreso_general'] = int((total_realizado / total_objetivo) * 100)
+    return resumen
+
+
+def sql_exportacion(tabla, por_usuario, marcador):
+    """SELECT de una tabla de COLUMNAS_EXPORTACION, de toda la base de datos
+    o de un usuario (`marcador` es el parámetro del motor: %s o ?). Ordena
+    por la clave primaria para que el recorrido siga el índice."""
+    columnas = ", ".join(f"t.{columna}" for columna in COLUMNAS_EXPORTACION[tabla])
+    if tabla == "habitos":
+        filtro = f"WHERE t.usuario_id = {marcador}"
+    else:
+        filtro = f"JOIN habitos h ON h.id = t.habito_id WHERE h.usuario_id = {marcador}"
+    return f"SELECT {columnas} FROM {tabla} t {filtro if por_usuario else ''} ORDER BY t.id"
+
+
+def crear_almacenamiento(motor=None, ruta_sqlite=None, **opciones):
+    """Crea el almacenamiento configurado. `opciones` pasan tal cual al
+    constructor (config_conexion, config_pool, config_cache...)."""
+    motor = motor or os.environ.get("HABITOS_MOTOR") or CONFIG_ALMACENAMIENTO["motor"]
+
+    # Cada motor se importa solo si se usa: una instalación local no
+    # necesita psycopg2
+    if motor == "sqlite":
+        from database_sqlite import BaseDatosSQLite
+        return BaseDatosSQLite(ruta_sqlite or CONFIG_ALMACENAMIENTO["ruta_sqlite"], **opciones)
+    if motor == "postgres":
+        from database import BaseDatos
+        return BaseDatos(**opciones)
+    raise ValueError(f"Motor de almacenamiento desconocido: {motor}")
+
+
+class AlmacenamientoDiferido:
+    """Crea el almacenamiento en un hilo aparte y hace de intermediario
+    mientras tanto, para que la ventana no espere a la conexión.
+
+    Pedir un método nunca bloquea; llamarlo sí, hasta que el almacenamiento
+    esté listo (por eso solo se llama desde el despachador o el diario, en
+    sus hilos). Si la creación falló, cada llamada relanza ese error.
+    """
+
+    def __init__(self, fabrica, al_listo=None):
+        self._fabrica = fabrica
+        self._al_listo = al_listo
+        self._real = None
+        self._error = None
+        self._listo = threading.Event()
+        threading.Thread(target=self._crear, name="almacenamiento", daemon=True).start()
+
+    def _crear(self):
+        try:
+            self._real = self._fabrica()
+        except Exception as e:
+            print(f"Error creando el almacenamiento: {e}")
+            self._error = e
+        finally:
+            self._listo.set()
+        if self._al_listo:
+            self._al_listo(self._error)
+
+    def listo(self):
+        return self._listo.is_set()
+
+    def esperar(self, tiempo=None):
+        """Devuelve el almacenamiento real en cuanto exista."""
+        if not self._listo.wait(tiempo):
+            raise TimeoutError("El almacenamiento aún no está listo")
+        if self._error is not None:
+            raise self._error
+        return self._real
+
+    def __getattr__(self, nombre):
+        if self._real is not None:
+            return getattr(self._real, nombre)
+
+        def diferido(*args, **kwargs):
+            return getattr(self.esperar(), nombre)(*args, **kwargs)
+        return diferido
+
+    def cerrar_conexion(self):
+        # Si aún se está conectando no se espera: el hilo es daemon
+        if self._real is not None:
+            self._real.cerrar_conexion()
+
+
+class Almacenamiento(ABC):
+    """Contrato común de los motores de almacenamiento (Postgres en
+    database.py, SQLite en database_sqlite.py).
+
+    Aquí viven la caché, el hash de contraseñas y las lecturas cacheadas;
+    cada motor implementa las consultas. Las pantallas solo usan los
+    métodos públicos y reciben siempre las mismas claves en los resultados.
+    """
+
+    # Excepciones que significan "el almacenamiento no responde": con ellas
+    # se sirve la caché aunque haya caducado
+    errores_conexion = ()
+    # Excepciones con las que el servidor rechaza los datos en sí: reintentar
+    # la misma escritura no sirve de nada
+    errores_datos = ()
+
+    def __init__(self, config_hash=None, config_cache=None):
+        self.cache = CacheLRU(**{**CONFIG_CACHE, **(config_cache or {})})
+        self.hasheador = HasheadorContrasenas(**{**CONFIG_HASH, **(config_hash or {})})
+
+    def _leer_con_cache(self, clave, etiquetas, consultar):
+        """Lectura a través de la caché. `consultar` debe lanzar la excepción
+        si falla, para no guardar en caché un resultado vacío por error."""
+        encontrado, valor = self.cache.obtener(clave)
+        if encontrado:
+            return valor
+
+        generacion = self.cache.generacion
+        try:
+            valor = consultar()
+        except self.errores_conexion:
+            # Sin servidor se sirve lo último que se leyó, aunque haya caducado
+            encontrado, valor = self.cache.obtener_caducada(clave)
+            if encontrado:
+                return valor
+            raise
+        if valor is not None:
+            self.cache.guardar(clave, valor, etiquetas, generacion)
+        return valor
+
+    # =================== MÉTODOS DE USUARIOS ===================
+    def encriptar_contrasena(self, contrasena):
+        return self.hasheador.encriptar(contrasena)
+
+    def verificar_contrasena(self, contrasena, contrasena_encriptada):
+        return self.hasheador.verificar(contrasena, contrasena_encriptada)
+
+    def _rehacer_hash(self, usuario_id, contrasena, contrasena_encriptada):
+        # El hash guardado usa un coste distinto del configurado: se rehace
+        # ahora que conocemos la contraseña. Si otro proceso ya lo cambió,
+        # la condición sobre el hash anterior evita pisarlo.
+        try:
+            nueva = self.encriptar_contrasena(contrasena)
+            self._cambiar_hash(usuario_id, nueva, contrasena_encriptada)
+        except Exception as e:
+            print(f"Error actualizando hash de contraseña: {e}")
+
+    @abstractmethod
+    def _cambiar_hash(self, usuario_id, nueva, anterior):
+        """UPDATE de la contraseña solo si sigue siendo `anterior`."""
+
+    @abstractmethod
+    def _buscar_usuario(self, usuario_o_email):
+        """Fila (id, nombre_usuario, email, contrasena) o None."""
+
+    @abstractmethod
+    def registrar_usuario(self, nombre_usuario, email, contrasena):
+        """{"exito", "usuario"} o {"exito": False, "mensaje"}."""
+
+    def iniciar_sesion(self, usuario_o_email, contrasena):
+        try:
+            usuario = self._buscar_usuario(usuario_o_email)
+            if not usuario:
+                return {"exito": False, "mensaje": "Usuario no encontrado"}
+
+            if self.verificar_contrasena(contrasena, usuario["contrasena"]):
+                if self.hasheador.necesita_rehash(usuario["contrasena"]):
+                    self._rehacer_hash(usuario["id"], contrasena, usuario["contrasena"])
+                return {"exito": True, "usuario": {
+                    "id": usuario["id"],
+                    "nombre_usuario": usuario["nombre_usuario"],
+                    "email": usuario["email"],
+                }}
+            return {"exito": False, "mensaje": "Contraseña incorrecta"}
+        except Exception as e:
+            return {"exito": False, "mensaje": str(e)}
+
+    # =================== MÉTODOS DE HÁBITOS ===================
+    @abstractmethod
+    def crear_habito(self, usuario_id, nombre, descripcion="", objetivo_minutos=30, categoria="Salud"):
+        """Registro Habito (estadísticas a cero, como una tarjeta del panel), o None."""
+
+    @abstractmethod
+    def actualizar_habito(self, habito_id, nombre, descripcion="", objetivo_minutos=30, categoria="Salud"):
+        """Registro Habito actualizado (sin estadísticas), o False si no existe."""
+
+    def obtener_habitos_usuario(self, usuario_id):
+        try:
+            return self._leer_con_cache(
+                ('habitos', usuario_id), [('usuario', usuario_id)],
+                lambda: self._consultar_habitos_usuario(usuario_id)
+            )
+        except Exception as e:
+            print(f"Error obteniendo hábitos: {e}")
+            return []
+
+    @abstractmethod
+    def _consultar_habitos_usuario(self, usuario_id):
+        """Registros Habito con totales y rachas, del más nuevo al más viejo."""
+
+    def obtener_habito_por_id(self, habito_id):
+        try:
+            return self._leer_con_cache(
+                ('habito', habito_id), [('habito', habito_id)],
+                lambda: self._consultar_habito_por_id(habito_id)
+            )
+        except Exception as e:
+            print(f"Error obteniendo hábito: {e}")
+            return None
+
+    @abstractmethod
+    def _consultar_habito_por_id(self, habito_id):
+        """Registro Habito con totales, minutos de hoy, promedio y racha."""
+
+    @abstractmethod
+    def eliminar_habito(self, habito_id):
+        """{id, usuario_id, racha_total}, o False si no existía."""
+
+    # =================== MÉTODOS DE SESIONES ===================
+    @abstractmethod
+    def registrar_sesion(self, habito_id, duracion_segundos, hora_inicio=None, hora_fin=None, notas=""):
+        """{id, usuario_id} de la sesión, o None."""
+
+    @abstractmethod
+    def eliminar_sesion(self, sesion_id):
+        """True si la borró."""
+
+    @abstractmethod
+    def importar_sesiones(self, filas, tamano_lote=10000):
+        """Reporte {exito, leidas, insertadas, descartadas, segundos, filas_por_segundo}."""
+
+    def importar_sesiones_csv(self, ruta, tamano_lote=10000):
+        """Importa un CSV con cabecera cuyas columnas son las de
+        COLUMNAS_IMPORTACION. El archivo se lee en streaming."""
+        with open(ruta, newline="", encoding="utf-8") as archivo:
+            return self.importar_sesiones(csv.DictReader(archivo), tamano_lote)
+
+    @abstractmethod
+    def obtener_sesiones_habito(self, habito_id, limite=7):
+        """Últimas sesiones del hábito (registros Sesion)."""
+
+    def obtener_historial_sesiones(self, habito_id, despues_de=None, limite=20):
+        """Una página del historial, de la sesión más reciente a la más
+        antigua, en orden (fecha, hora_inicio, id). `despues_de` es el valor
+        'siguiente' de la página anterior; la paginación es por clave, así
+        que la página 1000 cuesta lo mismo que la primera.
+
+        Devuelve {sesiones, siguiente}; siguiente es None en la última."""
+        try:
+            # Una fila de más dice si queda otra página sin contar el total
+            filas = self._consultar_pagina_sesiones(habito_id, despues_de, limite + 1)
+        except Exception as e:
+            print(f"Error obteniendo historial: {e}")
+            return {'sesiones': [], 'siguiente': None}
+
+        sesiones = filas[:limite]
+        siguiente = None
+        if len(filas) > limite:
+            ultima = sesiones[-1]
+            siguiente = (ultima.fecha, ultima.hora_inicio, ultima.id)
+        return {'sesiones': sesiones, 'siguiente': siguiente}
+
+    @abstractmethod
+    def _consultar_pagina_sesiones(self, habito_id, despues_de, limite):
+        """Hasta `limite` registros Sesion (id, fecha, hora_inicio, hora_fin,
+        duracion_segundos) anteriores a la clave (fecha, hora_inicio, id)
+        `despues_de`, o las más recientes si es None."""
+
+    @abstractmethod
+    def obtener_minutos_hoy(self, habito_id):
+        """Minutos registrados hoy."""
+
+    # =================== MÉTODOS DE ESTADÍSTICAS ===================
+    @abstractmethod
+    def calcular_racha_habito(self, habito_id):
+        """Días seguidos hasta hoy."""
+
+    @abstractmethod
+    def calcular_rachas_usuario(self, usuario_id):
+        """{habito_id: {racha_dias, racha_maxima, inicio_racha}}."""
+
+    @abstractmethod
+    def calcular_promedio_minutos(self, habito_id):
+        """Minutos medios por sesión."""
+
+    def obtener_estadisticas_usuario(self, usuario_id):
+        try:
+            return self._leer_con_cache(
+                ('estadisticas', usuario_id), [('usuario', usuario_id)],
+                lambda: self._consultar_estadisticas_usuario(usuario_id)
+            )
+        except Exception as e:
+            print(f"Error obteniendo estadísticas: {e}")
+            return EstadisticasUsuario()
+
+    @abstractmethod
+    def _consultar_estadisticas_usuario(self, usuario_id):
+        """Registro EstadisticasUsuario."""
+
+    @abstractmethod
+    def calcular_racha_total(self, usuario_id):
+        """Días seguidos hasta hoy con alguna sesión de cualquier hábito."""
+
+    # =================== MÉTODOS DEL PANEL DE INICIO ===================
+    def obtener_resumen_inicio(self, usuario_id):
+        """Devuelve en una sola consulta todo lo que necesita InicioScreen:
+        totales del usuario, minutos de hoy, progreso general y los datos
+        de cada tarjeta de hábito."""
+        try:
+            return self._leer_con_cache(
+                ('resumen', usuario_id), [('usuario', usuario_id)],
+                lambda: self._consultar_resumen_inicio(usuario_id)
+            )
+        except Exception as e:
+            print(f"Error obteniendo resumen de inicio: {e}")
+            return totalizar_resumen([])
+
+    @abstractmethod
+    def _consultar_resumen_inicio(self, usuario_id):
+        """Resultado de totalizar_resumen con las filas de cada hábito."""
+
+    # =================== MÉTODOS DE ANALÍTICA ===================
+    def obtener_informe_usuario(self, usuario_id):
+        """Informe de analitica.generar_informe con dos consultas (hábitos y
+        sesiones). Se cachea con el resto de datos del usuario."""
+        try:
+            return self._leer_con_cache(
+                ('informe', usuario_id), [('usuario', usuario_id)],
+                lambda: self._consultar_informe_usuario(usuario_id)
+            )
+        except Exception as e:
+            print(f"Error obteniendo informe: {e}")
+            return None
+
+    def _consultar_informe_usuario(self, usuario_id):
+        # pandas solo se carga la primera vez que se pide un informe
+        from analitica import generar_informe
+        return generar_informe(
+            self._consultar_habitos_usuario(usuario_id),
+            self._consultar_sesiones_usuario(usuario_id),
+        )
+
+    @abstractmethod
+    def _consultar_sesiones_usuario(self, usuario_id):
+        """Registros Sesion (habito_id, fecha, hora_inicio, duracion_segundos)
+        de todas las sesiones del usuario."""
+
+    # =================== MÉTODOS DE EXPORTACIÓN ===================
+    @abstractmethod
+    def recorrer_exportacion(self, tabla, usuario_id=None, tamano_lote=5000):
+        """Generador de lotes (listas de tuplas en el orden de
+        COLUMNAS_EXPORTACION[tabla]) de un usuario o, sin usuario_id, de
+        toda la base de datos. La memoria no depende del total de filas."""
+
+    # =================== MÉTODOS DE RECORDATORIOS ===================
+    @abstractmethod
+    def actualizar_recordatorio(self, habito_id, activo, hora_inicio=None, hora_fin=None):
+        """True si se guardó."""
+
+    def obtener_recordatorio(self, habito_id):
+        try:
+            return self._leer_con_cache(
+                ('recordatorio', habito_id), [('habito', habito_id)],
+                lambda: self._consultar_recordatorio(habito_id)
+            )
+        except Exception as e:
+            print(f"Error obteniendo recordatorio: {e}")
+            return None
+
+    @abstractmethod
+    def _consultar_recordatorio(self, habito_id):
+        """Registro Recordatorio (activo, hora_inicio, hora_fin) o None."""
+
+    # =================== MÉTODOS DEL DIARIO LOCAL ===================
+    @abstractmethod
+    def aplicar_diario(self, entradas):
+        """Aplica un lote del diario local; lanza la excepción si falla."""
+
+    def cerrar_conexion(self):
+        self.hasheador.cerrar()
@@ -0,0 +1,178 @@
+"""Analítica de hábitos con pandas.
+
+Las estadísticas de las pantallas salían de una consulta por hábito y por
+cifra. Aquí se traen una vez todas las sesiones del usuario a un DataFrame
+y todo el informe sale de operaciones vectorizadas sobre él: totales por
+semana y por mes, medias móviles de 7 y 30 días, cumplimiento del objetivo
+diario y reparto por día de la semana y hora del día.
+
+Lo usa Almacenamiento.obtener_informe_usuario, que lo cachea; las pantallas
+reciben el informe ya calculado.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+DIAS_SEMANA = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo")
+
+# Cuánto histórico devuelve el informe en cada serie
+SEMANAS_INFORME = 12
+MESES_INFORME = 12
+DIAS_INFORME = 30
+
+OBJETIVO_POR_DEFECTO = 30
+
+
+def marco_sesiones(sesiones):
+    """DataFrame con una fila por sesión: habito_id, fecha, hora_inicio y
+    minutos. Acepta las filas tal cual salen del almacenamiento (registros
+    Sesion o dicts)."""
+    marco = pd.DataFrame.from_records(
+        [(fila['habito_id'], fila['fecha'], fila['hora_inicio'], fila['duracion_segundos'])
+         for fila in sesiones],
+        columns=["habito_id", "fecha", "hora_inicio", "duracion_segundos"],
+    )
+    marco["habito_id"] = marco["habito_id"].astype("int64")
+    marco["fecha"] = pd.to_datetime(marco["fecha"]).dt.normalize()
+    marco["hora_inicio"] = pd.to_datetime(marco["hora_inicio"])
+    marco["minutos"] = marco["duracion_segundos"].astype("float64") / 60
+    return marco
+
+
+def _minutos(valor):
+    return int(round(float(valor)))
+
+
+def _media(valor):
+    return round(float(valor), 1)
+
+
+def _porcentaje(hechos, total):
+    return int(hechos * 100 // total) if total else 0
+
+
+def _mejor(reparto, etiquetas=None):
+    """Índice (o etiqueta) del máximo de un reparto, o None si está a cero."""
+    if not reparto.any():
+        return None
+    indice = int(np.argmax(reparto))
+    return etiquetas[indice] if etiquetas else indice
+
+
+def generar_informe(habitos, sesiones, hoy=None):
+    """Informe de un usuario a partir de sus hábitos (con id,
+    objetivo_diario_minutos y fecha_creacion) y de todas sus sesiones.
+
+    Devuelve solo tipos de Python (int, float, date, listas y dicts):
+    totales, series semanal/mensual/diaria, medias móviles, cumplimiento,
+    repartos por día de la semana y por hora, y lo mismo por hábito en
+    informe['habitos'][habito_id].
+    """
+    hoy = pd.Timestamp(hoy or date.today()).normalize()
+    ids = [habito['id'] for habito in habitos]
+
+    marco = marco_sesiones(sesiones)
+    # Sesiones de hábitos ajenos o con fecha futura no cuentan
+    marco = marco[marco["habito_id"].isin(ids) & (marco["fecha"] <= hoy)]
+
+    objetivos = pd.Series(
+        [habito.get('objetivo_diario_minutos') or OBJETIVO_POR_DEFECTO for habito in habitos],
+        index=ids, dtype="float64",
+    )
+    # Cada hábito cuenta desde que se creó o desde su primera sesión, lo
+    # que sea antes (las importaciones pueden traer sesiones anteriores)
+    creacion = pd.Series(
+        [pd.Timestamp(habito.get('fecha_creacion') or hoy).normalize() for habito in habitos],
+        index=ids, dtype="datetime64[ns]",
+    )
+    desde = pd.concat([creacion, marco.groupby("habito_id")["fecha"].min()], axis=1).min(axis=1)
+    desde = desde.reindex(ids).fillna(hoy).clip(upper=hoy)
+
+    inicio = desde.min() if ids else hoy
+    calendario = pd.date_range(inicio, hoy, freq="D")
+
+    # Minutos por día (filas) y hábito (columnas), con ceros en los huecos
+    diario = (
+        marco.groupby(["fecha", "habito_id"])["minutos"].sum()
+        .unstack(fill_value=0.0)
+        .reindex(index=calendario, columns=ids, fill_value=0.0)
+    )
+    total_diario = diario.sum(axis=1)
+    sesiones_diarias = marco.groupby("fecha").size().reindex(calendario, fill_value=0)
+
+    medias_7 = diario.rolling(7, min_periods=1).mean()
+    medias_30 = diario.rolling(30, min_periods=1).mean()
+    total_7 = total_diario.rolling(7, min_periods=1).mean()
+    total_30 = total_diario.rolling(30, min_periods=1).mean()
+
+    # Cumplimiento: días con el objetivo alcanzado entre los días en que
+    # el hábito existía
+    vigente = calendario.values[:, None] >= desde.values[None, :]
+    cumplido = diario.ge(objetivos, axis=1).values & vigente
+    dias = vigente.sum(axis=0)
+    dias_cumplidos = cumplido.sum(axis=0)
+
+    totales = pd.DataFrame({"minutos": total_diario, "sesiones": sesiones_diarias})
+    semanal = totales.resample("W-MON", label="left", closed="left").sum().tail(SEMANAS_INFORME)
+    mensual = totales.resample("MS").sum().tail(MESES_INFORME)
+
+    # Repartos (minutos) por día de la semana y por hora de inicio
+    dia_semana = marco["fecha"].dt.dayofweek
+    hora = marco["hora_inicio"].dt.hour
+    por_dia_habito = (
+        marco.groupby(["habito_id", dia_semana])["minutos"].sum()
+        .unstack(fill_value=0.0)
+        .reindex(index=ids, columns=range(7), fill_value=0.0)
+    )
+    por_hora_habito = (
+        marco.groupby(["habito_id", hora])["minutos"].sum()
+        .unstack(fill_value=0.0)
+        .reindex(index=ids, columns=range(24), fill_value=0.0)
+    )
+    por_dia = por_dia_habito.sum(axis=0).values
+    por_hora = por_hora_habito.sum(axis=0).values
+
+    ultimos = slice(-DIAS_INFORME, None)
+    informe = {
+        'fecha': hoy.date(),
+        'total_minutos': _minutos(total_diario.sum()),
+        'total_sesiones': int(len(marco)),
+        'dias_activos': int((total_diario > 0).sum()),
+        'media_7_dias': _media(total_7.iloc[-1]),
+        'media_30_dias': _media(total_30.iloc[-1]),
+        'cumplimiento': _porcentaje(dias_cumplidos.sum(), dias.sum()),
+        'semanal': [
+            {'inicio': inicio_semana.date(), 'minutos': _minutos(fila.minutos), 'sesiones': int(fila.sesiones)}
+            for inicio_semana, fila in semanal.iterrows()
+        ],
+        'mensual': [
+            {'mes': mes.date(), 'minutos': _minutos(fila.minutos), 'sesiones': int(fila.sesiones)}
+            for mes, fila in mensual.iterrows()
+        ],
+        'diario': [
+            {'fecha': dia.date(), 'minutos': _minutos(minutos), 'media_7': _media(media_7),
+             'media_30': _media(media_30)}
+            for dia, minutos, media_7, media_30 in zip(
+                calendario[ultimos], total_diario.values[ultimos],
+                total_7.values[ultimos], total_30.values[ultimos],
+            )
+        ],
+        'por_dia_semana': [_minutos(m) for m in por_dia],
+        'mejor_dia_semana': _mejor(por_dia, DIAS_SEMANA),
+        'por_hora': [_minutos(m) for m in por_hora],
+        'mejor_hora': _mejor(por_hora),
+        'habitos': {},
+    }
+
+    for posicion, habito_id in enumerate(ids):
+        informe['habitos'][habito_id] = {
+            'media_7_dias': _media(medias_7.iat[-1, posicion]),
+            'media_30_dias': _media(medias_30.iat[-1, posicion]),
+            'dias': int(dias[posicion]),
+            'dias_cumplidos': int(dias_cumplidos[posicion]),
+            'cumplimiento': _porcentaje(dias_cumplidos[posicion], dias[posicion]),
+            'mejor_dia_semana': _mejor(por_dia_habito.iloc[posicion].values, DIAS_SEMANA),
+            'mejor_hora': _mejor(por_hora_habito.iloc[posicion].values),
+        }
+    return informe
@@ -0,0 +1,199 @@
+"""Benchmark de los métodos públicos de BaseDatos a distintos tamaños de datos.
+
+Para cada tamaño (usuarios x hábitos por usuario x sesiones por hábito)
+recrea una base de datos de pruebas, la llena con generador_datos y mide
+cada método: latencias p50/p95/p99 y consultas SQL por llamada. La caché
+se desactiva para medir la base de datos y no la memoria.
+
+Los resultados se guardan en JSON; con --comparar se contrastan con una
+ejecución anterior y se marcan las regresiones.
+
+    python benchmarks/bench_base_datos.py --tamanos 10x5x50 100x10x200
+    python benchmarks/bench_base_datos.py --comparar benchmarks/resultados/bench_....json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+from database import BaseDatos, CursorInstrumentado, CONFIG_CONEXION
+from instrumentacion import accion, registro
+from generador_datos import generar, nombre_usuario, CONTRASENA_PRUEBA
+
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+
+
+# (nombre, función(bd, contexto)). El contexto trae un usuario y un hábito
+# elegidos al azar para cada llamada.
+OPERACIONES = [
+    ("obtener_resumen_inicio", lambda bd, c: bd.obtener_resumen_inicio(c["usuario_id"])),
+    ("obtener_habitos_usuario", lambda bd, c: bd.obtener_habitos_usuario(c["usuario_id"])),
+    ("obtener_habito_por_id", lambda bd, c: bd.obtener_habito_por_id(c["habito_id"])),
+    ("obtener_estadisticas_usuario", lambda bd, c: bd.obtener_estadisticas_usuario(c["usuario_id"])),
+    ("calcular_racha_total", lambda bd, c: bd.calcular_racha_total(c["usuario_id"])),
+    ("calcular_rachas_usuario", lambda bd, c: bd.calcular_rachas_usuario(c["usuario_id"])),
+    ("calcular_racha_habito", lambda bd, c: bd.calcular_racha_habito(c["habito_id"])),
+    ("calcular_promedio_minutos", lambda bd, c: bd.calcular_promedio_minutos(c["habito_id"])),
+    ("obtener_minutos_hoy", lambda bd, c: bd.obtener_minutos_hoy(c["habito_id"])),
+    ("obtener_sesiones_habito", lambda bd, c: bd.obtener_sesiones_habito(c["habito_id"])),
+    ("obtener_recordatorio", lambda bd, c: bd.obtener_recordatorio(c["habito_id"])),
+    ("actualizar_recordatorio", lambda bd, c: bd.actualizar_recordatorio(c["habito_id"], True, "08:00", "09:00")),
+    ("actualizar_habito", lambda bd, c: bd.actualizar_habito(c["habito_id"], "Hábito editado", "", 30, "Salud")),
+    ("registrar_sesion", lambda bd, c: bd.registrar_sesion(c["habito_id"], 600)),
+    ("iniciar_sesion", lambda bd, c: bd.iniciar_sesion(c["nombre_usuario"], CONTRASENA_PRUEBA)),
+]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def recrear_base_datos(config):
+    administracion = psycopg2.connect(**{**config, "database": "postgres"})
+    administracion.autocommit = True
+    with administracion.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS "{config["database"]}"')
+        cursor.execute(f'CREATE DATABASE "{config["database"]}"')
+    administracion.close()
+
+
+def medir_tamano(config, usuarios, habitos, sesiones, repeticiones, semilla):
+    recrear_base_datos(config)
+    registro.limpiar()
+    bd = BaseDatos(
+        config_conexion=config,
+        config_cache={"maximo": 0},
+        # Coste bajo: el benchmark de contraseñas es bench_contrasenas.py
+        config_hash={"costo": 4, "procesos": 0},
+        # Cada sentencia queda en instrumentacion.registro bajo la operación
+        fabrica_cursor=CursorInstrumentado,
+    )
+    try:
+        inicio = time.perf_counter()
+        ids = generar(bd, usuarios, habitos, sesiones, semilla=semilla)
+        print(f"  datos generados en {time.perf_counter() - inicio:.1f}s "
+              f"({len(ids['habitos'])} hábitos, {ids['sesiones']} sesiones)")
+
+        with bd.transaccion() as cursor:
+            cursor.execute("ANALYZE")
+
+        rng = random.Random(semilla)
+        resultados = {}
+        for nombre, operacion in OPERACIONES:
+            tiempos = []
+            for _ in range(repeticiones):
+                indice = rng.randrange(len(ids["usuarios"]))
+                contexto = {
+                    "usuario_id": ids["usuarios"][indice],
+                    "nombre_usuario": nombre_usuario(indice),
+                    "habito_id": rng.choice(ids["habitos"]),
+                }
+                with accion(nombre):
+                    t0 = time.perf_counter()
+                    operacion(bd, contexto)
+                tiempos.append((time.perf_counter() - t0) * 1000)
+
+            resultados[nombre] = {
+                "p50_ms": percentil(tiempos, 50),
+                "p95_ms": percentil(tiempos, 95),
+                "p99_ms": percentil(tiempos, 99),
+                "media_ms": statistics.fmean(tiempos),
+                "consultas_por_llamada": registro.contar(nombre) / repeticiones,
+            }
+            r = resultados[nombre]
+            print(f"  {nombre:<30} p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f}  "
+                  f"p99 {r['p99_ms']:8.2f} ms  {r['consultas_por_llamada']:.1f} consultas")
+        return resultados
+    finally:
+        bd.cerrar_conexion()
+
+
+def comparar(actual, anterior, umbral):
+    print(f"\nComparación con {anterior['fecha']} (regresión si p50 sube más de {umbral:.0%})")
+    regresiones = 0
+    for tamano, metodos in actual["tamanos"].items():
+        previos = anterior["tamanos"].get(tamano)
+        if not previos:
+            continue
+        for nombre, r in metodos.items():
+            p = previos.get(nombre)
+            if not p or not p["p50_ms"]:
+                continue
+            cambio = r["p50_ms"] / p["p50_ms"] - 1
+            marca = ""
+            if cambio > umbral:
+                marca = "  <-- REGRESIÓN"
+                regresiones += 1
+            print(f"  {tamano:<14} {nombre:<30} {p['p50_ms']:8.2f} -> {r['p50_ms']:8.2f} ms "
+                  f"({cambio:+.0%}){marca}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanos", nargs="+", default=["10x5x30", "100x10x100"],
+                        help="usuarios x hábitos por usuario x sesiones por hábito")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--host", default=CONFIG_CONEXION["host"])
+    parser.add_argument("--puerto", default=CONFIG_CONEXION["port"])
+    parser.add_argument("--usuario", default=CONFIG_CONEXION["user"])
+    parser.add_argument("--contrasena", default=CONFIG_CONEXION["password"])
+    parser.add_argument("--base-datos", default="habitos_bench",
+                        help="se borra y se recrea en cada tamaño")
+    parser.add_argument("--salida", default=DIRECTORIO_RESULTADOS)
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    parser.add_argument("--umbral", type=float, default=0.2)
+    parser.add_argument("--lentas-ms", type=float, default=float("inf"),
+                        help="imprime las consultas que tarden más que esto")
+    parser.add_argument("--volcar", action="store_true", help="resumen de consultas por método")
+    args = parser.parse_args()
+    registro.umbral_lento_ms = args.lentas_ms
+
+    config = {
+        "host": args.host,
+        "port": args.puerto,
+        "user": args.usuario,
+        "password": args.contrasena,
+        "database": args.base_datos,
+    }
+
+    ejecucion = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "repeticiones": args.repeticiones,
+        "semilla": args.semilla,
+        "tamanos": {},
+    }
+    for tamano in args.tamanos:
+        usuarios, habitos, sesiones = (int(x) for x in tamano.split("x"))
+        print(f"\n== {usuarios} usuarios x {habitos} hábitos x {sesiones} sesiones ==")
+        ejecucion["tamanos"][tamano] = medir_tamano(
+            config, usuarios, habitos, sesiones, args.repeticiones, args.semilla
+        )
+        if args.volcar:
+            registro.volcar()
+
+    os.makedirs(args.salida, exist_ok=True)
+    ruta = os.path.join(args.salida, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        json.dump(ejecucion, archivo, indent=2)
+    print(f"\nResultados guardados en {ruta}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            if comparar(ejecucion, json.load(archivo), args.umbral):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
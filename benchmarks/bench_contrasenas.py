@@ -0,0 +1,50 @@
+"""Inicios de sesión por segundo según el número de procesos de hash.
+
+Lanza muchas verificaciones bcrypt a la vez, como harían varios usuarios
+entrando al mismo tiempo, y mide cuántas termina por segundo cada
+configuración. procesos=0 es la referencia: verificar en el propio hilo.
+
+    python benchmarks/bench_contrasenas.py --costo 12 --logins 64
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contrasenas import HasheadorContrasenas, COSTO_BCRYPT
+
+
+def medir(procesos, costo, logins):
+    hasheador = HasheadorContrasenas(costo=costo, procesos=procesos)
+    try:
+        encriptada = HasheadorContrasenas(costo=costo, procesos=0).encriptar("contrasena-de-prueba")
+        # Calentar el pool para no medir el arranque de los procesos
+        hasheador.verificar("contrasena-de-prueba", encriptada)
+
+        inicio = time.perf_counter()
+        futuros = [hasheador.verificar_async("contrasena-de-prueba", encriptada) for _ in range(logins)]
+        assert all(f.result() for f in futuros)
+        return logins / (time.perf_counter() - inicio)
+    finally:
+        hasheador.cerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--costo", type=int, default=COSTO_BCRYPT)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--procesos", type=int, nargs="+",
+                        default=[0, 1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    print(f"bcrypt coste {args.costo}, {args.logins} inicios de sesión por prueba")
+    print(f"{'procesos':>8} {'logins/s':>10} {'ms/login':>10}")
+    for procesos in sorted(set(args.procesos)):
+        por_segundo = medir(procesos, args.costo, args.logins)
+        print(f"{procesos:>8} {por_segundo:>10.1f} {1000 / por_segundo:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Benchmark de las sentencias preparadas de BaseDatos bajo carga.
+
+Lanza varios hilos que llaman sin parar a los métodos con sentencia
+preparada (SENTENCIAS_PREPARADAS) y compara dos modos sobre los mismos
+datos: enviando el texto SQL en cada llamada (preparar=False) y
+ejecutando por nombre (preparar=True). Para cada sentencia muestra además
+el tiempo de planificación que Postgres se ahorra por llamada, sacado de
+EXPLAIN (ANALYZE, SUMMARY).
+
+    python benchmarks/bench_preparadas.py --hilos 8 --llamadas 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import BaseDatos, SENTENCIAS_PREPARADAS, CONFIG_CONEXION
+from generador_datos import generar
+from bench_base_datos import recrear_base_datos, percentil
+
+# (nombre, sentencia preparada, función(bd, habito_id))
+OPERACIONES = [
+    ("obtener_habito_por_id", "habito_por_id", lambda bd, h: bd.obtener_habito_por_id(h)),
+    ("obtener_minutos_hoy", "minutos_hoy", lambda bd, h: bd.obtener_minutos_hoy(h)),
+    ("calcular_racha_habito", "racha_habito", lambda bd, h: bd.calcular_racha_habito(h)),
+    ("registrar_sesion", "registrar_sesion", lambda bd, h: bd.registrar_sesion(h, 300)),
+]
+
+
+def cargar(bd, habitos, hilos, llamadas, semilla):
+    """Reparte `llamadas` por hilo entre las operaciones. Devuelve los
+    tiempos en ms de cada operación y las llamadas por segundo."""
+    tiempos = {nombre: [] for nombre, _, _ in OPERACIONES}
+    candado = threading.Lock()
+
+    def trabajador(indice):
+        rng = random.Random(semilla + indice)
+        propios = {nombre: [] for nombre, _, _ in OPERACIONES}
+        for _ in range(llamadas):
+            nombre, _, operacion = rng.choice(OPERACIONES)
+            t0 = time.perf_counter()
+            operacion(bd, rng.choice(habitos))
+            propios[nombre].append((time.perf_counter() - t0) * 1000)
+        with candado:
+            for nombre, valores in propios.items():
+                tiempos[nombre].extend(valores)
+
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    for hilo in trabajadores:
+        hilo.start()
+    for hilo in trabajadores:
+        hilo.join()
+    return tiempos, hilos * llamadas / (time.perf_counter() - inicio)
+
+
+def tiempo_planificacion(bd, sentencia, habitos, muestras=20):
+    """Media del 'Planning Time' de la sentencia sin preparar: lo que se
+    ahorra cada llamada preparada (una vez elegido el plan genérico)."""
+    texto = SENTENCIAS_PREPARADAS[sentencia]
+    valores = []
+    for habito_id in habitos[:muestras]:
+        parametros = {
+            "registrar_sesion": (habito_id, None, None, 1, ""),
+        }.get(sentencia, (habito_id,))
+        consulta = texto
+        for posicion in range(len(parametros), 0, -1):
+            consulta = consulta.replace(f"${posicion}", f"%(p{posicion})s")
+        with bd.transaccion() as cursor:
+            cursor.execute(f"EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) {consulta}",
+                           {f"p{i}": valor for i, valor in enumerate(parametros, 1)})
+            valores.append(cursor.fetchone()["QUERY PLAN"][0]["Planning Time"])
+            # EXPLAIN ANALYZE ejecuta de verdad: el INSERT no debe quedarse
+            cursor.connection.rollback()
+    return statistics.fmean(valores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamano", default="50x10x100", help="usuarios x hábitos x sesiones")
+    parser.add_argument("--hilos", type=int, default=8)
+    parser.add_argument("--llamadas", type=int, default=1000, help="llamadas por hilo y modo")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--host", default=CONFIG_CONEXION["host"])
+    parser.add_argument("--puerto", default=CONFIG_CONEXION["port"])
+    parser.add_argument("--usuario", default=CONFIG_CONEXION["user"])
+    parser.add_argument("--contrasena", default=CONFIG_CONEXION["password"])
+    parser.add_argument("--base-datos", default="habitos_bench", help="se borra y se recrea")
+    args = parser.parse_args()
+
+    config = {
+        "host": args.host,
+        "port": args.puerto,
+        "user": args.usuario,
+        "password": args.contrasena,
+        "database": args.base_datos,
+    }
+    opciones = {
+        "config_conexion": config,
+        "config_pool": {"maximo": args.hilos},
+        "config_cache": {"maximo": 0},
+        "config_hash": {"costo": 4, "procesos": 0},
+    }
+
+    recrear_base_datos(config)
+    bd = BaseDatos(**opciones)
+    usuarios, habitos, sesiones = (int(x) for x in args.tamano.split("x"))
+    ids = generar(bd, usuarios, habitos, sesiones, semilla=args.semilla)
+    with bd.transaccion() as cursor:
+        cursor.execute("ANALYZE")
+    planificacion = {s: tiempo_planificacion(bd, s, ids["habitos"]) for _, s, _ in OPERACIONES}
+    bd.cerrar_conexion()
+
+    resultados = {}
+    for modo, preparar in (("texto", False), ("preparadas", True)):
+        bd = BaseDatos(**opciones, preparar=preparar)
+        try:
+            # Calentamiento: conexiones abiertas y, en su modo, sentencias preparadas
+            cargar(bd, ids["habitos"], args.hilos, 20, args.semilla)
+            resultados[modo] = cargar(bd, ids["habitos"], args.hilos, args.llamadas, args.semilla)
+        finally:
+            bd.cerrar_conexion()
+        print(f"{modo:<11} {resultados[modo][1]:9.0f} llamadas/s con {args.hilos} hilos")
+
+    print(f"\n{'operación':<24} {'texto p50':>10} {'prep. p50':>10} {'texto p95':>10} "
+          f"{'prep. p95':>10} {'mejora':>7} {'planif.':>8}")
+    for nombre, sentencia, _ in OPERACIONES:
+        texto = resultados["texto"][0][nombre]
+        preparadas = resultados["preparadas"][0][nombre]
+        p50_texto, p50_preparadas = percentil(texto, 50), percentil(preparadas, 50)
+        print(f"{nombre:<24} {p50_texto:8.3f}ms {p50_preparadas:8.3f}ms {percentil(texto, 95):8.3f}ms "
+              f"{percentil(preparadas, 95):8.3f}ms {1 - p50_preparadas / p50_texto:+6.0%} "
+              f"{planificacion[sentencia]:6.3f}ms")
+
+    mejora = resultados["preparadas"][1] / resultados["texto"][1] - 1
+    print(f"\nRendimiento total: {mejora:+.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Benchmark de memoria de las filas: RealDictCursor frente a registros.
+
+Lee de una vez todas las sesiones de un usuario con muchas sesiones y
+compara tres formas de fila sobre los mismos datos: la tupla de psycopg2
+(el mínimo posible), el dict de RealDictCursor (lo que devolvía BaseDatos)
+y el registro Sesion de CursorRegistros (lo que devuelve ahora). Para cada
+una mide el tiempo de lectura, la memoria que queda retenida con las filas,
+el pico durante la lectura (tracemalloc) y los bloques que se asignan.
+
+    python benchmarks/bench_registros.py --tamano 1x10x20000 --repeticiones 5
+"""
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from database import BaseDatos, CursorRegistros, CONFIG_CONEXION
+from registros import Sesion
+from generador_datos import generar
+from bench_base_datos import recrear_base_datos
+
+CONSULTA = """
+    SELECT id, habito_id, fecha, hora_inicio, hora_fin, duracion_segundos, completada, notas
+    FROM sesiones
+    WHERE habito_id = ANY(%s)
+"""
+
+# (nombre, fábrica de cursor, clase de registro)
+MODOS = [
+    ("tuplas", psycopg2.extensions.cursor, None),
+    ("RealDictCursor", RealDictCursor, None),
+    ("registros Sesion", CursorRegistros, Sesion),
+]
+
+
+def leer(conexion, fabrica, clase, habitos):
+    with conexion.cursor(cursor_factory=fabrica) as cursor:
+        cursor.execute(CONSULTA, (habitos,))
+        if clase is not None:
+            cursor.como(clase)
+        filas = cursor.fetchall()
+    conexion.rollback()
+    return filas
+
+
+def medir_tiempo(conexion, fabrica, clase, habitos, repeticiones):
+    """Mediana en ms de leer todas las filas (sin tracemalloc, que ralentiza)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        gc.collect()
+        inicio = time.perf_counter()
+        filas = leer(conexion, fabrica, clase, habitos)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        del filas
+    return statistics.median(tiempos)
+
+
+def medir_memoria(conexion, fabrica, clase, habitos):
+    """Bytes retenidos por las filas, pico durante la lectura y bloques
+    asignados que siguen vivos al terminar."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        bloques = sys.getallocatedblocks()
+        filas = leer(conexion, fabrica, clase, habitos)
+        bloques = sys.getallocatedblocks() - bloques
+        actual, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "filas": len(filas),
+        "retenida": actual - base,
+        "pico": pico - base,
+        "bloques": bloques,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamano", default="1x10x20000", help="usuarios x hábitos x sesiones")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--host", default=CONFIG_CONEXION["host"])
+    parser.add_argument("--puerto", default=CONFIG_CONEXION["port"])
+    parser.add_argument("--usuario", default=CONFIG_CONEXION["user"])
+    parser.add_argument("--contrasena", default=CONFIG_CONEXION["password"])
+    parser.add_argument("--base-datos", default="habitos_bench", help="se borra y se recrea")
+    args = parser.parse_args()
+
+    config = {
+        "host": args.host,
+        "port": args.puerto,
+        "user": args.usuario,
+        "password": args.contrasena,
+        "database": args.base_datos,
+    }
+
+    recrear_base_datos(config)
+    bd = BaseDatos(config_conexion=config, config_cache={"maximo": 0},
+                   config_hash={"costo": 4, "procesos": 0})
+    usuarios, habitos, sesiones = (int(x) for x in args.tamano.split("x"))
+    ids = generar(bd, usuarios, habitos, sesiones, semilla=args.semilla)
+    with bd.transaccion() as cursor:
+        cursor.execute("ANALYZE")
+    bd.cerrar_conexion()
+
+    # Los hábitos del primer usuario: el historial completo de una cuenta grande
+    habitos_usuario = ids["habitos"][:habitos]
+    conexion = psycopg2.connect(**config)
+    resultados = {}
+    try:
+        for nombre, fabrica, clase in MODOS:
+            leer(conexion, fabrica, clase, habitos_usuario)  # calentamiento
+            resultados[nombre] = medir_memoria(conexion, fabrica, clase, habitos_usuario)
+            resultados[nombre]["ms"] = medir_tiempo(conexion, fabrica, clase, habitos_usuario,
+                                                    args.repeticiones)
+    finally:
+        conexion.close()
+
+    filas = resultados["tuplas"]["filas"]
+    print(f"{filas} sesiones por lectura\n")
+    print(f"{'modo':<18} {'tiempo':>9} {'retenida':>10} {'por fila':>9} {'pico':>10} {'bloques':>10}")
+    for nombre, _, _ in MODOS:
+        r = resultados[nombre]
+        print(f"{nombre:<18} {r['ms']:7.1f}ms {r['retenida'] / 2**20:8.1f}MB {r['retenida'] / filas:7.0f}B "
+              f"{r['pico'] / 2**20:8.1f}MB {r['bloques']:10d}")
+
+    antes, ahora = resultados["RealDictCursor"], resultados["registros Sesion"]
+    print(f"\nRegistros frente a RealDictCursor: memoria retenida {ahora['retenida'] / antes['retenida'] - 1:+.0%}, "
+          f"pico {ahora['pico'] / antes['pico'] - 1:+.0%}, bloques {ahora['bloques'] / antes['bloques'] - 1:+.0%}, "
+          f"tiempo {ahora['ms'] / antes['ms'] - 1:+.0%}")
+
+
+if __name__ == "__main__":
+    main()
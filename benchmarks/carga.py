@@ -0,0 +1,352 @@
+"""Prueba de carga de BaseDatos con usuarios virtuales concurrentes.
+
+Cada usuario virtual es un hilo que recorre el flujo real de la aplicación:
+se registra, inicia sesión, crea sus hábitos y después, hasta que acaba la
+prueba, alterna entre registrar sesiones (registrar_sesion), abrir el panel
+de inicio y abrir el detalle de un hábito (estadísticas e informe), con un
+tiempo de reflexión aleatorio entre acciones. Todos comparten una BaseDatos,
+como los hilos de trabajo de la aplicación, así que el pool de conexiones
+es parte de lo que se mide.
+
+Por operación informa de llamadas, errores, rendimiento, latencias p50, p95
+y p99, consultas SQL por llamada, espera por una conexión del pool y
+esperas de bloqueo en Postgres. Estas últimas las muestrea un hilo aparte
+en pg_stat_activity y se atribuyen a la operación que usa esa conexión.
+
+    python benchmarks/carga.py --usuarios 50 --duracion 60 --pensar 0.5
+    python benchmarks/carga.py --usuarios 200 --pool-maximo 20 --pensar 0 --sin-recrear
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+from database import BaseDatos, CursorInstrumentado, CONFIG_CONEXION, CONFIG_POOL
+from instrumentacion import accion, accion_actual, registro
+from bench_base_datos import recrear_base_datos, percentil, DIRECTORIO_RESULTADOS
+
+CONTRASENA = "contrasena-carga"
+
+# Acciones del bucle de cada usuario virtual y su peso relativo
+MEZCLA = {
+    "registrar_sesion": 4,
+    "obtener_resumen_inicio": 3,
+    "obtener_habito_por_id": 2,
+    "obtener_informe_usuario": 1,
+}
+
+# pid del servidor -> operación que usa ahora esa conexión del pool
+OPERACION_POR_PID = {}
+
+
+class CursorCarga(CursorInstrumentado):
+    """Cursor instrumentado que además anota qué operación está usando su
+    conexión, para atribuirle las esperas de bloqueo que vea el monitor."""
+
+    def __init__(self, conexion, *args, **kwargs):
+        super().__init__(conexion, *args, **kwargs)
+        OPERACION_POR_PID[conexion.get_backend_pid()] = accion_actual()
+
+
+class MonitorBloqueos(threading.Thread):
+    """Muestrea cada `intervalo` segundos las sesiones de la base de datos
+    que esperan un bloqueo. Cada muestra equivale a `intervalo` de espera."""
+
+    def __init__(self, config, intervalo):
+        super().__init__(daemon=True)
+        self.config = config
+        self.intervalo = intervalo
+        self.muestras = Counter()
+        self.parar = threading.Event()
+
+    def run(self):
+        conexion = psycopg2.connect(**self.config)
+        conexion.autocommit = True
+        try:
+            with conexion.cursor() as cursor:
+                while not self.parar.wait(self.intervalo):
+                    cursor.execute("""
+                        SELECT pid FROM pg_stat_activity
+                        WHERE datname = current_database() AND wait_event_type = 'Lock'
+                    """)
+                    for (pid,) in cursor.fetchall():
+                        self.muestras[OPERACION_POR_PID.get(pid) or "?"] += 1
+        finally:
+            conexion.close()
+
+    def esperas_ms(self):
+        return {nombre: muestras * self.intervalo * 1000 for nombre, muestras in self.muestras.items()}
+
+
+def medir_espera_pool(pool, esperas, candado):
+    """Envuelve pool.obtener para sumar, por operación, el tiempo esperando
+    una conexión libre."""
+    obtener = pool.obtener
+
+    def obtener_medido():
+        inicio = time.perf_counter()
+        try:
+            return obtener()
+        finally:
+            with candado:
+                esperas[accion_actual()] += (time.perf_counter() - inicio) * 1000
+
+    pool.obtener = obtener_medido
+
+
+def estadisticas_bd(config):
+    conexion = psycopg2.connect(**config)
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute("""
+                SELECT deadlocks, xact_commit, xact_rollback
+                FROM pg_stat_database WHERE datname = current_database()
+            """)
+            return dict(zip(("deadlocks", "commits", "rollbacks"), cursor.fetchone()))
+    finally:
+        conexion.close()
+
+
+class UsuarioVirtual:
+    def __init__(self, indice, bd, args, fin, prefijo):
+        self.bd = bd
+        self.args = args
+        self.fin = fin
+        self.rng = random.Random(args.semilla + indice)
+        self.nombre = f"{prefijo}_{indice:05d}"
+        self.usuario_id = None
+        self.habitos = []
+        self.tiempos = defaultdict(list)
+        self.errores = Counter()
+
+    def medir(self, nombre, operacion, correcto):
+        """Ejecuta la operación bajo su acción y anota latencia y si fue
+        bien. Los métodos de BaseDatos no lanzan: el error se deduce del
+        resultado con `correcto`."""
+        with accion(nombre):
+            inicio = time.perf_counter()
+            try:
+                resultado = operacion()
+                exito = correcto(resultado)
+            except Exception as e:
+                print(f"Error en {nombre}: {e}")
+                resultado, exito = None, False
+        self.tiempos[nombre].append((time.perf_counter() - inicio) * 1000)
+        if not exito:
+            self.errores[nombre] += 1
+        return resultado if exito else None
+
+    def pensar(self):
+        # Tiempo de reflexión exponencial: llegadas de un proceso de Poisson
+        if self.args.pensar > 0:
+            self.fin.wait(self.rng.expovariate(1 / self.args.pensar))
+
+    def ejecutar(self):
+        bd = self.bd
+        registro_usuario = self.medir(
+            "registrar_usuario",
+            lambda: bd.registrar_usuario(self.nombre, f"{self.nombre}@carga.local", CONTRASENA),
+            lambda r: r.get("exito"),
+        )
+        if not registro_usuario:
+            return
+        self.pensar()
+
+        sesion = self.medir(
+            "iniciar_sesion",
+            lambda: bd.iniciar_sesion(self.nombre, CONTRASENA),
+            lambda r: r.get("exito"),
+        )
+        if not sesion:
+            return
+        self.usuario_id = sesion["usuario"]["id"]
+
+        for numero in range(self.args.habitos):
+            self.pensar()
+            habito = self.medir(
+                "crear_habito",
+                lambda: bd.crear_habito(self.usuario_id, f"Hábito {numero}", "", 30, "Salud"),
+                lambda r: r is not None,
+            )
+            if habito:
+                self.habitos.append(habito["id"])
+        if not self.habitos:
+            return
+
+        acciones = list(MEZCLA)
+        pesos = list(MEZCLA.values())
+        while not self.fin.is_set():
+            self.pensar()
+            if self.fin.is_set():
+                break
+            nombre = self.rng.choices(acciones, pesos)[0]
+            habito_id = self.rng.choice(self.habitos)
+            if nombre == "registrar_sesion":
+                self.medir(nombre, lambda: bd.registrar_sesion(habito_id, self.rng.randint(60, 3600)),
+                           lambda r: r is not None)
+            elif nombre == "obtener_resumen_inicio":
+                # Vacío si falló la consulta: el usuario tiene hábitos
+                self.medir(nombre, lambda: bd.obtener_resumen_inicio(self.usuario_id),
+                           lambda r: r["total_habitos"] == len(self.habitos))
+            elif nombre == "obtener_habito_por_id":
+                self.medir(nombre, lambda: bd.obtener_habito_por_id(habito_id),
+                           lambda r: r is not None and r["id"] == habito_id)
+            else:
+                self.medir(nombre, lambda: bd.obtener_informe_usuario(self.usuario_id),
+                           lambda r: r is not None)
+
+
+def ejecutar_carga(bd, args, prefijo):
+    fin = threading.Event()
+    virtuales = [UsuarioVirtual(i, bd, args, fin, prefijo) for i in range(args.usuarios)]
+    hilos = [threading.Thread(target=virtual.ejecutar, daemon=True) for virtual in virtuales]
+    # Arranque escalonado a lo largo de la rampa
+    inicio = time.perf_counter()
+    for i, hilo in enumerate(hilos):
+        retraso = inicio + args.rampa * i / max(1, len(hilos)) - time.perf_counter()
+        if retraso > 0:
+            time.sleep(retraso)
+        hilo.start()
+
+    fin.wait(max(0, inicio + args.duracion - time.perf_counter()))
+    fin.set()
+    for hilo in hilos:
+        hilo.join()
+    return virtuales, time.perf_counter() - inicio
+
+
+def informe(virtuales, segundos, esperas_pool, esperas_bloqueo):
+    tiempos = defaultdict(list)
+    errores = Counter()
+    for virtual in virtuales:
+        for nombre, valores in virtual.tiempos.items():
+            tiempos[nombre].extend(valores)
+        errores.update(virtual.errores)
+
+    resultados = {}
+    for nombre, valores in tiempos.items():
+        resultados[nombre] = {
+            "llamadas": len(valores),
+            "errores": errores[nombre],
+            "tasa_error": errores[nombre] / len(valores),
+            "por_segundo": len(valores) / segundos,
+            "p50_ms": percentil(valores, 50),
+            "p95_ms": percentil(valores, 95),
+            "p99_ms": percentil(valores, 99),
+            "max_ms": max(valores),
+            "consultas_por_llamada": registro.contar(nombre) / len(valores),
+            "espera_pool_ms": esperas_pool.get(nombre, 0.0) / len(valores),
+            "espera_bloqueo_ms": esperas_bloqueo.get(nombre, 0.0),
+        }
+    return resultados
+
+
+def imprimir(resultados, segundos, bd_antes, bd_despues):
+    print(f"\n{'operación':<24} {'llamadas':>8} {'/s':>7} {'error':>6} {'p50':>8} {'p95':>8} "
+          f"{'p99':>8} {'máx':>8} {'consult.':>8} {'pool':>7} {'bloqueo':>8}")
+    for nombre, r in sorted(resultados.items(), key=lambda par: -par[1]["llamadas"]):
+        print(f"{nombre:<24} {r['llamadas']:8d} {r['por_segundo']:7.1f} {r['tasa_error']:6.1%} "
+              f"{r['p50_ms']:6.1f}ms {r['p95_ms']:6.1f}ms {r['p99_ms']:6.1f}ms {r['max_ms']:6.0f}ms "
+              f"{r['consultas_por_llamada']:8.1f} {r['espera_pool_ms']:5.1f}ms {r['espera_bloqueo_ms']:6.0f}ms")
+
+    llamadas = sum(r["llamadas"] for r in resultados.values())
+    errores = sum(r["errores"] for r in resultados.values())
+    print(f"\nTotal: {llamadas} operaciones en {segundos:.1f}s ({llamadas / segundos:.1f}/s), "
+          f"{errores} errores ({errores / max(1, llamadas):.2%})")
+    print(f"Postgres: {bd_despues['commits'] - bd_antes['commits']} commits, "
+          f"{bd_despues['rollbacks'] - bd_antes['rollbacks']} rollbacks, "
+          f"{bd_despues['deadlocks'] - bd_antes['deadlocks']} interbloqueos")
+    print("pool: espera media por llamada hasta tener conexión; "
+          "bloqueo: espera total estimada en bloqueos de Postgres")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=20, help="usuarios virtuales concurrentes")
+    parser.add_argument("--duracion", type=float, default=30, help="segundos de prueba")
+    parser.add_argument("--rampa", type=float, default=5, help="segundos para arrancarlos todos")
+    parser.add_argument("--pensar", type=float, default=1.0,
+                        help="segundos medios de reflexión entre acciones (0: sin pausa)")
+    parser.add_argument("--habitos", type=int, default=3, help="hábitos que crea cada usuario")
+    parser.add_argument("--pool-maximo", type=int, default=CONFIG_POOL["maximo"])
+    parser.add_argument("--costo-bcrypt", type=int, default=4,
+                        help="coste de bcrypt (el benchmark de contraseñas es bench_contrasenas.py)")
+    parser.add_argument("--procesos-hash", type=int, default=2)
+    parser.add_argument("--cache", action="store_true",
+                        help="usa la caché de BaseDatos (compartida por todos los usuarios virtuales)")
+    parser.add_argument("--muestreo", type=float, default=0.05, help="segundos entre muestras de bloqueos")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--host", default=CONFIG_CONEXION["host"])
+    parser.add_argument("--puerto", default=CONFIG_CONEXION["port"])
+    parser.add_argument("--usuario", default=CONFIG_CONEXION["user"])
+    parser.add_argument("--contrasena", default=CONFIG_CONEXION["password"])
+    parser.add_argument("--base-datos", default="habitos_carga")
+    parser.add_argument("--sin-recrear", action="store_true",
+                        help="no borra la base de datos; los usuarios llevan un prefijo nuevo")
+    parser.add_argument("--salida", default=DIRECTORIO_RESULTADOS)
+    args = parser.parse_args()
+    # Las consultas lentas se ven en el informe; no imprimirlas una a una
+    registro.umbral_lento_ms = float("inf")
+
+    config = {
+        "host": args.host,
+        "port": args.puerto,
+        "user": args.usuario,
+        "password": args.contrasena,
+        "database": args.base_datos,
+    }
+    if not args.sin_recrear:
+        recrear_base_datos(config)
+
+    bd = BaseDatos(
+        config_conexion=config,
+        config_pool={"maximo": args.pool_maximo},
+        config_cache=None if args.cache else {"maximo": 0},
+        config_hash={"costo": args.costo_bcrypt, "procesos": args.procesos_hash, "ejecutor": "procesos"},
+        fabrica_cursor=CursorCarga,
+    )
+    esperas_pool = Counter()
+    medir_espera_pool(bd.pool, esperas_pool, threading.Lock())
+    monitor = MonitorBloqueos(config, args.muestreo)
+
+    print(f"{args.usuarios} usuarios virtuales durante {args.duracion:.0f}s "
+          f"(reflexión media {args.pensar}s, pool de {args.pool_maximo} conexiones)")
+    bd_antes = estadisticas_bd(config)
+    monitor.start()
+    try:
+        virtuales, segundos = ejecutar_carga(bd, args, f"carga_{datetime.now():%H%M%S}")
+    finally:
+        monitor.parar.set()
+        monitor.join()
+        bd.cerrar_conexion()
+    bd_despues = estadisticas_bd(config)
+
+    resultados = informe(virtuales, segundos, esperas_pool, monitor.esperas_ms())
+    imprimir(resultados, segundos, bd_antes, bd_despues)
+
+    ejecucion = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "parametros": {clave: valor for clave, valor in vars(args).items()
+                       if clave not in ("contrasena", "salida")},
+        "segundos": segundos,
+        "postgres": {clave: bd_despues[clave] - bd_antes[clave] for clave in bd_antes},
+        "operaciones": resultados,
+    }
+    os.makedirs(args.salida, exist_ok=True)
+    ruta = os.path.join(args.salida, f"carga_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        json.dump(ejecucion, archivo, indent=2)
+    print(f"\nResultados guardados en {ruta}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Generador determinista de datos sintéticos para los benchmarks.
+
+Crea N usuarios × M hábitos × K sesiones por hábito. Con la misma semilla
+(y el mismo día) produce exactamente los mismos datos, así los resultados
+de dos ejecuciones son comparables.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+CONTRASENA_PRUEBA = "contrasena-bench"
+CATEGORIAS = ["Salud", "Aprendizaje", "Productividad", "Bienestar"]
+
+
+def nombre_usuario(indice):
+    return f"bench_{indice:06d}"
+
+
+def _sesiones_habito(rng, habito_id, sesiones, hoy):
+    """Sesiones repartidas hacia atrás desde hoy: varias por día y huecos
+    aleatorios, para que haya rachas de distintas longitudes."""
+    dia = hoy
+    restantes = sesiones
+    while restantes > 0:
+        for _ in range(min(restantes, rng.randint(1, 3))):
+            hora = datetime.combine(dia, datetime.min.time()) + timedelta(
+                hours=rng.randint(6, 22), minutes=rng.randint(0, 59), seconds=rng.randint(0, 59)
+            )
+            duracion = rng.randint(60, 5400)
+            yield (habito_id, dia, hora, hora + timedelta(seconds=duracion), duracion, "")
+            restantes -= 1
+        # Uno de cada cinco días se salta, cortando la racha
+        dia -= timedelta(days=2 if rng.random() < 0.2 else 1)
+
+
+def generar(bd, usuarios, habitos_por_usuario, sesiones_por_habito, semilla=42, hoy=None):
+    """Llena la base de datos de `bd` y devuelve los ids creados."""
+    rng = random.Random(semilla)
+    hoy = hoy or date.today()
+    # Todos los usuarios comparten contraseña: un solo hash bcrypt
+    contrasena = bd.encriptar_contrasena(CONTRASENA_PRUEBA)
+
+    with bd.transaccion() as cursor:
+        filas = execute_values(cursor, """
+            INSERT INTO usuarios (nombre_usuario, email, contrasena) VALUES %s
+            RETURNING id
+        """, [(nombre_usuario(i), f"{nombre_usuario(i)}@bench.local", contrasena)
+              for i in range(usuarios)], fetch=True)
+        usuario_ids = [fila['id'] for fila in filas]
+
+        filas = execute_values(cursor, """
+            INSERT INTO habitos (usuario_id, nombre, descripcion, objetivo_diario_minutos, categoria)
+            VALUES %s
+            RETURNING id
+        """, [(usuario_id, f"Hábito {j}", "", rng.choice([15, 30, 45, 60]), rng.choice(CATEGORIAS))
+              for usuario_id in usuario_ids for j in range(habitos_por_usuario)], fetch=True)
+        habito_ids = [fila['id'] for fila in filas]
+
+        execute_values(cursor, "INSERT INTO recordatorios (habito_id) VALUES %s",
+                       [(habito_id,) for habito_id in habito_ids])
+
+    def todas_las_sesiones():
+        for habito_id in habito_ids:
+            yield from _sesiones_habito(rng, habito_id, sesiones_por_habito, hoy)
+
+    reporte = bd.importar_sesiones(todas_las_sesiones())
+    return {
+        "usuarios": usuario_ids,
+        "habitos": habito_ids,
+        "sesiones": reporte["insertadas"],
+    }
@@ -0,0 +1,98 @@
+import copy
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+class CacheLRU:
+    """Caché en memoria con expulsión LRU y caducidad por TTL.
+
+    Cada entrada lleva etiquetas (por ejemplo ('habito', 7) o ('usuario', 3));
+    invalidar una etiqueta borra todas las entradas que la llevan. Los valores
+    se copian al entrar y al salir, así nadie modifica lo que está guardado.
+    """
+
+    def __init__(self, maximo=512, ttl=60):
+        self.maximo = maximo
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()  # clave -> (valor, caduca, etiquetas)
+        self._por_etiqueta = defaultdict(set)
+        # Cambia con cada invalidación: una lectura que empezó antes no
+        # puede guardar un resultado que ya quedó viejo
+        self.generacion = 0
+        self._candado = threading.Lock()
+
+    def obtener(self, clave):
+        """Devuelve (encontrado, valor)."""
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[1] < time.monotonic():
+                # Las caducadas se quedan hasta que las expulse el LRU, por
+                # si hay que servirlas sin conexión (obtener_caducada)
+                self.fallos += 1
+                return False, None
+
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            valor = entrada[0]
+        return True, copy.deepcopy(valor)
+
+    def obtener_caducada(self, clave):
+        """Como obtener, pero acepta entradas vencidas. Solo para cuando la
+        base de datos no responde: mejor un dato viejo que ninguno."""
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return False, None
+            valor = entrada[0]
+        return True, copy.deepcopy(valor)
+
+    def guardar(self, clave, valor, etiquetas=(), generacion=None):
+        valor = copy.deepcopy(valor)
+        with self._candado:
+            if generacion is not None and generacion != self.generacion:
+                return
+
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (valor, time.monotonic() + self.ttl, tuple(etiquetas))
+            for etiqueta in etiquetas:
+                self._por_etiqueta[etiqueta].add(clave)
+
+            while len(self._entradas) > self.maximo:
+                self._quitar(next(iter(self._entradas)))
+
+    def invalidar(self, *etiquetas):
+        with self._candado:
+            self.generacion += 1
+            for etiqueta in etiquetas:
+                for clave in list(self._por_etiqueta.get(etiqueta, ())):
+                    self._quitar(clave)
+
+    def limpiar(self):
+        with self._candado:
+            self.generacion += 1
+            self._entradas.clear()
+            self._por_etiqueta.clear()
+
+    def _quitar(self, clave):
+        # Se llama con el candado tomado
+        _, _, etiquetas = self._entradas.pop(clave)
+        for etiqueta in etiquetas:
+            claves = self._por_etiqueta.get(etiqueta)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self._por_etiqueta[etiqueta]
+
+    def estadisticas(self):
+        with self._candado:
+            consultas = self.aciertos + self.fallos
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+                "entradas": len(self._entradas),
+            }
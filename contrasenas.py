@@ -0,0 +1,96 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+# Factor de coste de bcrypt (2^costo rondas). Subirlo hace cada hash el
+# doble de lento; los hashes guardados con otro coste se rehacen al entrar.
+COSTO_BCRYPT = 12
+
+
+def _encriptar(contrasena, costo):
+    sal = bcrypt.gensalt(rounds=costo)
+    return bcrypt.hashpw(contrasena.encode("utf-8"), sal).decode("utf-8")
+
+
+def _verificar(contrasena, contrasena_encriptada):
+    try:
+        return bcrypt.checkpw(contrasena.encode("utf-8"), contrasena_encriptada.encode("utf-8"))
+    except Exception:
+        return False
+
+
+def costo_de(contrasena_encriptada):
+    """Coste con el que se generó un hash bcrypt ($2b$12$...)."""
+    try:
+        return int(contrasena_encriptada.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class HasheadorContrasenas:
+    """Hash y verificación de contraseñas en un pool aparte, para que bcrypt
+    no ocupe el hilo que lo llama ni serialice los inicios de sesión.
+
+    ejecutor="procesos" (servidor API, benchmarks) reparte el trabajo entre
+    `procesos` procesos arrancados con spawn: el proceso que los pide ya
+    tiene hilos en marcha y un fork los copiaría a medias. Los trabajadores
+    solo ejecutan _encriptar/_verificar, que no necesitan más que bcrypt.
+    ejecutor="hilos" (la aplicación de escritorio) usa hilos: bcrypt suelta
+    el GIL mientras calcula y no hay que arrancar intérpretes nuevos, que con
+    spawn volverían a importar main.py y Kivy.
+
+    Con procesos=0 todo se ejecuta en el propio hilo (útil para comparar).
+    """
+
+    def __init__(self, costo=COSTO_BCRYPT, procesos=2, ejecutor="procesos"):
+        self.costo = costo
+        self.procesos = procesos
+        self.ejecutor = ejecutor
+        self._ejecutor = None
+        # Varios hilos del despachador pueden pedir el primer hash a la vez
+        self._candado = threading.Lock()
+
+    def _enviar(self, funcion, *args):
+        if not self.procesos:
+            futuro = Future()
+            futuro.set_result(funcion(*args))
+            return futuro
+
+        # El pool se crea la primera vez que hace falta: arrancar procesos
+        # tiene un coste que no queremos pagar al abrir la aplicación
+        ejecutor = self._ejecutor
+        if ejecutor is None:
+            with self._candado:
+                if self._ejecutor is None:
+                    self._ejecutor = self._crear_ejecutor()
+                ejecutor = self._ejecutor
+        return ejecutor.submit(funcion, *args)
+
+    def _crear_ejecutor(self):
+        if self.ejecutor == "hilos":
+            return ThreadPoolExecutor(max_workers=self.procesos, thread_name_prefix="hash")
+        return ProcessPoolExecutor(max_workers=self.procesos,
+                                   mp_context=multiprocessing.get_context("spawn"))
+
+    def encriptar_async(self, contrasena):
+        return self._enviar(_encriptar, contrasena, self.costo)
+
+    def verificar_async(self, contrasena, contrasena_encriptada):
+        return self._enviar(_verificar, contrasena, contrasena_encriptada)
+
+    def encriptar(self, contrasena):
+        return self.encriptar_async(contrasena).result()
+
+    def verificar(self, contrasena, contrasena_encriptada):
+        return self.verificar_async(contrasena, contrasena_encriptada).result()
+
+    def necesita_rehash(self, contrasena_encriptada):
+        return costo_de(contrasena_encriptada) != self.costo
+
+    def cerrar(self):
+        with self._candado:
+            ejecutor, self._ejecutor = self._ejecutor, None
+        if ejecutor is not None:
+            ejecutor.shutdown(wait=False, cancel_futures=True)
@@ -1,143 +1,324 @@
 import psycopg2
-import bcrypt
-from psycopg2.extras import RealDictCursor
-from datetime import datetime, timedelta
-
-class BaseDatos:
-    def __init__(self):
-        self.conn = psycopg2.connect(
-            host="localhost",
-            database="habitos_bd",
-            user="postgres",
-            password="master.1",
-            port="5432",
+from psycopg2.extras import execute_values
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+import csv
+import io
+import threading
+import time
+import weakref
+
+from pool_conexiones import PoolConexiones, PoolAgotado
+from migraciones import aplicar_migraciones
+from instrumentacion import ConsultasMedidas, CONFIG_INSTRUMENTACION
+from registros import Habito, HabitoResumen, Sesion, Recordatorio, EstadisticasUsuario
+from almacenamiento import (
+    Almacenamiento, totalizar_resumen, sql_exportacion, COLUMNAS_IMPORTACION,
+    MAPEO_CATEGORIAS, CATEGORIA_POR_DEFECTO,
+)
+
+# Parámetros de conexión y del pool; se pueden sobrescribir al crear BaseDatos
+CONFIG_CONEXION = {
+    "host": "localhost",
+    "database": "habitos_bd",
+    "user": "postgres",
+    "password": "master.1",
+    "port": "5432",
+    "connect_timeout": 5,           # no colgar la aplicación si el servidor no responde
+}
+
+# Suma filas (habito_id, fecha, total_segundos, total_sesiones) de `origen`
+# al acumulado diario. Se ejecuta en la misma transacción que el INSERT.
+SQL_ACUMULAR_DIARIO = """
+    INSERT INTO sesiones_diarias (habito_id, fecha, total_segundos, total_sesiones)
+    SELECT habito_id, fecha, SUM(duracion_segundos), COUNT(*)
+    FROM {origen}
+    GROUP BY habito_id, fecha
+    ON CONFLICT (habito_id, fecha) DO UPDATE SET
+        total_segundos = sesiones_diarias.total_segundos + EXCLUDED.total_segundos,
+        total_sesiones = sesiones_diarias.total_sesiones + EXCLUDED.total_sesiones
+"""
+
+CONFIG_POOL = {
+    "minimo": 1,                    # conexiones abiertas desde el inicio
+    "maximo": 10,                   # tope de conexiones simultáneas
+    "tiempo_inactivo": 300,         # segundos antes de cerrar una conexión ociosa
+    "intervalo_verificacion": 30,   # segundos ociosa antes de comprobarla con SELECT 1
+    "espera_maxima": 10,            # segundos esperando una conexión libre
+}
+
+# Particiones mensuales de `sesiones` (migración 6)
+CONFIG_PARTICIONES = {
+    "meses_futuros": 3,             # particiones creadas por adelantado al conectar
+    "meses_retencion": 24,          # archivar_particiones separa las más antiguas
+}
+
+
+def sql_rachas(origen, nombre="rachas"):
+    """CTEs de rachas por "gaps and islands" sobre `origen`, que debe dar
+    filas (clave, fecha) sin fechas repetidas. Dos días consecutivos tienen
+    el mismo valor fecha - ROW_NUMBER(), así que cada isla es una racha.
+    `nombre` queda con (clave, racha_maxima, racha_actual, inicio_racha)."""
+    return f"""
+        {nombre}_islas AS (
+            SELECT clave, fecha,
+                fecha - (ROW_NUMBER() OVER (PARTITION BY clave ORDER BY fecha))::int AS isla
+            FROM {origen}
+        ),
+        {nombre}_tramos AS (
+            SELECT clave, MIN(fecha) AS inicio, MAX(fecha) AS fin, COUNT(*) AS dias
+            FROM {nombre}_islas
+            GROUP BY clave, isla
+        ),
+        {nombre} AS (
+            SELECT clave,
+                MAX(dias) AS racha_maxima,
+                COALESCE(MAX(dias) FILTER (WHERE fin = CURRENT_DATE), 0) AS racha_actual,
+                MAX(inicio) FILTER (WHERE fin = CURRENT_DATE) AS inicio_racha
+            FROM {nombre}_tramos
+            GROUP BY clave
+        )"""
+
+
+
+# Sentencias calientes (varias por pantalla): se preparan una vez por
+# conexión con PREPARE y después se ejecutan por nombre, sin que Postgres
+# vuelva a analizar y planificar el texto en cada llamada
+SENTENCIAS_PREPARADAS = {
+    "habito_por_id": f"""
+        WITH dias AS (
+            SELECT habito_id AS clave, fecha
+            FROM sesiones_diarias
+            WHERE habito_id = $1
+        ),
+        {sql_rachas("dias")}
+        SELECT h.*, 
+            COALESCE(SUM(d.total_sesiones), 0) as total_sesiones,
+            COALESCE(SUM(d.total_segundos), 0) as total_segundos,
+            COALESCE(SUM(d.total_segundos) FILTER (WHERE d.fecha = CURRENT_DATE), 0) / 60 as minutos_hoy,
+            COALESCE(SUM(d.total_segundos) / NULLIF(SUM(d.total_sesiones), 0) / 60, 0) as promedio_minutos,
+            COALESCE(r.racha_actual, 0) as racha_dias,
+            COALESCE(r.racha_maxima, 0) as racha_maxima,
+            r.inicio_racha
+        FROM habitos h
+        LEFT JOIN sesiones_diarias d ON h.id = d.habito_id
+        LEFT JOIN rachas r ON r.clave = h.id
+        WHERE h.id = $1
+        GROUP BY h.id, r.racha_actual, r.racha_maxima, r.inicio_racha
+    """,
+    # La sesión y su acumulado diario se guardan en la misma sentencia
+    "registrar_sesion": f"""
+        WITH nueva AS (
+            INSERT INTO sesiones (habito_id, fecha, hora_inicio, hora_fin, duracion_segundos, notas)
+            VALUES ($1, CURRENT_DATE, $2, $3, $4, $5)
+            RETURNING id, habito_id, fecha, duracion_segundos
+        ),
+        acumulado AS ({SQL_ACUMULAR_DIARIO.format(origen="nueva")})
+        SELECT n.id, h.usuario_id
+        FROM nueva n
+        JOIN habitos h ON h.id = n.habito_id
+    """,
+    "minutos_hoy": """
+        SELECT total_segundos
+        FROM sesiones_diarias
+        WHERE habito_id = $1 AND fecha = CURRENT_DATE
+    """,
+    "racha_habito": f"""
+        WITH dias AS (
+            SELECT habito_id AS clave, fecha
+            FROM sesiones_diarias
+            WHERE habito_id = $1
+        ),
+        {sql_rachas("dias")}
+        SELECT racha_actual FROM rachas
+    """,
+}
+
+
+class CursorRegistros(psycopg2.extensions.cursor):
+    """Cursor que devuelve las filas como dict o, si tras el execute se
+    pide con como(clase), como registros compactos de esa clase (registros.py)
+    construidos directamente desde la tupla que da psycopg2."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._construir = None
+
+    def execute(self, sentencia, parametros=None):
+        self._construir = None
+        return super().execute(sentencia, parametros)
+
+    def como(self, clase):
+        columnas = tuple(columna.name for columna in self.description)
+        self._construir = clase.constructor(columnas)
+        return self
+
+    def _convertir(self, filas):
+        if self._construir is not None:
+            return list(map(self._construir, filas))
+        columnas = [columna.name for columna in self.description]
+        return [dict(zip(columnas, fila)) for fila in filas]
+
+    def fetchone(self):
+        fila = super().fetchone()
+        if fila is None:
+            return None
+        return self._convertir((fila,))[0]
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._convertir(super().fetchmany())
+        return self._convertir(super().fetchmany(size))
+
+    def fetchall(self):
+        return self._convertir(super().fetchall())
+
+    def __iter__(self):
+        while True:
+            filas = self.fetchmany(self.itersize)
+            if not filas:
+                return
+            yield from filas
+
+
+class CursorInstrumentado(ConsultasMedidas, CursorRegistros):
+    """CursorRegistros que anota cada sentencia en instrumentacion.registro."""
+
+    def copy_expert(self, sql, archivo, size=8192):
+        return self._medir(sql, lambda: super(CursorInstrumentado, self).copy_expert(sql, archivo, size))
+
+
+class BaseDatos(Almacenamiento):
+    """Almacenamiento en un servidor PostgreSQL."""
+
+    errores_conexion = (psycopg2.OperationalError, PoolAgotado)
+    errores_datos = (psycopg2.DataError, psycopg2.IntegrityError)
+
+    def __init__(self, config_conexion=None, config_pool=None, config_hash=None, config_cache=None,
+                 fabrica_cursor=None, preparar=True, config_particiones=None):
+        super().__init__(config_hash, config_cache)
+        self.config_particiones = {**CONFIG_PARTICIONES, **(config_particiones or {})}
+        if fabrica_cursor is None:
+            fabrica_cursor = CursorInstrumentado if CONFIG_INSTRUMENTACION["activa"] else CursorRegistros
+        self.fabrica_cursor = fabrica_cursor
+        # Sentencias ya preparadas en cada conexión. Una conexión nueva (p. ej.
+        # tras una reconexión del pool) no está en el diccionario y vuelve a
+        # prepararlas al usarlas; las que se cierran desaparecen solas.
+        self.preparar = preparar
+        self._preparadas = weakref.WeakKeyDictionary()
+        self._candado_preparadas = threading.Lock()
+        self.pool = PoolConexiones(
+            **{**CONFIG_POOL, **(config_pool or {})},
+            **{**CONFIG_CONEXION, **(config_conexion or {})},
         )
-        self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
-        print("Conectado a la base de datos")
-        self.crear_tablas()
+        # Sin servidor la aplicación sigue funcionando: las escrituras van al
+        # diario local y el esquema se migra en la primera conexión que funcione
+        self.esquema_listo = False
+        self.migrar()
+        if self.esquema_listo:
+            print("Conectado a la base de datos")
 
-    def crear_tablas(self):
+    @contextmanager
+    def transaccion(self):
+        """Cursor nuevo sobre una conexión del pool. Confirma al salir y
+        deshace si hay un error, así un fallo no contamina otras operaciones."""
+        if not self.esquema_listo:
+            self.migrar()
+        with self.pool.conexion() as conexion:
+            cursor = conexion.cursor(cursor_factory=self.fabrica_cursor)
+            try:
+                yield cursor
+                conexion.commit()
+            except Exception:
+                conexion.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def migrar(self):
         try:
-            # Tabla de usuarios
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS usuarios (
-                    id SERIAL PRIMARY KEY,
-                    nombre_usuario VARCHAR(50) UNIQUE NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    contrasena VARCHAR(255) NOT NULL,
-                    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Tabla de hábitos
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS habitos (
-                    id SERIAL PRIMARY KEY,
-                    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
-                    nombre VARCHAR(100) NOT NULL,
-                    descripcion TEXT,
-                    objetivo_diario_minutos INTEGER DEFAULT 30,
-                    categoria VARCHAR(50) DEFAULT 'Salud',
-                    icono VARCHAR(50) DEFAULT 'run',
-                    color VARCHAR(20) DEFAULT '#3b82f6',
-                    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Tabla de sesiones
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sesiones (
-                    id SERIAL PRIMARY KEY,
-                    habito_id INTEGER NOT NULL REFERENCES habitos(id) ON DELETE CASCADE,
-                    fecha DATE NOT NULL DEFAULT CURRENT_DATE,
-                    hora_inicio TIMESTAMP,
-                    hora_fin TIMESTAMP,
-                    duracion_segundos INTEGER NOT NULL,
-                    completada BOOLEAN DEFAULT TRUE,
-                    notas TEXT,
-                    UNIQUE(habito_id, fecha, hora_inicio)
-                )
-            """)
-            
-            # Tabla de recordatorios
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS recordatorios (
-                    id SERIAL PRIMARY KEY,
-                    habito_id INTEGER NOT NULL REFERENCES habitos(id) ON DELETE CASCADE,
-                    activo BOOLEAN DEFAULT FALSE,
-                    hora_inicio TIME,
-                    hora_fin TIME
-                )
-            """)
-            
-            # Índices para mejor rendimiento
-            self.cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_usuarios_email ON usuarios(email)
-            """)
-            self.cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_habitos_usuario ON habitos(usuario_id)
-            """)
-            
-            self.conn.commit()
-            print("Tablas creadas exitosamente")
-            
+            with self.pool.conexion() as conexion:
+                aplicar_migraciones(conexion)
+            self.esquema_listo = True
         except Exception as e:
-            self.conn.rollback()
-            print(f"Error creando tablas: {e}")
+            print(f"Error aplicando migraciones: {e}")
+            return
 
-    # =================== MÉTODOS DE USUARIOS ===================
-    def encriptar_contrasena(self, contrasena):
-        sal = bcrypt.gensalt()
-        encriptada = bcrypt.hashpw(contrasena.encode("utf-8"), sal)
-        return encriptada.decode("utf-8")
+        # Con el esquema al día, que no falten las particiones de los
+        # próximos meses (si faltaran, las sesiones irían a sesiones_default)
+        self.crear_particiones()
 
-    def verificar_contrasena(self, contrasena, contrasena_encriptada):
-        try:
-            return bcrypt.checkpw(contrasena.encode("utf-8"), contrasena_encriptada.encode("utf-8"))
-        except Exception:
-            return False
+    def ejecutar_preparada(self, cursor, nombre, parametros):
+        """Ejecuta SENTENCIAS_PREPARADAS[nombre] preparándola antes si esta
+        conexión aún no la tiene. Debe ser la primera sentencia de la
+        transacción: si el servidor olvidó la preparada, se deshace y se repite."""
+        if not self.preparar:
+            sentencia = SENTENCIAS_PREPARADAS[nombre]
+            for posicion in range(len(parametros), 0, -1):
+                sentencia = sentencia.replace(f"${posicion}", f"%(p{posicion})s")
+            cursor.execute(sentencia, {f"p{i}": valor for i, valor in enumerate(parametros, 1)})
+            return
 
-    def registrar_usuario(self, nombre_usuario, email, contrasena):
-        try:
-            self.cursor.execute(
-                "SELECT id FROM usuarios WHERE nombre_usuario=%s OR email=%s",
-                (nombre_usuario, email),
-            )
-            if self.cursor.fetchone():
-                return {"exito": False, "mensaje": "Usuario o email ya existen"}
+        conexion = cursor.connection
+        with self._candado_preparadas:
+            preparadas = self._preparadas.setdefault(conexion, set())
+        ejecutar = f"EXECUTE {nombre} ({', '.join(['%s'] * len(parametros))})"
 
-            contrasena_encriptada = self.encriptar_contrasena(contrasena)
-            self.cursor.execute("""
-                INSERT INTO usuarios (nombre_usuario, email, contrasena)
-                VALUES (%s, %s, %s)
-                RETURNING id, nombre_usuario, email, fecha_creacion
-            """, (nombre_usuario, email, contrasena_encriptada))
-            usuario = self.cursor.fetchone()
-            self.conn.commit()
-            print(f"Usuario registrado: {nombre_usuario}")
-            return {"exito": True, "usuario": usuario}
-        except Exception as e:
-            self.conn.rollback()
-            return {"exito": False, "mensaje": str(e)}
+        for intento in range(2):
+            if nombre not in preparadas:
+                # PREPARE no es transaccional: sobrevive al rollback de esta transacción
+                cursor.execute(f"PREPARE {nombre} AS {SENTENCIAS_PREPARADAS[nombre]}")
+                preparadas.add(nombre)
+            try:
+                cursor.execute(ejecutar, parametros)
+                return
+            except psycopg2.errors.InvalidSqlStatementName:
+                # El servidor la olvidó (DISCARD ALL, DEALLOCATE): se vuelven
+                # a preparar todas en esta conexión
+                conexion.rollback()
+                preparadas.clear()
+                if intento:
+                    raise
 
-    def iniciar_sesion(self, usuario_o_email, contrasena):
-        try:
-            self.cursor.execute("""
+    # =================== MÉTODOS DE USUARIOS ===================
+    def _cambiar_hash(self, usuario_id, nueva, anterior):
+        with self.transaccion() as cursor:
+            cursor.execute("""
+                UPDATE usuarios SET contrasena = %s
+                WHERE id = %s AND contrasena = %s
+            """, (nueva, usuario_id, anterior))
+
+    def _buscar_usuario(self, usuario_o_email):
+        with self.transaccion() as cursor:
+            cursor.execute("""
                 SELECT id, nombre_usuario, email, contrasena
                 FROM usuarios
                 WHERE nombre_usuario=%s OR email=%s
             """, (usuario_o_email, usuario_o_email))
-            usuario = self.cursor.fetchone()
-            if not usuario:
-                return {"exito": False, "mensaje": "Usuario no encontrado"}
-
-            if self.verificar_contrasena(contrasena, usuario["contrasena"]):
-                return {"exito": True, "usuario": {
-                    "id": usuario["id"],
-                    "nombre_usuario": usuario["nombre_usuario"],
-                    "email": usuario["email"],
-                }}
-            return {"exito": False, "mensaje": "Contraseña incorrecta"}
+            return cursor.fetchone()
+
+    def registrar_usuario(self, nombre_usuario, email, contrasena):
+        try:
+            with self.transaccion() as cursor:
+                cursor.execute(
+                    "SELECT id FROM usuarios WHERE nombre_usuario=%s OR email=%s",
+                    (nombre_usuario, email),
+                )
+                if cursor.fetchone():
+                    return {"exito": False, "mensaje": "Usuario o email ya existen"}
+
+            # bcrypt es lento: no retener una conexión del pool mientras tanto
+            contrasena_encriptada = self.encriptar_contrasena(contrasena)
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    INSERT INTO usuarios (nombre_usuario, email, contrasena)
+                    VALUES (%s, %s, %s)
+                    RETURNING id, nombre_usuario, email, fecha_creacion
+                """, (nombre_usuario, email, contrasena_encriptada))
+                usuario = cursor.fetchone()
+                print(f"Usuario registrado: {nombre_usuario}")
+                return {"exito": True, "usuario": usuario}
         except Exception as e:
             return {"exito": False, "mensaje": str(e)}
 
@@ -145,97 +326,107 @@ class BaseDatos:
     def crear_habito(self, usuario_id, nombre, descripcion="", objetivo_minutos=30, categoria="Salud"):
         try:
             # Mapear categoría a icono y color
-            mapeo_categorias = {
-                "Salud": {"icono": "dumbbell", "color": "#10b981"},
-                "Aprendizaje": {"icono": "book-open", "color": "#3b82f6"},
-                "Productividad": {"icono": "trending-up", "color": "#f59e0b"},
-                "Bienestar": {"icono": "leaf", "color": "#06b6d4"}
-            }
-            
-            categoria_info = mapeo_categorias.get(categoria, {"icono": "checkbox-blank-circle", "color": "#3b82f6"})
-            
-            self.cursor.execute("""
-                INSERT INTO habitos (usuario_id, nombre, descripcion, objetivo_diario_minutos, categoria, icono, color)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING id, nombre, descripcion, objetivo_diario_minutos, categoria, icono, color, fecha_creacion
-            """, (usuario_id, nombre, descripcion, objetivo_minutos, categoria, categoria_info["icono"], categoria_info["color"]))
-            
-            habito = self.cursor.fetchone()
-            
-            # Crear recordatorio por defecto
-            self.cursor.execute("""
-                INSERT INTO recordatorios (habito_id)
-                VALUES (%s)
-            """, (habito['id'],))
-            
-            self.conn.commit()
+            categoria_info = MAPEO_CATEGORIAS.get(categoria, CATEGORIA_POR_DEFECTO)
+            
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    INSERT INTO habitos (usuario_id, nombre, descripcion, objetivo_diario_minutos, categoria, icono, color)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    RETURNING *
+                """, (usuario_id, nombre, descripcion, objetivo_minutos, categoria, categoria_info["icono"], categoria_info["color"]))
+            
+                habito = cursor.como(Habito).fetchone()
+            
+                # Crear recordatorio por defecto
+                cursor.execute("""
+                    INSERT INTO recordatorios (habito_id)
+                    VALUES (%s)
+                """, (habito['id'],))
+            
+            self.cache.invalidar(('usuario', usuario_id))
+            # Un hábito nuevo todavía no tiene sesiones: el registro trae
+            # las estadísticas a cero, como las filas de obtener_resumen_inicio
             return habito
             
         except Exception as e:
-            self.conn.rollback()
             print(f"Error creando hábito: {e}")
             return None
 
-    def obtener_habitos_usuario(self, usuario_id):
+    def actualizar_habito(self, habito_id, nombre, descripcion="", objetivo_minutos=30, categoria="Salud"):
         try:
-            self.cursor.execute("""
-                SELECT h.*, 
-                    COUNT(s.id) as total_sesiones,
-                    COALESCE(SUM(s.duracion_segundos), 0) as total_segundos,
-                    COALESCE(MAX(s.fecha), h.fecha_creacion::date) as ultima_sesion
-                FROM habitos h
-                LEFT JOIN sesiones s ON h.id = s.habito_id
-                WHERE h.usuario_id = %s
-                GROUP BY h.id
-                ORDER BY h.id DESC
-            """, (usuario_id,))
-            
-            habitos = self.cursor.fetchall()
-            
-            # Calcular rachas para cada hábito
-            for habito in habitos:
-                racha = self.calcular_racha_habito(habito['id'])
-                habito['racha_dias'] = racha
-            
-            return habitos
+            categoria_info = MAPEO_CATEGORIAS.get(categoria, CATEGORIA_POR_DEFECTO)
+            
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    UPDATE habitos
+                    SET nombre = %s, descripcion = %s, objetivo_diario_minutos = %s,
+                        categoria = %s, icono = %s, color = %s
+                    WHERE id = %s
+                    RETURNING *
+                """, (nombre, descripcion, objetivo_minutos, categoria,
+                      categoria_info["icono"], categoria_info["color"], habito_id))
+                
+                habito = cursor.como(Habito).fetchone()
+            
+            if not habito:
+                return False
+            self.cache.invalidar(('habito', habito_id), ('usuario', habito.usuario_id))
+            # Solo cambian los datos del hábito: el registro trae las
+            # estadísticas a cero y quien lo pinte conserva las suyas
+            return habito
             
         except Exception as e:
-            print(f"Error obteniendo hábitos: {e}")
-            return []
+            print(f"Error actualizando hábito: {e}")
+            return False
 
-    def obtener_habito_por_id(self, habito_id):
-        try:
-            self.cursor.execute("""
+    def _consultar_habitos_usuario(self, usuario_id):
+        with self.transaccion() as cursor:
+            cursor.execute(f"""
+                WITH dias AS (
+                    SELECT d.habito_id AS clave, d.fecha
+                    FROM sesiones_diarias d
+                    JOIN habitos h ON h.id = d.habito_id
+                    WHERE h.usuario_id = %s
+                ),
+                {sql_rachas("dias")}
                 SELECT h.*, 
-                    COUNT(s.id) as total_sesiones,
-                    COALESCE(SUM(s.duracion_segundos), 0) as total_segundos
+                    COALESCE(SUM(d.total_sesiones), 0) as total_sesiones,
+                    COALESCE(SUM(d.total_segundos), 0) as total_segundos,
+                    COALESCE(MAX(d.fecha), h.fecha_creacion::date) as ultima_sesion,
+                    COALESCE(r.racha_actual, 0) as racha_dias,
+                    COALESCE(r.racha_maxima, 0) as racha_maxima,
+                    r.inicio_racha
                 FROM habitos h
-                LEFT JOIN sesiones s ON h.id = s.habito_id
-                WHERE h.id = %s
-                GROUP BY h.id
-            """, (habito_id,))
-            
-            habito = self.cursor.fetchone()
-            
-            if habito:
-                # Calcular estadísticas adicionales
-                habito['racha_dias'] = self.calcular_racha_habito(habito_id)
-                habito['promedio_minutos'] = self.calcular_promedio_minutos(habito_id)
-                habito['minutos_hoy'] = self.obtener_minutos_hoy(habito_id)
+                LEFT JOIN sesiones_diarias d ON h.id = d.habito_id
+                LEFT JOIN rachas r ON r.clave = h.id
+                WHERE h.usuario_id = %s
+                GROUP BY h.id, r.racha_actual, r.racha_maxima, r.inicio_racha
+                ORDER BY h.id DESC
+            """, (usuario_id, usuario_id))
             
-            return habito
+            return cursor.como(Habito).fetchall()
+
+    def _consultar_habito_por_id(self, habito_id):
+        # Totales, minutos de hoy, promedio y racha en una sola consulta
+        with self.transaccion() as cursor:
+            self.ejecutar_preparada(cursor, "habito_por_id", (habito_id,))
             
-        except Exception as e:
-            print(f"Error obteniendo hábito: {e}")
-            return None
+            return cursor.como(Habito).fetchone()
 
     def eliminar_habito(self, habito_id):
+        """Devuelve {id, usuario_id, racha_total} con la racha del usuario
+        ya sin este hábito, o False si no existía."""
         try:
-            self.cursor.execute("DELETE FROM habitos WHERE id = %s", (habito_id,))
-            self.conn.commit()
-            return True
+            with self.transaccion() as cursor:
+                cursor.execute("DELETE FROM habitos WHERE id = %s RETURNING id, usuario_id", (habito_id,))
+                fila = cursor.fetchone()
+            
+            if not fila:
+                return False
+            self.cache.invalidar(('habito', habito_id), ('usuario', fila['usuario_id']))
+            fila['racha_total'] = self.calcular_racha_total(fila['usuario_id'])
+            return fila
         except Exception as e:
-            self.conn.rollback()
             print(f"Error eliminando hábito: {e}")
             return False
 
@@ -245,50 +436,188 @@ class BaseDatos:
             if hora_inicio is None:
                 hora_inicio = datetime.now()
             
-            self.cursor.execute("""
-                INSERT INTO sesiones (habito_id, fecha, hora_inicio, hora_fin, duracion_segundos, notas)
-                VALUES (%s, CURRENT_DATE, %s, %s, %s, %s)
-                RETURNING id
-            """, (habito_id, hora_inicio, hora_fin, duracion_segundos, notas))
+            with self.transaccion() as cursor:
+                self.ejecutar_preparada(
+                    cursor, "registrar_sesion", (habito_id, hora_inicio, hora_fin, duracion_segundos, notas)
+                )
             
-            sesion = self.cursor.fetchone()
-            self.conn.commit()
+                sesion = cursor.fetchone()
             
+            self.cache.invalidar(('habito', habito_id), ('usuario', sesion['usuario_id']))
             return sesion
             
         except Exception as e:
-            self.conn.rollback()
             print(f"Error registrando sesión: {e}")
             return None
 
+    def eliminar_sesion(self, sesion_id):
+        try:
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    WITH borrada AS (
+                        DELETE FROM sesiones WHERE id = %s
+                        RETURNING habito_id, fecha, duracion_segundos
+                    )
+                    UPDATE sesiones_diarias d
+                    SET total_segundos = d.total_segundos - b.duracion_segundos,
+                        total_sesiones = d.total_sesiones - 1
+                    FROM borrada b
+                    JOIN habitos h ON h.id = b.habito_id
+                    WHERE d.habito_id = b.habito_id AND d.fecha = b.fecha
+                    RETURNING d.habito_id, d.fecha, d.total_sesiones, h.usuario_id
+                """, (sesion_id,))
+                
+                dia = cursor.fetchone()
+                if not dia:
+                    return False
+                
+                # Un día sin sesiones no debe contar para las rachas
+                if dia['total_sesiones'] <= 0:
+                    cursor.execute("""
+                        DELETE FROM sesiones_diarias
+                        WHERE habito_id = %s AND fecha = %s
+                    """, (dia['habito_id'], dia['fecha']))
+            
+            self.cache.invalidar(('habito', dia['habito_id']), ('usuario', dia['usuario_id']))
+            return True
+        except Exception as e:
+            print(f"Error eliminando sesión: {e}")
+            return False
+
+    def importar_sesiones(self, filas, tamano_lote=10000):
+        """Importa sesiones en lotes con COPY a una tabla temporal y de ahí
+        a `sesiones`. Los duplicados contra UNIQUE(habito_id, fecha,
+        hora_inicio) y las sesiones de hábitos inexistentes se descartan en
+        el servidor. `filas` puede ser cualquier iterable de diccionarios o
+        tuplas en el orden de COLUMNAS_IMPORTACION; solo se tiene un lote en
+        memoria a la vez."""
+        reporte = {"exito": True, "leidas": 0, "insertadas": 0, "descartadas": 0,
+                   "segundos": 0.0, "filas_por_segundo": 0.0}
+        inicio = time.perf_counter()
+        filas = iter(filas)
+
+        try:
+            while True:
+                lote = list(islice(filas, tamano_lote))
+                if not lote:
+                    break
+
+                buffer = io.StringIO()
+                escritor = csv.writer(buffer)
+                for fila in lote:
+                    if isinstance(fila, dict):
+                        fila = [fila.get(columna) for columna in COLUMNAS_IMPORTACION]
+                    escritor.writerow(fila)
+                buffer.seek(0)
+
+                with self.transaccion() as cursor:
+                    cursor.execute("""
+                        CREATE TEMP TABLE IF NOT EXISTS sesiones_importacion (
+                            habito_id INTEGER,
+                            fecha DATE,
+                            hora_inicio TIMESTAMP,
+                            hora_fin TIMESTAMP,
+                            duracion_segundos INTEGER,
+                            notas TEXT
+                        ) ON COMMIT DELETE ROWS
+                    """)
+                    cursor.copy_expert(
+                        f"COPY sesiones_importacion ({', '.join(COLUMNAS_IMPORTACION)}) FROM STDIN WITH (FORMAT csv)",
+                        buffer,
+                    )
+                    # Un histórico antiguo cae en meses sin partición: se
+                    # crean antes de insertar para que no acabe en sesiones_default
+                    self._particiones_de_meses(cursor, "SELECT fecha FROM sesiones_importacion")
+                    cursor.execute(f"""
+                        WITH nuevas AS (
+                            INSERT INTO sesiones (habito_id, fecha, hora_inicio, hora_fin, duracion_segundos, notas)
+                            SELECT i.habito_id, i.fecha, COALESCE(i.hora_inicio, i.fecha::timestamp),
+                                   i.hora_fin, i.duracion_segundos, i.notas
+                            FROM sesiones_importacion i
+                            WHERE EXISTS (SELECT 1 FROM habitos h WHERE h.id = i.habito_id)
+                            ON CONFLICT (habito_id, fecha, hora_inicio) DO NOTHING
+                            RETURNING habito_id, fecha, duracion_segundos
+                        ),
+                        acumulado AS ({SQL_ACUMULAR_DIARIO.format(origen="nuevas")})
+                        SELECT COUNT(*) AS insertadas FROM nuevas
+                    """)
+                    insertadas = cursor.fetchone()['insertadas']
+
+                reporte["leidas"] += len(lote)
+                reporte["insertadas"] += insertadas
+                reporte["descartadas"] += len(lote) - insertadas
+        except Exception as e:
+            reporte["exito"] = False
+            reporte["mensaje"] = str(e)
+            print(f"Error importando sesiones: {e}")
+        finally:
+            if reporte["insertadas"]:
+                self.cache.limpiar()
+
+        reporte["segundos"] = time.perf_counter() - inicio
+        if reporte["segundos"] > 0:
+            reporte["filas_por_segundo"] = reporte["leidas"] / reporte["segundos"]
+        return reporte
+
     def obtener_sesiones_habito(self, habito_id, limite=7):
         try:
-            self.cursor.execute("""
-                SELECT fecha, duracion_segundos, hora_inicio, hora_fin, notas
-                FROM sesiones
-                WHERE habito_id = %s
-                ORDER BY fecha DESC
-                LIMIT %s
-            """, (habito_id, limite))
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    SELECT fecha, duracion_segundos, hora_inicio, hora_fin, notas
+                    FROM sesiones
+                    WHERE habito_id = %s
+                    ORDER BY fecha DESC, hora_inicio DESC, id DESC
+                    LIMIT %s
+                """, (habito_id, limite))
             
-            return self.cursor.fetchall()
+                return cursor.como(Sesion).fetchall()
             
         except Exception as e:
             print(f"Error obteniendo sesiones: {e}")
             return []
 
+    def _consultar_pagina_sesiones(self, habito_id, despues_de, limite):
+        # Comparación de filas: el índice idx_sesiones_historial empieza a
+        # leer justo después de la última sesión de la página anterior. El
+        # fecha <= redundante descarta las particiones de meses posteriores.
+        filtro = ""
+        parametros = [habito_id]
+        if despues_de is not None:
+            filtro = "AND fecha <= %s AND (fecha, hora_inicio, id) < (%s, %s, %s)"
+            parametros.extend((despues_de[0], *despues_de))
+        with self.transaccion() as cursor:
+            cursor.execute(f"""
+                SELECT id, fecha, hora_inicio, hora_fin, duracion_segundos
+                FROM sesiones
+                WHERE habito_id = %s {filtro}
+                ORDER BY fecha DESC, hora_inicio DESC, id DESC
+                LIMIT %s
+            """, (*parametros, limite))
+
+            return cursor.como(Sesion).fetchall()
+
+    def _consultar_sesiones_usuario(self, usuario_id):
+        # Todas las sesiones del usuario de una vez, solo las columnas que
+        # necesita la analítica
+        with self.transaccion() as cursor:
+            cursor.execute("""
+                SELECT s.habito_id, s.fecha, s.hora_inicio, s.duracion_segundos
+                FROM sesiones s
+                JOIN habitos h ON h.id = s.habito_id
+                WHERE h.usuario_id = %s
+            """, (usuario_id,))
+
+            return cursor.como(Sesion).fetchall()
+
     def obtener_minutos_hoy(self, habito_id):
         try:
-            self.cursor.execute("""
-                SELECT SUM(duracion_segundos) as total_segundos
-                FROM sesiones
-                WHERE habito_id = %s AND fecha = CURRENT_DATE
-            """, (habito_id,))
+            with self.transaccion() as cursor:
+                self.ejecutar_preparada(cursor, "minutos_hoy", (habito_id,))
             
-            resultado = self.cursor.fetchone()
-            if resultado and resultado['total_segundos']:
-                return resultado['total_segundos'] // 60
-            return 0
+                resultado = cursor.fetchone()
+                if resultado and resultado['total_segundos']:
+                    return resultado['total_segundos'] // 60
+                return 0
             
         except Exception as e:
             print(f"Error obteniendo minutos hoy: {e}")
@@ -297,162 +626,327 @@ class BaseDatos:
     # =================== MÉTODOS DE ESTADÍSTICAS ===================
     def calcular_racha_habito(self, habito_id):
         try:
-            self.cursor.execute("""
-                SELECT fecha FROM sesiones 
-                WHERE habito_id = %s 
-                ORDER BY fecha DESC
-                LIMIT 7
-            """, (habito_id,))
+            with self.transaccion() as cursor:
+                self.ejecutar_preparada(cursor, "racha_habito", (habito_id,))
             
-            sesiones = self.cursor.fetchall()
-            
-            if not sesiones:
-                return 0
-            
-            hoy = datetime.now().date()
-            racha = 0
-            
-            # Verificar si hoy hubo sesión
-            if sesiones[0]['fecha'] == hoy:
-                racha = 1
-                # Verificar días consecutivos anteriores
-                for i in range(1, len(sesiones)):
-                    fecha_esperada = hoy - timedelta(days=i)
-                    if sesiones[i]['fecha'] == fecha_esperada:
-                        racha += 1
-                    else:
-                        break
-            
-            return racha
+                resultado = cursor.fetchone()
+                return resultado['racha_actual'] if resultado else 0
             
         except Exception as e:
             print(f"Error calculando racha: {e}")
             return 0
 
-    def calcular_promedio_minutos(self, habito_id):
+    def calcular_rachas_usuario(self, usuario_id):
+        """Racha actual, racha más larga y fecha de inicio de la racha actual
+        de todos los hábitos del usuario, en una sola sentencia."""
         try:
-            self.cursor.execute("""
-                SELECT AVG(duracion_segundos) as promedio_segundos
-                FROM sesiones
-                WHERE habito_id = %s
-            """, (habito_id,))
+            with self.transaccion() as cursor:
+                cursor.execute(f"""
+                    WITH dias AS (
+                        SELECT d.habito_id AS clave, d.fecha
+                        FROM sesiones_diarias d
+                        JOIN habitos h ON h.id = d.habito_id
+                        WHERE h.usuario_id = %s
+                    ),
+                    {sql_rachas("dias")}
+                    SELECT h.id as habito_id,
+                        COALESCE(r.racha_actual, 0) as racha_dias,
+                        COALESCE(r.racha_maxima, 0) as racha_maxima,
+                        r.inicio_racha
+                    FROM habitos h
+                    LEFT JOIN rachas r ON r.clave = h.id
+                    WHERE h.usuario_id = %s
+                """, (usuario_id, usuario_id))
+            
+                return {fila['habito_id']: fila for fila in cursor.fetchall()}
             
-            resultado = self.cursor.fetchone()
-            if resultado and resultado['promedio_segundos']:
-                return int(resultado['promedio_segundos'] // 60)
-            return 0
+        except Exception as e:
+            print(f"Error calculando rachas: {e}")
+            return {}
+
+    def calcular_promedio_minutos(self, habito_id):
+        try:
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    SELECT SUM(total_segundos)::float / NULLIF(SUM(total_sesiones), 0) as promedio_segundos
+                    FROM sesiones_diarias
+                    WHERE habito_id = %s
+                """, (habito_id,))
+            
+                resultado = cursor.fetchone()
+                if resultado and resultado['promedio_segundos']:
+                    return int(resultado['promedio_segundos'] // 60)
+                return 0
             
         except Exception as e:
             print(f"Error calculando promedio: {e}")
             return 0
 
-# En la clase BaseDatos, añade este método:
-
-    def obtener_estadisticas_usuario(self, usuario_id):
-        try:
-            self.cursor.execute("""
+    def _consultar_estadisticas_usuario(self, usuario_id):
+        with self.transaccion() as cursor:
+            cursor.execute(f"""
+                WITH dias AS (
+                    SELECT DISTINCT 0 AS clave, d.fecha
+                    FROM sesiones_diarias d
+                    JOIN habitos h ON d.habito_id = h.id
+                    WHERE h.usuario_id = %s
+                ),
+                {sql_rachas("dias")}
                 SELECT 
                     COUNT(DISTINCT h.id) as total_habitos,
-                    COUNT(DISTINCT s.id) as total_sesiones,
-                    COALESCE(SUM(s.duracion_segundos), 0) as total_segundos
+                    COALESCE(SUM(d.total_sesiones), 0) as total_sesiones,
+                    COALESCE(SUM(d.total_segundos), 0) as total_segundos,
+                    COALESCE((SELECT racha_actual FROM rachas), 0) as racha_total
                 FROM habitos h
-                LEFT JOIN sesiones s ON h.id = s.habito_id
+                LEFT JOIN sesiones_diarias d ON h.id = d.habito_id
                 WHERE h.usuario_id = %s
-            """, (usuario_id,))
-            
-            stats = self.cursor.fetchone()
-            
-            if not stats:
-                return {
-                    'total_habitos': 0,
-                    'total_sesiones': 0,
-                    'total_segundos': 0,
-                    'racha_total': 0
-                }
+            """, (usuario_id, usuario_id))
             
-            # Calcular racha total
-            racha_total = self.calcular_racha_total(usuario_id)
-            
-            return {
-                'total_habitos': stats['total_habitos'],
-                'total_sesiones': stats['total_sesiones'],
-                'total_segundos': stats['total_segundos'],
-                'racha_total': racha_total
-            }
-            
-        except Exception as e:
-            print(f"Error obteniendo estadísticas: {e}")
-            return {
-                'total_habitos': 0,
-                'total_sesiones': 0,
-                'total_segundos': 0,
-                'racha_total': 0
-            }
+            return cursor.como(EstadisticasUsuario).fetchone()
         
     def calcular_racha_total(self, usuario_id):
         try:
-            self.cursor.execute("""
-                SELECT DISTINCT s.fecha 
-                FROM sesiones s
-                JOIN habitos h ON s.habito_id = h.id
-                WHERE h.usuario_id = %s
-                ORDER BY s.fecha DESC
-                LIMIT 7
-            """, (usuario_id,))
-            
-            fechas_sesiones = self.cursor.fetchall()
-            
-            if not fechas_sesiones:
-                return 0
-            
-            hoy = datetime.now().date()
-            racha = 0
-            
-            # Verificar si hoy hubo sesión
-            if fechas_sesiones[0]['fecha'] == hoy:
-                racha = 1
-                # Verificar días consecutivos anteriores
-                for i in range(1, len(fechas_sesiones)):
-                    fecha_esperada = hoy - timedelta(days=i)
-                    if fechas_sesiones[i]['fecha'] == fecha_esperada:
-                        racha += 1
-                    else:
-                        break
-            
-            return racha
+            with self.transaccion() as cursor:
+                cursor.execute(f"""
+                    WITH dias AS (
+                        SELECT DISTINCT 0 AS clave, d.fecha
+                        FROM sesiones_diarias d
+                        JOIN habitos h ON d.habito_id = h.id
+                        WHERE h.usuario_id = %s
+                    ),
+                    {sql_rachas("dias")}
+                    SELECT racha_actual FROM rachas
+                """, (usuario_id,))
+            
+                resultado = cursor.fetchone()
+                return resultado['racha_actual'] if resultado else 0
             
         except Exception as e:
             print(f"Error calculando racha total: {e}")
             return 0
 
+    # =================== MÉTODOS DEL PANEL DE INICIO ===================
+    def _consultar_resumen_inicio(self, usuario_id):
+        with self.transaccion() as cursor:
+            cursor.execute(f"""
+                WITH dias_habito AS (
+                    SELECT d.habito_id AS clave, d.fecha
+                    FROM sesiones_diarias d
+                    JOIN habitos h ON h.id = d.habito_id
+                    WHERE h.usuario_id = %s
+                ),
+                dias_usuario AS (
+                    SELECT DISTINCT 0 AS clave, fecha FROM dias_habito
+                ),
+                {sql_rachas("dias_habito", "rachas")},
+                {sql_rachas("dias_usuario", "racha_usuario")}
+                SELECT h.*,
+                    COALESCE(SUM(d.total_sesiones), 0) as total_sesiones,
+                    COALESCE(SUM(d.total_segundos), 0) as total_segundos,
+                    COALESCE(SUM(d.total_segundos) FILTER (WHERE d.fecha = CURRENT_DATE), 0) / 60 as minutos_hoy,
+                    COALESCE(r.racha_actual, 0) as racha_dias,
+                    COALESCE(r.racha_maxima, 0) as racha_maxima,
+                    r.inicio_racha,
+                    (SELECT racha_actual FROM racha_usuario) as racha_total
+                FROM habitos h
+                LEFT JOIN sesiones_diarias d ON h.id = d.habito_id
+                LEFT JOIN rachas r ON r.clave = h.id
+                WHERE h.usuario_id = %s
+                GROUP BY h.id, r.racha_actual, r.racha_maxima, r.inicio_racha
+                ORDER BY h.id DESC
+            """, (usuario_id, usuario_id))
+
+            habitos = cursor.como(HabitoResumen).fetchall()
+
+        # La racha del usuario viene repetida en cada fila
+        racha_total = (habitos[0].racha_total or 0) if habitos else 0
+        return totalizar_resumen(habitos, racha_total)
+
     # =================== MÉTODOS DE RECORDATORIOS ===================
     def actualizar_recordatorio(self, habito_id, activo, hora_inicio=None, hora_fin=None):
         try:
-            self.cursor.execute("""
-                UPDATE recordatorios 
-                SET activo = %s, hora_inicio = %s, hora_fin = %s
-                WHERE habito_id = %s
-            """, (activo, hora_inicio, hora_fin, habito_id))
-            self.conn.commit()
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    UPDATE recordatorios 
+                    SET activo = %s, hora_inicio = %s, hora_fin = %s
+                    WHERE habito_id = %s
+                """, (activo, hora_inicio, hora_fin, habito_id))
+            
+            self.cache.invalidar(('habito', habito_id))
             return True
         except Exception as e:
-            self.conn.rollback()
             print(f"Error actualizando recordatorio: {e}")
             return False
 
-    def obtener_recordatorio(self, habito_id):
-        try:
-            self.cursor.execute("""
+    def _consultar_recordatorio(self, habito_id):
+        with self.transaccion() as cursor:
+            cursor.execute("""
                 SELECT activo, hora_inicio, hora_fin
                 FROM recordatorios
                 WHERE habito_id = %s
             """, (habito_id,))
-            return self.cursor.fetchone()
+            return cursor.como(Recordatorio).fetchone()
+
+    # =================== MÉTODOS DE EXPORTACIÓN ===================
+    def recorrer_exportacion(self, tabla, usuario_id=None, tamano_lote=5000):
+        # Cursor con nombre: las filas se quedan en el servidor y llegan de
+        # tamano_lote en tamano_lote, en vez de todas de golpe con fetchall
+        if not self.esquema_listo:
+            self.migrar()
+        consulta = sql_exportacion(tabla, usuario_id is not None, "%s")
+        with self.pool.conexion() as conexion:
+            cursor = conexion.cursor(name=f"exportar_{tabla}")
+            cursor.itersize = tamano_lote
+            try:
+                cursor.execute(consulta, (usuario_id,) if usuario_id is not None else None)
+                while True:
+                    filas = cursor.fetchmany(tamano_lote)
+                    if not filas:
+                        break
+                    yield filas
+            finally:
+                cursor.close()
+                # Solo lectura: se cierra la transacción que abrió el cursor
+                conexion.rollback()
+
+    # =================== MÉTODOS DE PARTICIONES ===================
+    def _particiones_de_meses(self, cursor, consulta_fechas, parametros=()):
+        """Crea la partición de cada mes distinto entre las fechas de
+        `consulta_fechas` (una columna `fecha`), y solo esas: un lote con
+        una fecha de hace años no crea todos los meses intermedios."""
+        cursor.execute(f"""
+            SELECT COALESCE(SUM(crear_particiones_sesiones(mes, mes)), 0) AS creadas
+            FROM (SELECT DISTINCT date_trunc('month', fecha)::date AS mes
+                  FROM ({consulta_fechas}) AS fechas) AS meses
+        """, parametros)
+        return cursor.fetchone()['creadas']
+
+    def crear_particiones(self, meses_futuros=None, vaciar_default=False):
+        """Crea las particiones mensuales de sesiones desde el mes actual
+        hasta `meses_futuros` meses después. Con vaciar_default cubre además
+        los meses que tengan filas en sesiones_default, que pasan a su
+        partición (puede tardar: es para el mantenimiento, no para el
+        arranque). Devuelve cuántas creó."""
+        if meses_futuros is None:
+            meses_futuros = self.config_particiones["meses_futuros"]
+        try:
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    SELECT crear_particiones_sesiones(
+                        CURRENT_DATE, (CURRENT_DATE + make_interval(months => %s))::date
+                    ) AS creadas
+                """, (meses_futuros,))
+                creadas = cursor.fetchone()['creadas']
+                if vaciar_default:
+                    # Solo los meses con filas: un dato suelto de hace años
+                    # no debe crear todas las particiones intermedias
+                    cursor.execute("SELECT DISTINCT date_trunc('month', fecha)::date AS mes FROM sesiones_default")
+                    for mes in [fila['mes'] for fila in cursor.fetchall()]:
+                        cursor.execute("SELECT crear_particiones_sesiones(%s, %s) AS creadas", (mes, mes))
+                        creadas += cursor.fetchone()['creadas']
+            if creadas:
+                print(f"Particiones de sesiones creadas: {creadas}")
+            return creadas
         except Exception as e:
-            print(f"Error obteniendo recordatorio: {e}")
-            return None
+            print(f"Error creando particiones: {e}")
+            return 0
+
+    def archivar_particiones(self, meses_retencion=None):
+        """Separa de `sesiones` las particiones de meses anteriores a la
+        retención y las deja en el esquema archivo. Los acumulados de
+        sesiones_diarias no se tocan: estadísticas y rachas siguen igual,
+        pero esas sesiones salen del historial, del informe y de la
+        exportación. Devuelve los nombres de las particiones archivadas."""
+        if meses_retencion is None:
+            meses_retencion = self.config_particiones["meses_retencion"]
+        try:
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    SELECT archivar_particiones_sesiones(
+                        (date_trunc('month', CURRENT_DATE) - make_interval(months => %s))::date
+                    ) AS nombre
+                """, (meses_retencion,))
+                archivadas = [fila['nombre'] for fila in cursor.fetchall()]
+            if archivadas:
+                self.cache.limpiar()
+                print(f"Particiones archivadas: {', '.join(archivadas)}")
+            return archivadas
+        except Exception as e:
+            print(f"Error archivando particiones: {e}")
+            return []
+
+    # =================== MÉTODOS DEL DIARIO LOCAL ===================
+    def aplicar_diario(self, entradas):
+        """Aplica en una sola transacción un lote de entradas del diario
+        local (ver diario.py). Las sesiones llevan su clave de idempotencia:
+        reenviar un lote ya aplicado no duplica nada. Las que apuntan a un
+        hábito borrado se descartan. Lanza la excepción si falla, para que
+        el diario reintente más tarde.
+
+        Devuelve cuántas sesiones se insertaron."""
+        sesiones = []
+        ediciones = []
+        for entrada in entradas:
+            datos = entrada['datos']
+            if entrada['tipo'] == 'sesion':
+                sesiones.append((
+                    datos['habito_id'], datos['fecha'], datos['hora_inicio'], datos['hora_fin'],
+                    datos['duracion_segundos'], datos.get('notas', ''), entrada['clave'],
+                ))
+            else:
+                ediciones.append(entrada)
+
+        insertadas = 0
+        with self.transaccion() as cursor:
+            if sesiones:
+                # Sesiones anotadas sin conexión pueden ser de meses sin
+                # partición (p. ej. un diario que lleva tiempo sin vaciarse)
+                self._particiones_de_meses(cursor, "SELECT unnest(%s::date[]) AS fecha",
+                                           ([sesion[1] for sesion in sesiones],))
+                # Sesión y acumulado diario en la misma sentencia, como registrar_sesion
+                filas = execute_values(cursor, f"""
+                    WITH nueva AS (
+                        INSERT INTO sesiones (habito_id, fecha, hora_inicio, hora_fin,
+                                              duracion_segundos, notas, clave_idempotencia)
+                        SELECT v.habito_id, v.fecha, v.hora_inicio, v.hora_fin,
+                               v.duracion_segundos, v.notas, v.clave
+                        FROM (VALUES %s) AS v(habito_id, fecha, hora_inicio, hora_fin,
+                                              duracion_segundos, notas, clave)
+                        WHERE EXISTS (SELECT 1 FROM habitos h WHERE h.id = v.habito_id)
+                        ON CONFLICT DO NOTHING
+                        RETURNING habito_id, fecha, duracion_segundos
+                    ),
+                    acumulado AS ({SQL_ACUMULAR_DIARIO.format(origen="nueva")})
+                    SELECT COUNT(*) AS insertadas FROM nueva
+                """, sesiones,
+                    template="(%s::integer, %s::date, %s::timestamp, %s::timestamp, %s::integer, %s::text, %s::text)",
+                    page_size=len(sesiones), fetch=True)
+                insertadas = filas[0]['insertadas']
+
+            # Las ediciones se aplican en el orden en que se hicieron
+            for entrada in ediciones:
+                datos = entrada['datos']
+                if entrada['tipo'] == 'habito':
+                    categoria_info = MAPEO_CATEGORIAS.get(datos['categoria'], CATEGORIA_POR_DEFECTO)
+                    cursor.execute("""
+                        UPDATE habitos
+                        SET nombre = %s, descripcion = %s, objetivo_diario_minutos = %s,
+                            categoria = %s, icono = %s, color = %s
+                        WHERE id = %s
+                    """, (datos['nombre'], datos['descripcion'], datos['objetivo_minutos'], datos['categoria'],
+                          categoria_info["icono"], categoria_info["color"], datos['habito_id']))
+                elif entrada['tipo'] == 'recordatorio':
+                    cursor.execute("""
+                        UPDATE recordatorios 
+                        SET activo = %s, hora_inicio = %s, hora_fin = %s
+                        WHERE habito_id = %s
+                    """, (datos['activo'], datos['hora_inicio'], datos['hora_fin'], datos['habito_id']))
+
+        if entradas:
+            self.cache.limpiar()
+        return insertadas
 
     def cerrar_conexion(self):
-        self.cursor.close()
-        self.conn.close()
+        super().cerrar_conexion()
+        self.pool.cerrar()
         print("Conexión cerrada")
\ No newline at end of file
@@ -0,0 +1,865 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as hora
+from itertools import islice
+
+from instrumentacion import ConsultasMedidas, CONFIG_INSTRUMENTACION
+from registros import Habito, HabitoResumen, Sesion, Recordatorio, EstadisticasUsuario
+from almacenamiento import (
+    Almacenamiento, totalizar_resumen, sql_exportacion, COLUMNAS_IMPORTACION,
+    MAPEO_CATEGORIAS, CATEGORIA_POR_DEFECTO,
+)
+
+# Ajustes de cada conexión. WAL deja leer mientras otro hilo escribe;
+# synchronous=NORMAL con WAL no pierde consistencia ante un corte, solo
+# como mucho la última transacción.
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",       # 16 MB de caché de páginas
+    "PRAGMA mmap_size = 134217728",     # 128 MB mapeados en memoria
+]
+
+# Mismo modelo que migraciones.py, versionado con PRAGMA user_version.
+# Se añade al final; nunca se editan las ya publicadas.
+MIGRACIONES_SQLITE = [
+    (1, "Esquema inicial", [
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre_usuario TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            contrasena TEXT NOT NULL,
+            fecha_creacion TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS habitos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            nombre TEXT NOT NULL,
+            descripcion TEXT,
+            objetivo_diario_minutos INTEGER DEFAULT 30,
+            categoria TEXT DEFAULT 'Salud',
+            icono TEXT DEFAULT 'run',
+            color TEXT DEFAULT '#3b82f6',
+            fecha_creacion TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sesiones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habito_id INTEGER NOT NULL REFERENCES habitos(id) ON DELETE CASCADE,
+            fecha DATE NOT NULL DEFAULT (date('now', 'localtime')),
+            hora_inicio TIMESTAMP,
+            hora_fin TIMESTAMP,
+            duracion_segundos INTEGER NOT NULL,
+            completada BOOLEAN DEFAULT 1,
+            notas TEXT,
+            clave_idempotencia TEXT UNIQUE,
+            UNIQUE(habito_id, fecha, hora_inicio)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS recordatorios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habito_id INTEGER NOT NULL REFERENCES habitos(id) ON DELETE CASCADE,
+            activo BOOLEAN DEFAULT 0,
+            hora_inicio TIME,
+            hora_fin TIME
+        )
+        """,
+        # Sin rowid: la tabla es el propio índice (habito_id, fecha)
+        """
+        CREATE TABLE IF NOT EXISTS sesiones_diarias (
+            habito_id INTEGER NOT NULL REFERENCES habitos(id) ON DELETE CASCADE,
+            fecha DATE NOT NULL,
+            total_segundos INTEGER NOT NULL DEFAULT 0,
+            total_sesiones INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (habito_id, fecha)
+        ) WITHOUT ROWID
+        """,
+        # Los mismos recorridos que los índices de la migración 3 de Postgres;
+        # SQLite no tiene INCLUDE, las columnas extra van en la clave
+        "CREATE INDEX IF NOT EXISTS idx_habitos_usuario ON habitos (usuario_id, id DESC)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_sesiones_habito_fecha
+        ON sesiones (habito_id, fecha DESC, duracion_segundos, hora_inicio, hora_fin)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_recordatorios_habito ON recordatorios (habito_id)",
+    ]),
+
+    (2, "Orden total del historial de sesiones para paginar por clave", [
+        # Como la migración 5 de Postgres. SQLite no puede añadir NOT NULL a
+        # una columna existente sin rehacer la tabla; las inserciones ya
+        # rellenan siempre hora_inicio
+        """
+        UPDATE sesiones
+        SET hora_inicio = (
+            -- Mismo texto que el adaptador de datetime (sin fracción si es 0),
+            -- para que las comparaciones de texto sigan el orden real
+            SELECT n.fecha || ' 00:00:00' || CASE WHEN n.orden = 0 THEN '' ELSE printf('.%06d', n.orden) END
+            FROM (
+                SELECT id, fecha, ROW_NUMBER() OVER (PARTITION BY habito_id, fecha ORDER BY id) - 1 AS orden
+                FROM sesiones
+                WHERE hora_inicio IS NULL
+            ) n
+            WHERE n.id = sesiones.id
+        )
+        WHERE hora_inicio IS NULL
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_sesiones_historial
+        ON sesiones (habito_id, fecha DESC, hora_inicio DESC, id DESC, duracion_segundos, hora_fin)
+        """,
+        "DROP INDEX IF EXISTS idx_sesiones_habito_fecha",
+    ]),
+]
+
+HOY = "date('now', 'localtime')"
+
+# Tipos de fecha y hora: se guardan como texto ISO y se leen como objetos
+# de Python, igual que los devuelve psycopg2
+sqlite3.register_adapter(date, lambda valor: valor.isoformat())
+sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(" "))
+sqlite3.register_adapter(hora, lambda valor: valor.isoformat())
+sqlite3.register_converter("date", lambda valor: date.fromisoformat(valor.decode()))
+sqlite3.register_converter("timestamp", lambda valor: datetime.fromisoformat(valor.decode()))
+sqlite3.register_converter("time", lambda valor: hora.fromisoformat(valor.decode()))
+sqlite3.register_converter("boolean", lambda valor: bool(int(valor)))
+
+
+def sql_rachas(origen, nombre="rachas"):
+    """Versión SQLite de database.sql_rachas: las islas se numeran con
+    julianday(fecha) - ROW_NUMBER(). Mismas columnas de salida."""
+    return f"""
+        {nombre}_islas AS (
+            SELECT clave, fecha,
+                julianday(fecha) - ROW_NUMBER() OVER (PARTITION BY clave ORDER BY fecha) AS isla
+            FROM {origen}
+        ),
+        {nombre}_tramos AS (
+            SELECT clave, MIN(fecha) AS inicio, MAX(fecha) AS fin, COUNT(*) AS dias
+            FROM {nombre}_islas
+            GROUP BY clave, isla
+        ),
+        {nombre} AS (
+            SELECT clave,
+                MAX(dias) AS racha_maxima,
+                COALESCE(MAX(CASE WHEN fin = {HOY} THEN dias END), 0) AS racha_actual,
+                MAX(CASE WHEN fin = {HOY} THEN inicio END) AS inicio_racha
+            FROM {nombre}_tramos
+            GROUP BY clave
+        )"""
+
+
+# Suma al acumulado diario las sesiones con id mayor que el parámetro: las
+# que acaba de insertar la transacción en curso (que tiene el candado de
+# escritura, así que nadie más inserta entre medias)
+SQL_ACUMULAR_DESDE = """
+    INSERT INTO sesiones_diarias (habito_id, fecha, total_segundos, total_sesiones)
+    SELECT habito_id, fecha, SUM(duracion_segundos), COUNT(*)
+    FROM sesiones
+    WHERE id > ?
+    GROUP BY habito_id, fecha
+    ON CONFLICT (habito_id, fecha) DO UPDATE SET
+        total_segundos = total_segundos + excluded.total_segundos,
+        total_sesiones = total_sesiones + excluded.total_sesiones
+"""
+
+
+def _fila_dict(cursor, fila):
+    return {columna[0]: valor for columna, valor in zip(cursor.description, fila)}
+
+
+def _a_fecha(valor):
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def _a_momento(valor):
+    # Texto ISO con 'T' o con espacio; vacío (CSV) cuenta como NULL
+    if isinstance(valor, str):
+        return datetime.fromisoformat(valor) if valor else None
+    return valor
+
+
+class CursorRegistrosSQLite(sqlite3.Cursor):
+    """Cursor que, si tras el execute se pide con como(clase), devuelve las
+    filas como registros compactos de esa clase (registros.py); si no, como
+    dict. sqlite3 aplica row_factory al leer cada fila, no al ejecutar."""
+
+    def execute(self, sentencia, parametros=()):
+        self.row_factory = self.connection.row_factory
+        return super().execute(sentencia, parametros)
+
+    def como(self, clase):
+        construir = clase.constructor(tuple(columna[0] for columna in self.description))
+        self.row_factory = lambda cursor, fila: construir(fila)
+        return self
+
+
+class CursorInstrumentadoSQLite(ConsultasMedidas, CursorRegistrosSQLite):
+    """Cursor que anota cada sentencia en instrumentacion.registro."""
+
+
+class BaseDatosSQLite(Almacenamiento):
+    """Almacenamiento en un archivo SQLite, sin servidor: para instalaciones
+    de un solo usuario. Las consultas corren dentro del proceso.
+
+    Cada hilo usa su propia conexión (sqlite3 no comparte conexiones entre
+    hilos). Requiere SQLite 3.25 o posterior por las funciones de ventana.
+    """
+
+    errores_conexion = (sqlite3.OperationalError,)
+    errores_datos = (sqlite3.DataError, sqlite3.IntegrityError)
+
+    def __init__(self, ruta, config_hash=None, config_cache=None, fabrica_cursor=None):
+        super().__init__(config_hash, config_cache)
+        if fabrica_cursor is None and CONFIG_INSTRUMENTACION["activa"]:
+            fabrica_cursor = CursorInstrumentadoSQLite
+        self.fabrica_cursor = fabrica_cursor or CursorRegistrosSQLite
+        self.ruta = ruta
+        self._local = threading.local()
+        self._conexiones = []
+        self._candado = threading.Lock()
+        self.migrar()
+        print(f"Base de datos local: {ruta}")
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(
+                self.ruta,
+                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                isolation_level=None,  # las transacciones se abren a mano
+                check_same_thread=False,
+            )
+            conexion.row_factory = _fila_dict
+            for pragma in PRAGMAS:
+                conexion.execute(pragma)
+            self._local.conexion = conexion
+            with self._candado:
+                self._conexiones.append(conexion)
+        return conexion
+
+    @contextmanager
+    def transaccion(self, escritura=True):
+        """Cursor en una transacción. Las de escritura toman el candado de
+        escritura al empezar (BEGIN IMMEDIATE) para no chocar a mitad."""
+        conexion = self._conexion()
+        cursor = conexion.cursor(self.fabrica_cursor)
+        # El control de la transacción va por la conexión, como hace psycopg2:
+        # el cursor (instrumentado o no) solo ve las consultas
+        conexion.execute("BEGIN IMMEDIATE" if escritura else "BEGIN")
+        try:
+            yield cursor
+            conexion.execute("COMMIT")
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+
+    def migrar(self):
+        with self.transaccion() as cursor:
+            version = cursor.execute("PRAGMA user_version").fetchone()["user_version"]
+            for numero, descripcion, sentencias in MIGRACIONES_SQLITE:
+                if numero <= version:
+                    continue
+                for sentencia in sentencias:
+                    cursor.execute(sentencia)
+                cursor.execute(f"PRAGMA user_version = {int(numero)}")
+                print(f"Migración {numero} aplicada: {descripcion}")
+
+    # =================== MÉTODOS DE USUARIOS ===================
+    def _cambiar_hash(self, usuario_id, nueva, anterior):
+        with self.transaccion() as cursor:
+            cursor.execute("""
+                UPDATE usuarios SET contrasena = ?
+                WHERE id = ? AND contrasena = ?
+            """, (nueva, usuario_id, anterior))
+
+    def _buscar_usuario(self, usuario_o_email):
+        with self.transaccion(escritura=False) as cursor:
+            cursor.execute("""
+                SELECT id, nombre_usuario, email, contrasena
+                FROM usuarios
+                WHERE nombre_usuario = ? OR email = ?
+            """, (usuario_o_email, usuario_o_email))
+            return cursor.fetchone()
+
+    def registrar_usuario(self, nombre_usuario, email, contrasena):
+        try:
+            with self.transaccion(escritura=False) as cursor:
+                cursor.execute(
+                    "SELECT id FROM usuarios WHERE nombre_usuario = ? OR email = ?",
+                    (nombre_usuario, email),
+                )
+                if cursor.fetchone():
+                    return {"exito": False, "mensaje": "Usuario o email ya existen"}
+
+            contrasena_encriptada = self.encriptar_contrasena(contrasena)
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    INSERT INTO usuarios (nombre_usuario, email, contrasena)
+                    VALUES (?, ?, ?)
+                """, (nombre_usuario, email, contrasena_encriptada))
+                cursor.execute(
+                    "SELECT id, nombre_usuario, email, fecha_creacion FROM usuarios WHERE id = ?",
+                    (cursor.lastrowid,),
+                )
+                usuario = cursor.fetchone()
+                print(f"Usuario registrado: {nombre_usuario}")
+                return {"exito": True, "usuario": usuario}
+        except Exception as e:
+            return {"exito": False, "mensaje": str(e)}
+
+    # =================== MÉTODOS DE HÁBITOS ===================
+    def crear_habito(self, usuario_id, nombre, descripcion="", objetivo_minutos=30, categoria="Salud"):
+        try:
+            categoria_info = MAPEO_CATEGORIAS.get(categoria, CATEGORIA_POR_DEFECTO)
+
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    INSERT INTO habitos (usuario_id, nombre, descripcion, objetivo_diario_minutos, categoria, icono, color)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (usuario_id, nombre, descripcion, objetivo_minutos, categoria, categoria_info["icono"], categoria_info["color"]))
+                habito_id = cursor.lastrowid
+
+                # Crear recordatorio por defecto
+                cursor.execute("INSERT INTO recordatorios (habito_id) VALUES (?)", (habito_id,))
+                cursor.execute("SELECT * FROM habitos WHERE id = ?", (habito_id,))
+                habito = cursor.como(Habito).fetchone()
+
+            self.cache.invalidar(('usuario', usuario_id))
+            return habito
+
+        except Exception as e:
+            print(f"Error creando hábito: {e}")
+            return None
+
+    def actualizar_habito(self, habito_id, nombre, descripcion="", objetivo_minutos=30, categoria="Salud"):
+        try:
+            categoria_info = MAPEO_CATEGORIAS.get(categoria, CATEGORIA_POR_DEFECTO)
+
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    UPDATE habitos
+                    SET nombre = ?, descripcion = ?, objetivo_diario_minutos = ?,
+                        categoria = ?, icono = ?, color = ?
+                    WHERE id = ?
+                """, (nombre, descripcion, objetivo_minutos, categoria,
+                      categoria_info["icono"], categoria_info["color"], habito_id))
+                if not cursor.rowcount:
+                    return False
+                cursor.execute("SELECT * FROM habitos WHERE id = ?", (habito_id,))
+                habito = cursor.como(Habito).fetchone()
+
+            self.cache.invalidar(('habito', habito_id), ('usuario', habito.usuario_id))
+            return habito
+
+        except Exception as e:
+            print(f"Error actualizando hábito: {e}")
+            return False
+
+    def _consultar_habitos_usuario(self, usuario_id):
+        with self.transaccion(escritura=False) as cursor:
+            cursor.execute(f"""
+                WITH dias AS (
+                    SELECT d.habito_id AS clave, d.fecha
+                    FROM sesiones_diarias d
+                    JOIN habitos h ON h.id = d.habito_id
+                    WHERE h.usuario_id = ?
+                ),
+                {sql_rachas("dias")}
+                SELECT h.*,
+                    COALESCE(SUM(d.total_sesiones), 0) AS total_sesiones,
+                    COALESCE(SUM(d.total_segundos), 0) AS total_segundos,
+                    COALESCE(MAX(d.fecha), date(h.fecha_creacion)) AS "ultima_sesion [date]",
+                    COALESCE(r.racha_actual, 0) AS racha_dias,
+                    COALESCE(r.racha_maxima, 0) AS racha_maxima,
+                    r.inicio_racha AS "inicio_racha [date]"
+                FROM habitos h
+                LEFT JOIN sesiones_diarias d ON h.id = d.habito_id
+                LEFT JOIN rachas r ON r.clave = h.id
+                WHERE h.usuario_id = ?
+                GROUP BY h.id
+                ORDER BY h.id DESC
+            """, (usuario_id, usuario_id))
+
+            return cursor.como(Habito).fetchall()
+
+    def _consultar_habito_por_id(self, habito_id):
+        with self.transaccion(escritura=False) as cursor:
+            cursor.execute(f"""
+                WITH dias AS (
+                    SELECT habito_id AS clave, fecha
+                    FROM sesiones_diarias
+                    WHERE habito_id = ?
+                ),
+                {sql_rachas("dias")}
+                SELECT h.*,
+                    COALESCE(SUM(d.total_sesiones), 0) AS total_sesiones,
+                    COALESCE(SUM(d.total_segundos), 0) AS total_segundos,
+                    COALESCE(SUM(CASE WHEN d.fecha = {HOY} THEN d.total_segundos END), 0) / 60 AS minutos_hoy,
+                    COALESCE(SUM(d.total_segundos) / NULLIF(SUM(d.total_sesiones), 0) / 60, 0) AS promedio_minutos,
+                    COALESCE(r.racha_actual, 0) AS racha_dias,
+                    COALESCE(r.racha_maxima, 0) AS racha_maxima,
+                    r.inicio_racha AS "inicio_racha [date]"
+                FROM habitos h
+                LEFT JOIN sesiones_diarias d ON h.id = d.habito_id
+                LEFT JOIN rachas r ON r.clave = h.id
+                WHERE h.id = ?
+                GROUP BY h.id
+            """, (habito_id, habito_id))
+
+            return cursor.como(Habito).fetchone()
+
+    def eliminar_habito(self, habito_id):
+        try:
+            with self.transaccion() as cursor:
+                cursor.execute("SELECT id, usuario_id FROM habitos WHERE id = ?", (habito_id,))
+                fila = cursor.fetchone()
+                if not fila:
+                    return False
+                # Sesiones, acumulado y recordatorio caen por ON DELETE CASCADE
+                cursor.execute("DELETE FROM habitos WHERE id = ?", (habito_id,))
+
+            self.cache.invalidar(('habito', habito_id), ('usuario', fila['usuario_id']))
+            fila['racha_total'] = self.calcular_racha_total(fila['usuario_id'])
+            return fila
+        except Exception as e:
+            print(f"Error eliminando hábito: {e}")
+            return False
+
+    # =================== MÉTODOS DE SESIONES ===================
+    def registrar_sesion(self, habito_id, duracion_segundos, hora_inicio=None, hora_fin=None, notas=""):
+        try:
+            if hora_inicio is None:
+                hora_inicio = datetime.now()
+
+            with self.transaccion() as cursor:
+                cursor.execute(f"""
+                    INSERT INTO sesiones (habito_id, fecha, hora_inicio, hora_fin, duracion_segundos, notas)
+                    VALUES (?, {HOY}, ?, ?, ?, ?)
+                """, (habito_id, hora_inicio, hora_fin, duracion_segundos, notas))
+                sesion_id = cursor.lastrowid
+                cursor.execute(SQL_ACUMULAR_DESDE, (sesion_id - 1,))
+                cursor.execute("SELECT usuario_id FROM habitos WHERE id = ?", (habito_id,))
+                sesion = {"id": sesion_id, "usuario_id": cursor.fetchone()["usuario_id"]}
+
+            self.cache.invalidar(('habito', habito_id), ('usuario', sesion['usuario_id']))
+            return sesion
+
+        except Exception as e:
+            print(f"Error registrando sesión: {e}")
+            return None
+
+    def eliminar_sesion(self, sesion_id):
+        try:
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    SELECT s.habito_id, s.fecha, s.duracion_segundos, h.usuario_id
+                    FROM sesiones s
+                    JOIN habitos h ON h.id = s.habito_id
+                    WHERE s.id = ?
+                """, (sesion_id,))
+                sesion = cursor.fetchone()
+                if not sesion:
+                    return False
+
+                cursor.execute("DELETE FROM sesiones WHERE id = ?", (sesion_id,))
+                cursor.execute("""
+                    UPDATE sesiones_diarias
+                    SET total_segundos = total_segundos - ?,
+                        total_sesiones = total_sesiones - 1
+                    WHERE habito_id = ? AND fecha = ?
+                """, (sesion['duracion_segundos'], sesion['habito_id'], sesion['fecha']))
+                # Un día sin sesiones no debe contar para las rachas
+                cursor.execute("""
+                    DELETE FROM sesiones_diarias
+                    WHERE habito_id = ? AND fecha = ? AND total_sesiones <= 0
+                """, (sesion['habito_id'], sesion['fecha']))
+
+            self.cache.invalidar(('habito', sesion['habito_id']), ('usuario', sesion['usuario_id']))
+            return True
+        except Exception as e:
+            print(f"Error eliminando sesión: {e}")
+            return False
+
+    def importar_sesiones(self, filas, tamano_lote=10000):
+        """Importa sesiones por lotes, una transacción por lote. Descarta
+        duplicados y sesiones de hábitos inexistentes, como en Postgres."""
+        reporte = {"exito": True, "leidas": 0, "insertadas": 0, "descartadas": 0,
+                   "segundos": 0.0, "filas_por_segundo": 0.0}
+        inicio = time.perf_counter()
+        filas = iter(filas)
+
+        try:
+            while True:
+                lote = list(islice(filas, tamano_lote))
+                if not lote:
+                    break
+
+                valores = []
+                for fila in lote:
+                    if isinstance(fila, dict):
+                        fila = [fila.get(columna) for columna in COLUMNAS_IMPORTACION]
+                    habito_id, fecha, hora_inicio, hora_fin, duracion, notas = fila
+                    fecha = _a_fecha(fecha)
+                    # Sin hora de inicio cuenta la medianoche, como en Postgres
+                    hora_inicio = _a_momento(hora_inicio) or datetime.combine(fecha, hora())
+                    valores.append((int(habito_id), fecha, hora_inicio,
+                                    _a_momento(hora_fin), int(duracion), notas or None, int(habito_id)))
+
+                insertadas = self._insertar_sesiones(valores)
+                reporte["leidas"] += len(lote)
+                reporte["insertadas"] += insertadas
+                reporte["descartadas"] += len(lote) - insertadas
+        except Exception as e:
+            reporte["exito"] = False
+            reporte["mensaje"] = str(e)
+            print(f"Error importando sesiones: {e}")
+        finally:
+            if reporte["insertadas"]:
+                self.cache.limpiar()
+
+        reporte["segundos"] = time.perf_counter() - inicio
+        if reporte["segundos"] > 0:
+            reporte["filas_por_segundo"] = reporte["leidas"] / reporte["segundos"]
+        return reporte
+
+    def _insertar_sesiones(self, valores, cursor=None, clave=False):
+        """Inserta (habito_id, fecha, hora_inicio, hora_fin, duracion, notas,
+        [clave,] habito_id) ignorando conflictos y hábitos borrados, y suma
+        al acumulado solo lo insertado. Devuelve cuántas entraron."""
+        columnas = "habito_id, fecha, hora_inicio, hora_fin, duracion_segundos, notas"
+        if clave:
+            columnas += ", clave_idempotencia"
+        marcas = ", ".join("?" * (7 if clave else 6))
+        sql = f"""
+            INSERT INTO sesiones ({columnas})
+            SELECT {marcas}
+            WHERE EXISTS (SELECT 1 FROM habitos WHERE id = ?)
+            ON CONFLICT DO NOTHING
+        """
+
+        def insertar(cursor):
+            ultimo = cursor.execute("SELECT COALESCE(MAX(id), 0) AS ultimo FROM sesiones").fetchone()["ultimo"]
+            cursor.executemany(sql, valores)
+            cursor.execute(SQL_ACUMULAR_DESDE, (ultimo,))
+            return cursor.execute(
+                "SELECT COUNT(*) AS insertadas FROM sesiones WHERE id > ?", (ultimo,)
+            ).fetchone()["insertadas"]
+
+        if cursor is not None:
+            return insertar(cursor)
+        with self.transaccion() as cursor:
+            return insertar(cursor)
+
+    def obtener_sesiones_habito(self, habito_id, limite=7):
+        try:
+            with self.transaccion(escritura=False) as cursor:
+                cursor.execute("""
+                    SELECT fecha, duracion_segundos, hora_inicio, hora_fin, notas
+                    FROM sesiones
+                    WHERE habito_id = ?
+                    ORDER BY fecha DESC, hora_inicio DESC, id DESC
+                    LIMIT ?
+                """, (habito_id, limite))
+
+                return cursor.como(Sesion).fetchall()
+
+        except Exception as e:
+            print(f"Error obteniendo sesiones: {e}")
+            return []
+
+    def _consultar_pagina_sesiones(self, habito_id, despues_de, limite):
+        # Comparación de filas: el índice idx_sesiones_historial empieza a
+        # leer justo después de la última sesión de la página anterior
+        filtro = ""
+        parametros = [habito_id]
+        if despues_de is not None:
+            filtro = "AND (fecha, hora_inicio, id) < (?, ?, ?)"
+            parametros.extend(despues_de)
+        with self.transaccion(escritura=False) as cursor:
+            cursor.execute(f"""
+                SELECT id, fecha, hora_inicio, hora_fin, duracion_segundos
+                FROM sesiones
+                WHERE habito_id = ? {filtro}
+                ORDER BY fecha DESC, hora_inicio DESC, id DESC
+                LIMIT ?
+            """, (*parametros, limite))
+
+            return cursor.como(Sesion).fetchall()
+
+    def _consultar_sesiones_usuario(self, usuario_id):
+        # Todas las sesiones del usuario de una vez, solo las columnas que
+        # necesita la analítica
+        with self.transaccion(escritura=False) as cursor:
+            cursor.execute("""
+                SELECT s.habito_id, s.fecha, s.hora_inicio, s.duracion_segundos
+                FROM sesiones s
+                JOIN habitos h ON h.id = s.habito_id
+                WHERE h.usuario_id = ?
+            """, (usuario_id,))
+
+            return cursor.como(Sesion).fetchall()
+
+    def obtener_minutos_hoy(self, habito_id):
+        try:
+            with self.transaccion(escritura=False) as cursor:
+                cursor.execute(f"""
+                    SELECT total_segundos
+                    FROM sesiones_diarias
+                    WHERE habito_id = ? AND fecha = {HOY}
+                """, (habito_id,))
+
+                resultado = cursor.fetchone()
+                if resultado and resultado['total_segundos']:
+                    return resultado['total_segundos'] // 60
+                return 0
+
+        except Exception as e:
+            print(f"Error obteniendo minutos hoy: {e}")
+            return 0
+
+    # =================== MÉTODOS DE ESTADÍSTICAS ===================
+    def calcular_racha_habito(self, habito_id):
+        try:
+            with self.transaccion(escritura=False) as cursor:
+                cursor.execute(f"""
+                    WITH dias AS (
+                        SELECT habito_id AS clave, fecha
+                        FROM sesiones_diarias
+                        WHERE habito_id = ?
+                    ),
+                    {sql_rachas("dias")}
+                    SELECT racha_actual FROM rachas
+                """, (habito_id,))
+
+                resultado = cursor.fetchone()
+                return resultado['racha_actual'] if resultado else 0
+
+        except Exception as e:
+            print(f"Error calculando racha: {e}")
+            return 0
+
+    def calcular_rachas_usuario(self, usuario_id):
+        try:
+            with self.transaccion(escritura=False) as cursor:
+                cursor.execute(f"""
+                    WITH dias AS (
+                        SELECT d.habito_id AS clave, d.fecha
+                        FROM sesiones_diarias d
+                        JOIN habitos h ON h.id = d.habito_id
+                        WHERE h.usuario_id = ?
+                    ),
+                    {sql_rachas("dias")}
+                    SELECT h.id AS habito_id,
+                        COALESCE(r.racha_actual, 0) AS racha_dias,
+                        COALESCE(r.racha_maxima, 0) AS racha_maxima,
+                        r.inicio_racha AS "inicio_racha [date]"
+                    FROM habitos h
+                    LEFT JOIN rachas r ON r.clave = h.id
+                    WHERE h.usuario_id = ?
+                """, (usuario_id, usuario_id))
+
+                return {fila['habito_id']: fila for fila in cursor.fetchall()}
+
+        except Exception as e:
+            print(f"Error calculando rachas: {e}")
+            return {}
+
+    def calcular_promedio_minutos(self, habito_id):
+        try:
+            with self.transaccion(escritura=False) as cursor:
+                cursor.execute("""
+                    SELECT CAST(SUM(total_segundos) AS REAL) / NULLIF(SUM(total_sesiones), 0) AS promedio_segundos
+                    FROM sesiones_diarias
+                    WHERE habito_id = ?
+                """, (habito_id,))
+
+                resultado = cursor.fetchone()
+                if resultado and resultado['promedio_segundos']:
+                    return int(resultado['promedio_segundos'] // 60)
+                return 0
+
+        except Exception as e:
+            print(f"Error calculando promedio: {e}")
+            return 0
+
+    def _consultar_estadisticas_usuario(self, usuario_id):
+        with self.transaccion(escritura=False) as cursor:
+            cursor.execute(f"""
+                WITH dias AS (
+                    SELECT DISTINCT 0 AS clave, d.fecha
+                    FROM sesiones_diarias d
+                    JOIN habitos h ON d.habito_id = h.id
+                    WHERE h.usuario_id = ?
+                ),
+                {sql_rachas("dias")}
+                SELECT
+                    COUNT(DISTINCT h.id) AS total_habitos,
+                    COALESCE(SUM(d.total_sesiones), 0) AS total_sesiones,
+                    COALESCE(SUM(d.total_segundos), 0) AS total_segundos,
+                    COALESCE((SELECT racha_actual FROM rachas), 0) AS racha_total
+                FROM habitos h
+                LEFT JOIN sesiones_diarias d ON h.id = d.habito_id
+                WHERE h.usuario_id = ?
+            """, (usuario_id, usuario_id))
+
+            return cursor.como(EstadisticasUsuario).fetchone()
+
+    def calcular_racha_total(self, usuario_id):
+        try:
+            with self.transaccion(escritura=False) as cursor:
+                cursor.execute(f"""
+                    WITH dias AS (
+                        SELECT DISTINCT 0 AS clave, d.fecha
+                        FROM sesiones_diarias d
+                        JOIN habitos h ON d.habito_id = h.id
+                        WHERE h.usuario_id = ?
+                    ),
+                    {sql_rachas("dias")}
+                    SELECT racha_actual FROM rachas
+                """, (usuario_id,))
+
+                resultado = cursor.fetchone()
+                return resultado['racha_actual'] if resultado else 0
+
+        except Exception as e:
+            print(f"Error calculando racha total: {e}")
+            return 0
+
+    # =================== MÉTODOS DEL PANEL DE INICIO ===================
+    def _consultar_resumen_inicio(self, usuario_id):
+        with self.transaccion(escritura=False) as cursor:
+            cursor.execute(f"""
+                WITH dias_habito AS (
+                    SELECT d.habito_id AS clave, d.fecha
+                    FROM sesiones_diarias d
+                    JOIN habitos h ON h.id = d.habito_id
+                    WHERE h.usuario_id = ?
+                ),
+                dias_usuario AS (
+                    SELECT DISTINCT 0 AS clave, fecha FROM dias_habito
+                ),
+                {sql_rachas("dias_habito", "rachas")},
+                {sql_rachas("dias_usuario", "racha_usuario")}
+                SELECT h.*,
+                    COALESCE(SUM(d.total_sesiones), 0) AS total_sesiones,
+                    COALESCE(SUM(d.total_segundos), 0) AS total_segundos,
+                    COALESCE(SUM(CASE WHEN d.fecha = {HOY} THEN d.total_segundos END), 0) / 60 AS minutos_hoy,
+                    COALESCE(r.racha_actual, 0) AS racha_dias,
+                    COALESCE(r.racha_maxima, 0) AS racha_maxima,
+                    r.inicio_racha AS "inicio_racha [date]",
+                    (SELECT racha_actual FROM racha_usuario) AS racha_total
+                FROM habitos h
+                LEFT JOIN sesiones_diarias d ON h.id = d.habito_id
+                LEFT JOIN rachas r ON r.clave = h.id
+                WHERE h.usuario_id = ?
+                GROUP BY h.id
+                ORDER BY h.id DESC
+            """, (usuario_id, usuario_id))
+
+            habitos = cursor.como(HabitoResumen).fetchall()
+
+        # La racha del usuario viene repetida en cada fila
+        racha_total = (habitos[0].racha_total or 0) if habitos else 0
+        return totalizar_resumen(habitos, racha_total)
+
+    # =================== MÉTODOS DE RECORDATORIOS ===================
+    def actualizar_recordatorio(self, habito_id, activo, hora_inicio=None, hora_fin=None):
+        try:
+            with self.transaccion() as cursor:
+                cursor.execute("""
+                    UPDATE recordatorios
+                    SET activo = ?, hora_inicio = ?, hora_fin = ?
+                    WHERE habito_id = ?
+                """, (activo, hora_inicio, hora_fin, habito_id))
+
+            self.cache.invalidar(('habito', habito_id))
+            return True
+        except Exception as e:
+            print(f"Error actualizando recordatorio: {e}")
+            return False
+
+    def _consultar_recordatorio(self, habito_id):
+        with self.transaccion(escritura=False) as cursor:
+            cursor.execute("""
+                SELECT activo, hora_inicio, hora_fin
+                FROM recordatorios
+                WHERE habito_id = ?
+            """, (habito_id,))
+            return cursor.como(Recordatorio).fetchone()
+
+    # =================== MÉTODOS DE EXPORTACIÓN ===================
+    def recorrer_exportacion(self, tabla, usuario_id=None, tamano_lote=5000):
+        # SQLite ya va leyendo a medida que se piden filas; fetchmany solo
+        # limita cuántas hay en memoria a la vez
+        consulta = sql_exportacion(tabla, usuario_id is not None, "?")
+        with self.transaccion(escritura=False) as cursor:
+            cursor.execute(consulta, (usuario_id,) if usuario_id is not None else ())
+            cursor.row_factory = None  # tuplas, no dicts
+            while True:
+                filas = cursor.fetchmany(tamano_lote)
+                if not filas:
+                    break
+                yield filas
+
+    # =================== MÉTODOS DEL DIARIO LOCAL ===================
+    def aplicar_diario(self, entradas):
+        """Mismo contrato que BaseDatos.aplicar_diario."""
+        sesiones = []
+        ediciones = []
+        for entrada in entradas:
+            datos = entrada['datos']
+            if entrada['tipo'] == 'sesion':
+                sesiones.append((
+                    datos['habito_id'], _a_fecha(datos['fecha']), _a_momento(datos['hora_inicio']),
+                    _a_momento(datos['hora_fin']), datos['duracion_segundos'], datos.get('notas', ''),
+                    entrada['clave'], datos['habito_id'],
+                ))
+            else:
+                ediciones.append(entrada)
+
+        insertadas = 0
+        with self.transaccion() as cursor:
+            if sesiones:
+                insertadas = self._insertar_sesiones(sesiones, cursor, clave=True)
+
+            for entrada in ediciones:
+                datos = entrada['datos']
+                if entrada['tipo'] == 'habito':
+                    categoria_info = MAPEO_CATEGORIAS.get(datos['categoria'], CATEGORIA_POR_DEFECTO)
+                    cursor.execute("""
+                        UPDATE habitos
+                        SET nombre = ?, descripcion = ?, objetivo_diario_minutos = ?,
+                            categoria = ?, icono = ?, color = ?
+                        WHERE id = ?
+                    """, (datos['nombre'], datos['descripcion'], datos['objetivo_minutos'], datos['categoria'],
+                          categoria_info["icono"], categoria_info["color"], datos['habito_id']))
+                elif entrada['tipo'] == 'recordatorio':
+                    cursor.execute("""
+                        UPDATE recordatorios
+                        SET activo = ?, hora_inicio = ?, hora_fin = ?
+                        WHERE habito_id = ?
+                    """, (datos['activo'], datos['hora_inicio'], datos['hora_fin'], datos['habito_id']))
+
+        if entradas:
+            self.cache.limpiar()
+        return insertadas
+
+    def cerrar_conexion(self):
+        super().cerrar_conexion()
+        with self._candado:
+            for conexion in self._conexiones:
+                conexion.close()
+            self._conexiones = []
+        print("Conexión cerrada")
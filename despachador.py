@@ -0,0 +1,96 @@
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+from kivy.properties import NumericProperty, BooleanProperty
+
+import instrumentacion
+
+
+def _con_accion(funcion, accion, *args, **kwargs):
+    with instrumentacion.accion(accion):
+        return funcion(*args, **kwargs)
+
+
+class DespachadorBD(EventDispatcher):
+    """Ejecuta operaciones de BaseDatos en hilos de trabajo para no bloquear
+    el bucle de Kivy, y entrega el resultado en el hilo principal mediante
+    Clock.schedule_once.
+
+    Las peticiones con la misma `clave` que ya están en curso no se vuelven
+    a lanzar: se suman a la que está corriendo y reciben su mismo resultado.
+    """
+
+    pendientes = NumericProperty(0)
+    ocupado = BooleanProperty(False)
+
+    def __init__(self, max_hilos=4, **kwargs):
+        super().__init__(**kwargs)
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="bd")
+        self._en_curso = {}  # clave -> (futuro, [(al_terminar, al_fallar)])
+        self._candado = threading.Lock()
+
+    def on_pendientes(self, instancia, valor):
+        self.ocupado = valor > 0
+
+    def ejecutar(self, funcion, *args, al_terminar=None, al_fallar=None, clave=None, **kwargs):
+        """Lanza funcion(*args, **kwargs) en segundo plano y devuelve su Future.
+
+        al_terminar(resultado) y al_fallar(error) se llaman en el hilo de Kivy.
+        """
+        if instrumentacion.CONFIG_INSTRUMENTACION["activa"]:
+            # Las consultas del hilo de trabajo se anotan con la acción de
+            # la interfaz que las pidió
+            accion = instrumentacion.accion_actual() or instrumentacion.accion_llamante()
+            funcion = partial(_con_accion, funcion, accion)
+
+        with self._candado:
+            if clave is not None and clave in self._en_curso:
+                futuro, receptores = self._en_curso[clave]
+                receptores.append((al_terminar, al_fallar))
+                return futuro
+
+            receptores = [(al_terminar, al_fallar)]
+            futuro = self._ejecutor.submit(funcion, *args, **kwargs)
+            if clave is not None:
+                self._en_curso[clave] = (futuro, receptores)
+
+        self.pendientes += 1
+        futuro.add_done_callback(lambda f: self._al_completar(f, clave, receptores))
+        return futuro
+
+    def esta_cargando(self, clave):
+        with self._candado:
+            return clave in self._en_curso
+
+    def _al_completar(self, futuro, clave, receptores):
+        # Corre en el hilo de trabajo: cerrar la clave aquí para que una
+        # petición posterior lance una consulta nueva
+        with self._candado:
+            if clave is not None:
+                self._en_curso.pop(clave, None)
+        Clock.schedule_once(lambda dt: self._entregar(futuro, receptores))
+
+    def _entregar(self, futuro, receptores):
+        self.pendientes -= 1
+
+        if futuro.cancelled():
+            return
+
+        error = futuro.exception()
+        for al_terminar, al_fallar in receptores:
+            try:
+                if error is None:
+                    if al_terminar:
+                        al_terminar(futuro.result())
+                elif al_fallar:
+                    al_fallar(error)
+                else:
+                    print(f"Error en operación de base de datos: {error}")
+            except Exception as e:
+                print(f"Error procesando resultado: {e}")
+
+    def apagar(self):
+        self._ejecutor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,321 @@
+import copy
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+from almacenamiento import MAPEO_CATEGORIAS, CATEGORIA_POR_DEFECTO, validar_habito, totalizar_resumen
+from registros import Habito, Recordatorio
+
+# Parámetros del vaciado hacia Postgres
+CONFIG_DIARIO = {
+    "tamano_lote": 500,             # entradas por transacción en el servidor
+    "intervalo": 5,                 # segundos entre vaciados con el servidor disponible
+    "espera_maxima": 300,           # tope del reintento exponencial sin servidor
+}
+
+# Fallos de una entrada mal formada al preparar el lote (además de los
+# errores_datos del almacenamiento): tampoco se arreglan reintentando
+RECHAZOS = (KeyError, TypeError, ValueError)
+
+
+class DiarioLocal:
+    """Diario de escrituras en SQLite (solo se añade al final).
+
+    Las sesiones y las ediciones de hábitos y recordatorios se anotan aquí
+    al instante, sin esperar a la red. Un hilo en segundo plano las envía por
+    lotes a Postgres con BaseDatos.aplicar_diario y las borra cuando el
+    servidor confirma. Cada entrada lleva una clave única que viaja como
+    clave de idempotencia: si un lote se aplica pero la confirmación se
+    pierde, reenviarlo no duplica sesiones.
+
+    Si el servidor rechaza un lote por sus datos (errores_datos del
+    almacenamiento), sus entradas se reenvían de una en una y las que se
+    rechazan solas pasan a la tabla `descartadas`, para que una entrada
+    imposible no bloquee a las demás.
+
+    Las lecturas de hábitos y recordatorios pueden pasar por aquí
+    (obtener_resumen_inicio, obtener_habito_por_id, obtener_recordatorio):
+    devuelven lo del almacenamiento con las ediciones aún pendientes encima.
+
+    al_vaciar(aplicadas) se llama desde el hilo del diario tras cada lote
+    confirmado.
+    """
+
+    def __init__(self, ruta, base_datos, al_vaciar=None, tamano_lote=None, intervalo=None,
+                 espera_maxima=None):
+        self.base_datos = base_datos
+        self.al_vaciar = al_vaciar
+        self.tamano_lote = tamano_lote or CONFIG_DIARIO["tamano_lote"]
+        self.intervalo = intervalo or CONFIG_DIARIO["intervalo"]
+        self.espera_maxima = espera_maxima or CONFIG_DIARIO["espera_maxima"]
+
+        # Una sola conexión compartida entre la interfaz y el hilo del diario
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=FULL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS entradas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                clave TEXT UNIQUE NOT NULL,
+                tipo TEXT NOT NULL,
+                datos TEXT NOT NULL,
+                creada TEXT NOT NULL
+            )
+        """)
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS descartadas (
+                id INTEGER PRIMARY KEY,
+                clave TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                datos TEXT NOT NULL,
+                creada TEXT NOT NULL,
+                error TEXT NOT NULL,
+                descartada TEXT NOT NULL
+            )
+        """)
+        self._candado = threading.Lock()
+
+        self._despertar = threading.Event()
+        self._parar = threading.Event()
+        self._hilo = None
+
+    # =================== ANOTACIONES ===================
+    def anotar(self, tipo, datos, clave=None):
+        """Guarda una entrada y despierta al hilo de vaciado. Con la misma
+        clave, la segunda anotación se ignora."""
+        clave = clave or uuid.uuid4().hex
+        with self._candado:
+            self._conexion.execute(
+                "INSERT OR IGNORE INTO entradas (clave, tipo, datos, creada) VALUES (?, ?, ?, ?)",
+                (clave, tipo, json.dumps(datos, default=str), datetime.now().isoformat()),
+            )
+        self._despertar.set()
+        return clave
+
+    def registrar_sesion(self, habito_id, duracion_segundos, hora_inicio=None, hora_fin=None,
+                         notas="", clave=None):
+        hora_inicio = hora_inicio or datetime.now()
+        clave = self.anotar('sesion', {
+            'habito_id': habito_id,
+            # La fecha es la del momento de la sesión, no la del envío
+            'fecha': hora_inicio.date().isoformat(),
+            'hora_inicio': hora_inicio.isoformat(),
+            'hora_fin': hora_fin.isoformat() if hora_fin else None,
+            'duracion_segundos': duracion_segundos,
+            'notas': notas,
+        }, clave)
+        return {'clave': clave, 'habito_id': habito_id, 'duracion_segundos': duracion_segundos}
+
+    def actualizar_habito(self, habito_id, nombre, descripcion="", objetivo_minutos=30, categoria="Salud"):
+        """Anota la edición y devuelve la fila como la dejaría
+        BaseDatos.actualizar_habito, para pintarla sin esperar al servidor.
+        Lanza ValueError (sin anotar nada) si el servidor la rechazaría."""
+        validar_habito(nombre, descripcion, objetivo_minutos, categoria)
+        datos = {
+            'habito_id': habito_id,
+            'nombre': nombre,
+            'descripcion': descripcion,
+            'objetivo_minutos': objetivo_minutos,
+            'categoria': categoria,
+        }
+        self.anotar('habito', datos)
+        return Habito(id=habito_id, **self._campos_habito(datos))
+
+    def actualizar_recordatorio(self, habito_id, activo, hora_inicio=None, hora_fin=None):
+        """Anota el recordatorio. Las horas van como texto HH:MM; con otro
+        formato lanza ValueError sin anotar nada."""
+        for hora in (hora_inicio, hora_fin):
+            _leer_hora(hora)
+        self.anotar('recordatorio', {
+            'habito_id': habito_id,
+            'activo': bool(activo),
+            'hora_inicio': hora_inicio,
+            'hora_fin': hora_fin,
+        })
+        return True
+
+    @staticmethod
+    def _campos_habito(datos):
+        """Campos editables de un Habito a partir de una entrada 'habito'."""
+        categoria_info = MAPEO_CATEGORIAS.get(datos['categoria'], CATEGORIA_POR_DEFECTO)
+        return {
+            'nombre': datos['nombre'],
+            'descripcion': datos['descripcion'],
+            'objetivo_diario_minutos': datos['objetivo_minutos'],
+            'categoria': datos['categoria'],
+            'icono': categoria_info["icono"],
+            'color': categoria_info["color"],
+        }
+
+    def pendientes(self):
+        with self._candado:
+            return self._conexion.execute("SELECT COUNT(*) FROM entradas").fetchone()[0]
+
+    def descartadas(self):
+        """Entradas que el servidor rechazó para siempre, de la más vieja a
+        la más nueva."""
+        with self._candado:
+            filas = self._conexion.execute(
+                "SELECT clave, tipo, datos, error, descartada FROM descartadas ORDER BY id"
+            ).fetchall()
+        return [
+            {'clave': clave, 'tipo': tipo, 'datos': json.loads(datos), 'error': error, 'descartada': descartada}
+            for clave, tipo, datos, error, descartada in filas
+        ]
+
+    # =================== LECTURAS ===================
+    def obtener_resumen_inicio(self, usuario_id):
+        """Almacenamiento.obtener_resumen_inicio con las ediciones pendientes
+        encima (y los totales recalculados con ellas)."""
+        # Las pendientes se leen antes: si un lote se confirma entre medias,
+        # la consulta ya trae lo que se deja de superponer
+        ediciones = self._ediciones_pendientes('habito')
+        resumen = self.base_datos.obtener_resumen_inicio(usuario_id)
+        if not ediciones:
+            return resumen
+        habitos = [self._superponer_habito(habito, ediciones) for habito in resumen['habitos']]
+        return totalizar_resumen(habitos, resumen['racha_total'])
+
+    def obtener_habito_por_id(self, habito_id):
+        ediciones = self._ediciones_pendientes('habito')
+        habito = self.base_datos.obtener_habito_por_id(habito_id)
+        if not habito:
+            return habito
+        return self._superponer_habito(habito, ediciones)
+
+    def obtener_recordatorio(self, habito_id):
+        datos = self._ediciones_pendientes('recordatorio').get(habito_id)
+        if datos is None:
+            return self.base_datos.obtener_recordatorio(habito_id)
+        return Recordatorio(
+            habito_id=habito_id,
+            activo=datos['activo'],
+            hora_inicio=_leer_hora(datos['hora_inicio']),
+            hora_fin=_leer_hora(datos['hora_fin']),
+        )
+
+    def _ediciones_pendientes(self, tipo):
+        """{habito_id: datos} de la última entrada pendiente de ese tipo
+        para cada hábito."""
+        with self._candado:
+            filas = self._conexion.execute(
+                "SELECT datos FROM entradas WHERE tipo = ? ORDER BY id", (tipo,)
+            ).fetchall()
+        ediciones = {}
+        for (datos,) in filas:
+            datos = json.loads(datos)
+            ediciones[datos['habito_id']] = datos
+        return ediciones
+
+    def _superponer_habito(self, habito, ediciones):
+        datos = ediciones.get(habito['id'])
+        if datos is None:
+            return habito
+        # Copia: el registro original puede estar en la caché
+        habito = copy.copy(habito)
+        habito.update(self._campos_habito(datos))
+        return habito
+
+    # =================== VACIADO ===================
+    def vaciar(self):
+        """Envía todo lo pendiente, lote a lote. Lanza la excepción del
+        servidor si falla; lo no confirmado se queda en el diario."""
+        enviadas = 0
+        while True:
+            with self._candado:
+                filas = self._conexion.execute(
+                    "SELECT id, clave, tipo, datos FROM entradas ORDER BY id LIMIT ?",
+                    (self.tamano_lote,),
+                ).fetchall()
+            if not filas:
+                return enviadas
+
+            try:
+                self.base_datos.aplicar_diario([self._entrada(fila) for fila in filas])
+            except Exception as e:
+                if not isinstance(e, self._rechazos()):
+                    raise
+                # Alguna entrada no entra: se separa de las demás
+                print(f"Lote del diario rechazado, se envía entrada a entrada: {e}")
+                for fila in filas:
+                    self._enviar_sola(fila)
+            else:
+                with self._candado:
+                    self._conexion.execute("DELETE FROM entradas WHERE id <= ?", (filas[-1][0],))
+            enviadas += len(filas)
+
+            if self.al_vaciar:
+                self.al_vaciar(len(filas))
+
+    @staticmethod
+    def _entrada(fila):
+        _, clave, tipo, datos = fila
+        return {'clave': clave, 'tipo': tipo, 'datos': json.loads(datos)}
+
+    def _rechazos(self):
+        # Con AlmacenamientoDiferido aún sin crear, el atributo no es una tupla
+        errores = getattr(self.base_datos, 'errores_datos', ())
+        return RECHAZOS + (errores if isinstance(errores, tuple) else ())
+
+    def _enviar_sola(self, fila):
+        """Reenvía una entrada sola; si también se rechaza, la descarta.
+        Los errores de conexión se relanzan y la entrada sigue pendiente."""
+        try:
+            self.base_datos.aplicar_diario([self._entrada(fila)])
+        except Exception as e:
+            if not isinstance(e, self._rechazos()):
+                raise
+            print(f"Entrada del diario descartada ({fila[2]} {fila[1]}): {e}")
+            with self._candado:
+                self._conexion.execute("BEGIN")
+                with self._conexion:
+                    self._conexion.execute("""
+                        INSERT OR REPLACE INTO descartadas (id, clave, tipo, datos, creada, error, descartada)
+                        SELECT id, clave, tipo, datos, creada, ?, ? FROM entradas WHERE id = ?
+                    """, (f"{type(e).__name__}: {e}", datetime.now().isoformat(), fila[0]))
+                    self._conexion.execute("DELETE FROM entradas WHERE id = ?", (fila[0],))
+        else:
+            with self._candado:
+                self._conexion.execute("DELETE FROM entradas WHERE id = ?", (fila[0],))
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="diario", daemon=True)
+            self._hilo.start()
+
+    def _bucle(self):
+        espera = self.intervalo
+        while not self._parar.is_set():
+            try:
+                self.vaciar()
+                espera = self.intervalo
+            except Exception as e:
+                # Servidor caído o lote rechazado: se reintenta cada vez más tarde
+                espera = min(espera * 2, self.espera_maxima)
+                print(f"Diario sin enviar, se reintentará en {espera}s: {e}")
+
+            self._despertar.wait(espera)
+            self._despertar.clear()
+
+    def cerrar(self, espera=2):
+        """Para el hilo. Lo que no se haya enviado sigue en el archivo y sale
+        en el próximo arranque."""
+        self._parar.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(espera)
+            self._hilo = None
+        with self._candado:
+            self._conexion.close()
+
+
+def _leer_hora(valor):
+    """Hora HH:MM como time (None si no hay); ValueError si no lo es."""
+    if valor in (None, ""):
+        return None
+    try:
+        return datetime.strptime(valor, "%H:%M").time()
+    except TypeError:
+        raise ValueError(f"Hora no válida: {valor!r}")
@@ -0,0 +1,137 @@
+"""Exportación completa de hábitos y sesiones a CSV, JSON Lines o Parquet.
+
+Las filas salen del almacenamiento por lotes (recorrer_exportacion: cursor
+con nombre en Postgres) y cada escritor las va volcando según llegan, así
+que la memoria es la misma para mil filas que para cien millones. Sirve
+para un usuario o para toda la base de datos.
+
+    python exportacion.py --usuario 42 --formato csv --salida exportaciones/
+    python exportacion.py --formato parquet --salida /copias/habitos
+
+Parquet necesita pyarrow, que no es dependencia de la aplicación: se
+importa solo al elegir ese formato.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+from almacenamiento import crear_almacenamiento, COLUMNAS_EXPORTACION
+
+TAMANO_LOTE = 5000
+
+
+# =================== ESCRITORES ===================
+def escribir_csv(ruta, tabla, lotes):
+    filas = 0
+    with open(ruta, "w", newline="", encoding="utf-8") as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(COLUMNAS_EXPORTACION[tabla])
+        for lote in lotes:
+            escritor.writerows(lote)
+            filas += len(lote)
+    return filas
+
+
+def _valor_json(valor):
+    # Fechas y horas en ISO 8601; Decimal y el resto, como texto
+    return valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+
+
+def escribir_jsonl(ruta, tabla, lotes):
+    columnas = COLUMNAS_EXPORTACION[tabla]
+    filas = 0
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        for lote in lotes:
+            archivo.writelines(
+                json.dumps(dict(zip(columnas, fila)), default=_valor_json, ensure_ascii=False) + "\n"
+                for fila in lote
+            )
+            filas += len(lote)
+    return filas
+
+
+def _esquema_parquet(tabla):
+    import pyarrow as pa
+
+    tipos = {
+        "id": pa.int64(), "usuario_id": pa.int64(), "habito_id": pa.int64(),
+        "objetivo_diario_minutos": pa.int64(), "duracion_segundos": pa.int64(),
+        "fecha": pa.date32(), "fecha_creacion": pa.timestamp("us"),
+        "hora_inicio": pa.timestamp("us"), "hora_fin": pa.timestamp("us"),
+        "completada": pa.bool_(),
+    }
+    # Tipos fijos: inferirlos del primer lote falla si una columna empieza en NULL
+    return pa.schema([(columna, tipos.get(columna, pa.string())) for columna in COLUMNAS_EXPORTACION[tabla]])
+
+
+def escribir_parquet(ruta, tabla, lotes):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("La exportación a Parquet necesita pyarrow (pip install pyarrow)")
+
+    esquema = _esquema_parquet(tabla)
+    filas = 0
+    # Un grupo de filas por lote: el archivo se escribe sin tenerlo entero
+    with pq.ParquetWriter(ruta, esquema) as escritor:
+        for lote in lotes:
+            columnas = list(zip(*lote))
+            escritor.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+                schema=esquema,
+            ))
+            filas += len(lote)
+    return filas
+
+
+ESCRITORES = {
+    "csv": escribir_csv,
+    "jsonl": escribir_jsonl,
+    "parquet": escribir_parquet,
+}
+
+
+# =================== EXPORTACIÓN ===================
+def exportar(base_datos, directorio, formato="csv", usuario_id=None, tamano_lote=TAMANO_LOTE):
+    """Escribe un archivo por tabla (habitos.csv, sesiones.csv...) en
+    `directorio`. Sin usuario_id exporta toda la base de datos. Devuelve
+    {tabla: {filas, segundos, ruta}}."""
+    escribir = ESCRITORES[formato]
+    os.makedirs(directorio, exist_ok=True)
+
+    reporte = {}
+    for tabla in COLUMNAS_EXPORTACION:
+        ruta = os.path.join(directorio, f"{tabla}.{formato}")
+        inicio = time.perf_counter()
+        filas = escribir(ruta, tabla, base_datos.recorrer_exportacion(tabla, usuario_id, tamano_lote))
+        reporte[tabla] = {
+            "filas": filas,
+            "segundos": round(time.perf_counter() - inicio, 3),
+            "ruta": ruta,
+        }
+        print(f"Exportadas {filas} filas de {tabla} a {ruta}")
+    return reporte
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--formato", choices=sorted(ESCRITORES), default="csv")
+    parser.add_argument("--usuario", type=int, help="id del usuario; sin él, toda la base de datos")
+    parser.add_argument("--salida", default="exportacion")
+    parser.add_argument("--tamano-lote", type=int, default=TAMANO_LOTE)
+    parser.add_argument("--motor", help="postgres o sqlite (por defecto, el configurado)")
+    parser.add_argument("--ruta-sqlite")
+    args = parser.parse_args()
+
+    base_datos = crear_almacenamiento(args.motor, args.ruta_sqlite, config_hash={"procesos": 0})
+    try:
+        exportar(base_datos, args.salida, args.formato, args.usuario, args.tamano_lote)
+    finally:
+        base_datos.cerrar_conexion()
+
+
+if __name__ == "__main__":
+    main()
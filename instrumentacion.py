@@ -0,0 +1,186 @@
+"""Registro de las consultas SQL que lanza la aplicación.
+
+Con la instrumentación activa (HABITOS_INSTRUMENTAR=1 o
+CONFIG_INSTRUMENTACION["activa"]) los motores usan un cursor que anota cada
+sentencia con su latencia, las filas afectadas, el método de Almacenamiento
+que la lanzó y la acción de interfaz en curso (p. ej.
+"InicioScreen.on_pre_enter"). El despachador propaga la acción al hilo de
+trabajo que hace la consulta.
+
+Las consultas más lentas que el umbral se imprimen al momento; volcar()
+imprime el resumen por acción. En pruebas:
+
+    with registro.presupuesto(2, "abrir detalle"):
+        bd.obtener_habito_por_id(habito_id)
+        bd.obtener_recordatorio(habito_id)
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from almacenamiento import Almacenamiento
+
+CONFIG_INSTRUMENTACION = {
+    "activa": os.environ.get("HABITOS_INSTRUMENTAR") == "1",
+    "umbral_lento_ms": 100,         # a partir de aquí se imprime la consulta
+    "recientes": 1000,              # consultas que se guardan con detalle
+}
+
+SIN_ACCION = "(sin acción)"
+
+_local = threading.local()
+
+
+class PresupuestoExcedido(AssertionError):
+    """Una acción lanzó más consultas de las permitidas."""
+
+
+# =================== ACCIONES ===================
+def accion_actual():
+    return getattr(_local, "accion", None)
+
+
+@contextmanager
+def accion(nombre):
+    """Agrupa bajo `nombre` las consultas de este hilo mientras dure."""
+    anterior = accion_actual()
+    _local.accion = nombre
+    try:
+        yield
+    finally:
+        _local.accion = anterior
+
+
+def accion_llamante(profundidad=1):
+    """Nombre "Clase.metodo" de quien llama, subiendo por la pila mientras
+    sea el mismo objeto: load_habits llamado desde on_pre_enter se anota
+    como InicioScreen.on_pre_enter."""
+    marco = sys._getframe(profundidad + 1)
+    objeto = marco.f_locals.get("self")
+    if objeto is None:
+        return marco.f_code.co_name
+
+    nombre = marco.f_code.co_name
+    marco = marco.f_back
+    while marco is not None:
+        if marco.f_locals.get("self") is objeto:
+            nombre = marco.f_code.co_name
+        marco = marco.f_back
+    return f"{type(objeto).__name__}.{nombre}"
+
+
+def _metodo_almacenamiento():
+    # El método de Almacenamiento más externo de la pila: el público
+    # (obtener_habito_por_id), no el _consultar_* que hace la consulta
+    metodo = None
+    marco = sys._getframe(2)
+    while marco is not None:
+        nombre = marco.f_code.co_name
+        if not nombre.startswith(("<", "__")) and isinstance(marco.f_locals.get("self"), Almacenamiento):
+            metodo = nombre
+        marco = marco.f_back
+    return metodo
+
+
+# =================== REGISTRO ===================
+class RegistroConsultas:
+    def __init__(self, umbral_lento_ms=None, recientes=None):
+        self.umbral_lento_ms = (CONFIG_INSTRUMENTACION["umbral_lento_ms"]
+                                if umbral_lento_ms is None else umbral_lento_ms)
+        self.recientes = deque(maxlen=recientes or CONFIG_INSTRUMENTACION["recientes"])
+        self._acciones = {}  # acción -> totales
+        self._candado = threading.Lock()
+
+    def registrar(self, sentencia, milisegundos, filas):
+        if isinstance(sentencia, bytes):
+            sentencia = sentencia.decode("utf-8", "replace")
+        sentencia = " ".join(sentencia.split())
+        consulta = {
+            "sentencia": sentencia,
+            "ms": milisegundos,
+            "filas": filas if filas is not None and filas >= 0 else None,
+            "metodo": _metodo_almacenamiento(),
+            "accion": accion_actual() or SIN_ACCION,
+        }
+
+        with self._candado:
+            self.recientes.append(consulta)
+            totales = self._acciones.setdefault(consulta["accion"], {
+                "consultas": 0, "ms": 0.0, "maximo_ms": 0.0, "metodos": Counter(),
+            })
+            totales["consultas"] += 1
+            totales["ms"] += milisegundos
+            totales["maximo_ms"] = max(totales["maximo_ms"], milisegundos)
+            totales["metodos"][consulta["metodo"] or "?"] += 1
+
+        if milisegundos >= self.umbral_lento_ms:
+            print(f"Consulta lenta ({milisegundos:.1f} ms) en {consulta['metodo']} "
+                  f"[{consulta['accion']}]: {sentencia[:200]}")
+
+    def contar(self, nombre_accion=None):
+        with self._candado:
+            if nombre_accion is None:
+                return sum(totales["consultas"] for totales in self._acciones.values())
+            totales = self._acciones.get(nombre_accion)
+            return totales["consultas"] if totales else 0
+
+    @contextmanager
+    def presupuesto(self, maximo, nombre_accion="presupuesto"):
+        """Falla con PresupuestoExcedido si el bloque lanza más de `maximo`
+        consultas."""
+        antes = self.contar(nombre_accion)
+        with accion(nombre_accion):
+            yield
+        usadas = self.contar(nombre_accion) - antes
+        if usadas > maximo:
+            raise PresupuestoExcedido(f"{nombre_accion}: {usadas} consultas (máximo {maximo})")
+
+    def resumen(self):
+        """{acción: {consultas, ms, maximo_ms, metodos}} ordenado por tiempo total."""
+        with self._candado:
+            return {
+                nombre: {**totales, "metodos": dict(totales["metodos"])}
+                for nombre, totales in sorted(self._acciones.items(), key=lambda par: -par[1]["ms"])
+            }
+
+    def volcar(self):
+        lineas = ["Consultas por acción:"]
+        for nombre, totales in self.resumen().items():
+            lineas.append(f"  {nombre:<40} {totales['consultas']:6d} consultas "
+                          f"{totales['ms']:9.1f} ms (máx {totales['maximo_ms']:.1f})")
+            for metodo, cantidad in sorted(totales["metodos"].items(), key=lambda par: -par[1]):
+                lineas.append(f"      {metodo:<36} {cantidad:6d}")
+        print("\n".join(lineas))
+
+    def limpiar(self):
+        with self._candado:
+            self.recientes.clear()
+            self._acciones.clear()
+
+
+# Registro único de la aplicación
+registro = RegistroConsultas()
+
+
+class ConsultasMedidas:
+    """Mezcla para cursores: mide execute/executemany y lo anota en el
+    registro. Cada motor la combina con su clase de cursor."""
+
+    def _medir(self, sentencia, ejecutar):
+        inicio = time.perf_counter()
+        try:
+            return ejecutar()
+        finally:
+            registro.registrar(sentencia, (time.perf_counter() - inicio) * 1000, self.rowcount)
+
+    def execute(self, sentencia, parametros=None):
+        # sqlite3 no acepta parametros=None
+        if parametros is None:
+            return self._medir(sentencia, lambda: super(ConsultasMedidas, self).execute(sentencia))
+        return self._medir(sentencia, lambda: super(ConsultasMedidas, self).execute(sentencia, parametros))
+
+    def executemany(self, sentencia, lista_parametros):
+        return self._medir(sentencia, lambda: super(ConsultasMedidas, self).executemany(sentencia, lista_parametros))
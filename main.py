@@ -1,34 +1,120 @@
-from kivy.lang import Builder
-from kivymd.app import MDApp
-from kivy.core.window import Window
-from kivy.uix.screenmanager import ScreenManager, SlideTransition
-from kivy.core.text import LabelBase
-import os
+import perfil_arranque
 
-from database import BaseDatos
-from screens.login_screen import LoginScreen
-from screens.registro_screen import RegisterScreen
-from screens.inicio_screen import InicioScreen
-from screens.detalle_habito_screen import DetalleHabitoScreen  # NUEVO NOMBRE
+with perfil_arranque.medir("imports"):
+    import importlib
+    import os
+    from functools import partial
+
+    from kivy.lang import Builder
+    from kivymd.app import MDApp
+    from kivy.core.window import Window
+    from kivy.uix.screenmanager import ScreenManager, SlideTransition
+    from kivy.core.text import LabelBase
+    from kivy.clock import Clock
+
+    from almacenamiento import crear_almacenamiento, AlmacenamientoDiferido
+    from despachador import DespachadorBD
+    from temporizadores import GestorTemporizadores
+    from diario import DiarioLocal
+    from instrumentacion import registro, CONFIG_INSTRUMENTACION
 
 Window.size = (360, 640)
 
+# Pantallas: nombre -> (módulo, clase, archivo KV). Solo la de login se
+# construye al arrancar; el resto, con su KV, la primera vez que se visita.
+PANTALLAS = {
+    'login': ('screens.login_screen', 'LoginScreen', 'screens/login_screen.kv'),
+    'registro': ('screens.registro_screen', 'RegisterScreen', 'screens/registro_screen.kv'),
+    'inicio': ('screens.inicio_screen', 'InicioScreen', 'screens/inicio_screen.kv'),
+    'detalle_habito': ('screens.detalle_habito_screen', 'DetalleHabitoScreen', 'screens/detalle_habito_screen.kv'),
+}
+
+
+class GestorPantallasDiferido(ScreenManager):
+    """ScreenManager que construye cada pantalla al pedirla por primera vez
+    (current = ..., get_screen(...)), cargando antes su módulo y su KV."""
+
+    def __init__(self, app, pantallas, **kwargs):
+        super().__init__(**kwargs)
+        self.app = app
+        self.pendientes = dict(pantallas)
+
+    def construir(self, nombre):
+        modulo, clase, archivo_kv = self.pendientes.pop(nombre)
+        with perfil_arranque.medir(f"imports {nombre}"):
+            clase_pantalla = getattr(importlib.import_module(modulo), clase)
+        with perfil_arranque.medir(f"KV {nombre}"):
+            Builder.load_file(archivo_kv)
+        with perfil_arranque.medir(f"pantalla {nombre}"):
+            pantalla = clase_pantalla(name=nombre)
+            pantalla.app = self.app
+            self.add_widget(pantalla)
+        return pantalla
+
+    def get_screen(self, name):
+        if name in self.pendientes:
+            return self.construir(name)
+        return super().get_screen(name)
+
+    def has_screen(self, name):
+        return name in self.pendientes or super().has_screen(name)
+
 class HabitTrackerApp(MDApp):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         
-        try:
-            self.base_datos = BaseDatos()
-            print("Base de datos conectada")
-        except Exception as e:
-            print(f" No se pudo conectar a la base de datos: {e}")
-            exit(1)
+        # Postgres o SQLite según CONFIG_ALMACENAMIENTO / HABITOS_MOTOR. Se
+        # conecta en otro hilo mientras se abre la ventana; las consultas que
+        # lleguen antes esperan en el despachador, no en la interfaz
+        ruta_sqlite = os.path.join(self.user_data_dir, "habitos.sqlite3")
+        
+        def conectar():
+            with perfil_arranque.medir("conexión BD"):
+                return crear_almacenamiento(ruta_sqlite=ruta_sqlite)
+        
+        self.arranque_pendiente = {'primer frame', 'conexión BD'}
+        self.base_datos = AlmacenamientoDiferido(
+            conectar,
+            al_listo=lambda error: Clock.schedule_once(lambda dt: self.almacenamiento_listo(error))
+        )
+        
+        # Las consultas corren fuera del hilo de la interfaz
+        self.despachador = DespachadorBD()
         
         self.usuario_actual = None
         self.habito_seleccionado = None
-        self.gestor_pantallas = ScreenManager()
+        self.gestor_pantallas = GestorPantallasDiferido(self, PANTALLAS)
     
     def build(self):
+        with perfil_arranque.medir("fuente"):
+            self.registrar_fuente()
+        
+        self.theme_cls.theme_style = "Dark"
+        self.theme_cls.primary_palette = "Teal"
+        
+        # Sesiones y ediciones se anotan en local y se envían en segundo plano
+        self.diario = DiarioLocal(
+            os.path.join(self.user_data_dir, "diario.sqlite3"),
+            self.base_datos,
+            al_vaciar=lambda aplicadas: Clock.schedule_once(lambda dt: self.datos_sincronizados())
+        )
+        
+        # Temporizadores de sesión; sobreviven a un cierre inesperado
+        self.temporizadores = GestorTemporizadores(
+            os.path.join(self.user_data_dir, "temporizadores.json"),
+            guardar=self.guardar_sesion_temporizador
+        )
+        
+        # F12 imprime las consultas por acción de la interfaz
+        if CONFIG_INSTRUMENTACION["activa"]:
+            Window.bind(on_key_down=self.tecla_pulsada)
+        
+        # Solo la primera pantalla; las demás se construyen al visitarlas
+        self.gestor_pantallas.current = 'login'
+        
+        return self.gestor_pantallas
+    
+    def registrar_fuente(self):
         # REGISTRAR FUENTE DE ICONOS
         try:
             ruta_actual = os.path.dirname(os.path.abspath(__file__))
@@ -42,34 +128,45 @@ class HabitTrackerApp(MDApp):
                 # Usar iconos de texto si no hay fuente
         except Exception as e:
             print(f"Error al registrar fuente: {e}")
-        
-        self.theme_cls.theme_style = "Dark"
-        self.theme_cls.primary_palette = "Teal"
-        
-        self.cargar_archivos_kv()
-        
-        pantalla_login = LoginScreen(name='login')
-        pantalla_registro = RegisterScreen(name='registro')
-        pantalla_inicio = InicioScreen(name='inicio')
-        pantalla_detalle = DetalleHabitoScreen(name='detalle_habito')  # NUEVO NOMBRE
-        
-        pantalla_login.app = self
-        pantalla_registro.app = self
-        pantalla_inicio.app = self
-        pantalla_detalle.app = self
-        
-        self.gestor_pantallas.add_widget(pantalla_login)
-        self.gestor_pantallas.add_widget(pantalla_registro)
-        self.gestor_pantallas.add_widget(pantalla_inicio)
-        self.gestor_pantallas.add_widget(pantalla_detalle)
-        
-        return self.gestor_pantallas
     
-    def cargar_archivos_kv(self):
-        Builder.load_file('screens/login_screen.kv')
-        Builder.load_file('screens/registro_screen.kv')
-        Builder.load_file('screens/inicio_screen.kv')
-        Builder.load_file('screens/detalle_habito_screen.kv')  # CARGAR EL NUEVO KV
+    def tecla_pulsada(self, ventana, tecla, *args):
+        if tecla == 293:  # F12
+            registro.volcar()
+    
+    def on_start(self):
+        self.diario.iniciar()
+        self.temporizadores.recuperar()
+        Clock.schedule_once(lambda dt: self.etapa_arranque('primer frame'))
+    
+    def almacenamiento_listo(self, error):
+        if error is not None:
+            print(f" No se pudo conectar a la base de datos: {error}")
+        self.etapa_arranque('conexión BD')
+    
+    def etapa_arranque(self, etapa):
+        """El informe de arranque sale cuando hay ventana y base de datos"""
+        if etapa == 'primer frame':
+            perfil_arranque.marcar(etapa)
+        self.arranque_pendiente.discard(etapa)
+        if not self.arranque_pendiente:
+            perfil_arranque.informe()
+    
+    def guardar_sesion_temporizador(self, habito_id, duracion_segundos, hora_inicio, hora_fin, al_terminar):
+        # La clave sale del temporizador: si se reintenta tras un cierre, no se
+        # duplica. La anotación (con fsync) va fuera del hilo de la interfaz
+        registrar = partial(self.diario.registrar_sesion,
+                            clave=f"temporizador:{habito_id}:{hora_inicio.isoformat()}")
+        self.despachador.ejecutar(
+            registrar, habito_id, duracion_segundos, hora_inicio, hora_fin,
+            al_terminar=al_terminar,
+            al_fallar=lambda error: al_terminar(None)
+        )
+    
+    def datos_sincronizados(self):
+        """El diario envió datos al servidor: la pantalla visible se refresca"""
+        pantalla = self.gestor_pantallas.current_screen
+        if pantalla is not None and hasattr(pantalla, 'datos_sincronizados'):
+            pantalla.datos_sincronizados()
     
     def cambiar_pantalla(self, nombre_pantalla, direccion='left'):
         self.gestor_pantallas.transition = SlideTransition(direction=direccion)
@@ -81,8 +178,16 @@ class HabitTrackerApp(MDApp):
         self.cambiar_pantalla('login', direccion='right')
     
     def on_stop(self):
+        if hasattr(self, 'temporizadores'):
+            self.temporizadores.apagar()
+        if hasattr(self, 'diario'):
+            self.diario.cerrar()
+        if hasattr(self, 'despachador'):
+            self.despachador.apagar()
         if hasattr(self, 'base_datos'):
             self.base_datos.cerrar_conexion()
+        if CONFIG_INSTRUMENTACION["activa"]:
+            registro.volcar()
         return super().on_stop()
 
 if __name__ == '__main__':
@@ -0,0 +1,306 @@
+import psycopg2
+from psycopg2 import errors
+
+# Cada migración es (versión, descripción, [sentencias]). Se aplican en orden,
+# una transacción por migración, y nunca se editan una vez publicadas:
+# los cambios nuevos van en una migración nueva al final de la lista.
+MIGRACIONES = [
+    (1, "Esquema inicial", [
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id SERIAL PRIMARY KEY,
+            nombre_usuario VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            contrasena VARCHAR(255) NOT NULL,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS habitos (
+            id SERIAL PRIMARY KEY,
+            usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            nombre VARCHAR(100) NOT NULL,
+            descripcion TEXT,
+            objetivo_diario_minutos INTEGER DEFAULT 30,
+            categoria VARCHAR(50) DEFAULT 'Salud',
+            icono VARCHAR(50) DEFAULT 'run',
+            color VARCHAR(20) DEFAULT '#3b82f6',
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sesiones (
+            id SERIAL PRIMARY KEY,
+            habito_id INTEGER NOT NULL REFERENCES habitos(id) ON DELETE CASCADE,
+            fecha DATE NOT NULL DEFAULT CURRENT_DATE,
+            hora_inicio TIMESTAMP,
+            hora_fin TIMESTAMP,
+            duracion_segundos INTEGER NOT NULL,
+            completada BOOLEAN DEFAULT TRUE,
+            notas TEXT,
+            UNIQUE(habito_id, fecha, hora_inicio)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS recordatorios (
+            id SERIAL PRIMARY KEY,
+            habito_id INTEGER NOT NULL REFERENCES habitos(id) ON DELETE CASCADE,
+            activo BOOLEAN DEFAULT FALSE,
+            hora_inicio TIME,
+            hora_fin TIME
+        )
+        """,
+    ]),
+
+    (2, "Acumulado diario de sesiones", [
+        """
+        CREATE TABLE IF NOT EXISTS sesiones_diarias (
+            habito_id INTEGER NOT NULL REFERENCES habitos(id) ON DELETE CASCADE,
+            fecha DATE NOT NULL,
+            total_segundos INTEGER NOT NULL DEFAULT 0,
+            total_sesiones INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (habito_id, fecha)
+        )
+        """,
+        # Solo rellena si el acumulado está vacío (instalaciones previas a
+        # las migraciones ya pueden tenerlo al día)
+        """
+        INSERT INTO sesiones_diarias (habito_id, fecha, total_segundos, total_sesiones)
+        SELECT habito_id, fecha, SUM(duracion_segundos), COUNT(*)
+        FROM sesiones
+        WHERE NOT EXISTS (SELECT 1 FROM sesiones_diarias)
+        GROUP BY habito_id, fecha
+        """,
+    ]),
+
+    (3, "Índices para las rutas de acceso reales", [
+        # Duplicaba el índice que ya crea la restricción UNIQUE(email)
+        "DROP INDEX IF EXISTS idx_usuarios_email",
+        # Hábitos del usuario ordenados por id DESC
+        "DROP INDEX IF EXISTS idx_habitos_usuario",
+        "CREATE INDEX idx_habitos_usuario ON habitos (usuario_id, id DESC)",
+        # Historial de un hábito: habito_id + fecha DESC sin visitar la tabla
+        """
+        CREATE INDEX IF NOT EXISTS idx_sesiones_habito_fecha
+        ON sesiones (habito_id, fecha DESC)
+        INCLUDE (duracion_segundos, hora_inicio, hora_fin)
+        """,
+        # Estadísticas: minutos de hoy, totales y rachas en index-only scan
+        """
+        CREATE INDEX IF NOT EXISTS idx_sesiones_diarias_cubre
+        ON sesiones_diarias (habito_id, fecha)
+        INCLUDE (total_segundos, total_sesiones)
+        """,
+        # Búsqueda por hábito y borrado en cascada desde habitos
+        """
+        CREATE INDEX IF NOT EXISTS idx_recordatorios_habito
+        ON recordatorios (habito_id)
+        INCLUDE (activo, hora_inicio, hora_fin)
+        """,
+    ]),
+
+    (4, "Clave de idempotencia para sesiones enviadas desde el diario local", [
+        # Permite reenviar un lote sin duplicar sesiones; NULL en las demás
+        "ALTER TABLE sesiones ADD COLUMN IF NOT EXISTS clave_idempotencia TEXT UNIQUE",
+    ]),
+
+    (5, "Orden total del historial de sesiones para paginar por clave", [
+        # Las sesiones antiguas sin hora_inicio toman la medianoche de su
+        # fecha, desplazadas un microsegundo cada una para no chocar con
+        # UNIQUE(habito_id, fecha, hora_inicio)
+        """
+        UPDATE sesiones s
+        SET hora_inicio = s.fecha + n.orden * INTERVAL '1 microsecond'
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY habito_id, fecha ORDER BY id) - 1 AS orden
+            FROM sesiones
+            WHERE hora_inicio IS NULL
+        ) n
+        WHERE s.id = n.id
+        """,
+        "ALTER TABLE sesiones ALTER COLUMN hora_inicio SET DEFAULT LOCALTIMESTAMP",
+        "ALTER TABLE sesiones ALTER COLUMN hora_inicio SET NOT NULL",
+        # (habito_id, fecha, hora_inicio, id) en el orden del historial: cada
+        # página es un recorrido del índice desde la última fila vista
+        """
+        CREATE INDEX IF NOT EXISTS idx_sesiones_historial
+        ON sesiones (habito_id, fecha DESC, hora_inicio DESC, id DESC)
+        INCLUDE (duracion_segundos, hora_fin)
+        """,
+        # Mismo prefijo: el nuevo índice lo sustituye
+        "DROP INDEX IF EXISTS idx_sesiones_habito_fecha",
+    ]),
+
+    (6, "Sesiones particionadas por mes", [
+        # La tabla se reconstruye: Postgres no convierte una tabla normal en
+        # particionada. Las restricciones de la antigua se quitan para que
+        # la nueva pueda usar sus nombres; la secuencia de id se conserva.
+        "ALTER TABLE sesiones RENAME TO sesiones_antigua",
+        "ALTER SEQUENCE sesiones_id_seq OWNED BY NONE",
+        """
+        ALTER TABLE sesiones_antigua
+            DROP CONSTRAINT IF EXISTS sesiones_pkey,
+            DROP CONSTRAINT IF EXISTS sesiones_habito_id_fecha_hora_inicio_key,
+            DROP CONSTRAINT IF EXISTS sesiones_clave_idempotencia_key
+        """,
+        "DROP INDEX IF EXISTS idx_sesiones_historial",
+        # Toda restricción única debe incluir la clave de partición: la
+        # clave primaria pasa a (id, fecha) y la de idempotencia a
+        # (clave_idempotencia, fecha). Una entrada del diario reenviada
+        # trae la misma fecha, así que sigue sin duplicarse.
+        """
+        CREATE TABLE sesiones (
+            id INTEGER NOT NULL DEFAULT nextval('sesiones_id_seq'),
+            habito_id INTEGER NOT NULL REFERENCES habitos(id) ON DELETE CASCADE,
+            fecha DATE NOT NULL DEFAULT CURRENT_DATE,
+            hora_inicio TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+            hora_fin TIMESTAMP,
+            duracion_segundos INTEGER NOT NULL,
+            completada BOOLEAN DEFAULT TRUE,
+            notas TEXT,
+            clave_idempotencia TEXT,
+            PRIMARY KEY (id, fecha),
+            UNIQUE (habito_id, fecha, hora_inicio),
+            UNIQUE (clave_idempotencia, fecha)
+        ) PARTITION BY RANGE (fecha)
+        """,
+        "ALTER SEQUENCE sesiones_id_seq OWNED BY sesiones.id",
+        """
+        CREATE INDEX idx_sesiones_historial
+        ON sesiones (habito_id, fecha DESC, hora_inicio DESC, id DESC)
+        INCLUDE (duracion_segundos, hora_fin)
+        """,
+        # Red de seguridad: una fecha sin partición (importaciones muy
+        # antiguas o muy futuras) cae aquí en vez de fallar
+        "CREATE TABLE sesiones_default PARTITION OF sesiones DEFAULT",
+        # Crea las particiones mensuales (sesiones_AAAA_MM) que falten entre
+        # dos fechas. Si la partición por defecto tiene filas de ese mes, se
+        # pasan a la nueva antes de enlazarla.
+        """
+        CREATE OR REPLACE FUNCTION crear_particiones_sesiones(desde DATE, hasta DATE)
+        RETURNS INTEGER AS $$
+        DECLARE
+            mes DATE := date_trunc('month', desde)::date;
+            nombre TEXT;
+            creadas INTEGER := 0;
+        BEGIN
+            WHILE mes <= hasta LOOP
+                nombre := 'sesiones_' || to_char(mes, 'YYYY_MM');
+                IF to_regclass(nombre) IS NULL THEN
+                    EXECUTE format('CREATE TABLE %I (LIKE sesiones)', nombre);
+                    EXECUTE format(
+                        'WITH movidas AS (DELETE FROM sesiones_default WHERE fecha >= %L AND fecha < %L RETURNING *) '
+                        'INSERT INTO %I SELECT * FROM movidas',
+                        mes, (mes + INTERVAL '1 month')::date, nombre);
+                    EXECUTE format('ALTER TABLE sesiones ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                   nombre, mes, (mes + INTERVAL '1 month')::date);
+                    creadas := creadas + 1;
+                END IF;
+                mes := (mes + INTERVAL '1 month')::date;
+            END LOOP;
+            RETURN creadas;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Separa las particiones mensuales que terminan antes de `antes_de`
+        # y las mueve al esquema archivo. Sus totales siguen en
+        # sesiones_diarias, así que estadísticas y rachas no cambian.
+        "CREATE SCHEMA IF NOT EXISTS archivo",
+        """
+        CREATE OR REPLACE FUNCTION archivar_particiones_sesiones(antes_de DATE)
+        RETURNS SETOF TEXT AS $$
+        DECLARE
+            particion RECORD;
+        BEGIN
+            FOR particion IN
+                SELECT hija.relname AS nombre
+                FROM pg_inherits i
+                JOIN pg_class hija ON hija.oid = i.inhrelid
+                WHERE i.inhparent = 'sesiones'::regclass
+                  AND hija.relname ~ '^sesiones_[0-9]{4}_[0-9]{2}$'
+                  AND to_date(substr(hija.relname, 10), 'YYYY_MM') + INTERVAL '1 month' <= antes_de
+                ORDER BY hija.relname
+            LOOP
+                EXECUTE format('ALTER TABLE sesiones DETACH PARTITION %I', particion.nombre);
+                EXECUTE format('ALTER TABLE %I SET SCHEMA archivo', particion.nombre);
+                RETURN NEXT particion.nombre;
+            END LOOP;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Particiones para todo el histórico y los próximos meses, y después
+        # los datos: cada fila va directa a su partición
+        """
+        SELECT crear_particiones_sesiones(
+            LEAST(COALESCE((SELECT MIN(fecha) FROM sesiones_antigua), CURRENT_DATE), CURRENT_DATE),
+            (CURRENT_DATE + INTERVAL '3 months')::date
+        )
+        """,
+        """
+        INSERT INTO sesiones (id, habito_id, fecha, hora_inicio, hora_fin, duracion_segundos,
+                              completada, notas, clave_idempotencia)
+        SELECT id, habito_id, fecha, hora_inicio, hora_fin, duracion_segundos,
+               completada, notas, clave_idempotencia
+        FROM sesiones_antigua
+        """,
+        "DROP TABLE sesiones_antigua",
+        "ANALYZE sesiones",
+    ]),
+]
+
+# Clave arbitraria para pg_advisory_xact_lock: evita que dos procesos
+# apliquen la misma migración a la vez
+CANDADO_MIGRACIONES = 7264913
+
+
+def version_actual(conexion):
+    with conexion.cursor() as cursor:
+        try:
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM version_esquema")
+            version = cursor.fetchone()[0]
+        except errors.UndefinedTable:
+            version = 0
+    conexion.rollback()
+    return version
+
+
+def aplicar_migraciones(conexion, migraciones=MIGRACIONES):
+    """Lleva el esquema a la última versión. En el caso habitual (esquema
+    al día) cuesta una sola consulta."""
+    ultima = migraciones[-1][0]
+    if version_actual(conexion) >= ultima:
+        return []
+
+    aplicadas = []
+    with conexion.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS version_esquema (
+                version INTEGER PRIMARY KEY,
+                descripcion TEXT NOT NULL,
+                aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conexion.commit()
+
+        for version, descripcion, sentencias in migraciones:
+            try:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (CANDADO_MIGRACIONES,))
+                cursor.execute("SELECT 1 FROM version_esquema WHERE version = %s", (version,))
+                if cursor.fetchone():
+                    conexion.rollback()
+                    continue
+
+                for sentencia in sentencias:
+                    cursor.execute(sentencia)
+                cursor.execute(
+                    "INSERT INTO version_esquema (version, descripcion) VALUES (%s, %s)",
+                    (version, descripcion),
+                )
+                conexion.commit()
+                aplicadas.append(version)
+                print(f"Migración {version} aplicada: {descripcion}")
+            except psycopg2.Error:
+                conexion.rollback()
+                raise
+
+    return aplicadas
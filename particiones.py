@@ -0,0 +1,40 @@
+"""Mantenimiento de las particiones mensuales de `sesiones` (solo Postgres).
+
+La aplicación crea al conectar las particiones de los próximos meses; este
+script está pensado para cron: crea las que falten (también las de los
+meses que tengan filas en sesiones_default, que pasan a su partición) y
+archiva las que pasan de la retención (quedan en el esquema archivo, fuera
+de las consultas).
+
+    python particiones.py --meses-futuros 3 --retencion 24
+    python particiones.py --sin-archivar
+"""
+import argparse
+
+from database import BaseDatos, CONFIG_PARTICIONES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meses-futuros", type=int, default=CONFIG_PARTICIONES["meses_futuros"])
+    parser.add_argument("--retencion", type=int, default=CONFIG_PARTICIONES["meses_retencion"],
+                        help="meses que se quedan en la tabla viva")
+    parser.add_argument("--sin-archivar", action="store_true", help="solo crear particiones")
+    args = parser.parse_args()
+
+    base_datos = BaseDatos(
+        config_hash={"procesos": 0},
+        config_particiones={"meses_futuros": args.meses_futuros, "meses_retencion": args.retencion},
+    )
+    try:
+        if not base_datos.esquema_listo:
+            raise SystemExit(1)
+        base_datos.crear_particiones(vaciar_default=True)
+        if not args.sin_archivar:
+            base_datos.archivar_particiones()
+    finally:
+        base_datos.cerrar_conexion()
+
+
+if __name__ == "__main__":
+    main()
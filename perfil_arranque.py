@@ -0,0 +1,49 @@
+"""Línea de tiempo del arranque de la aplicación.
+
+main.py lo importa antes que nada y envuelve cada etapa (imports, fuente,
+KV, pantallas, conexión) con medir(). Las etapas pueden correr en otros
+hilos: la conexión a la base de datos se solapa con la ventana.
+
+    with perfil_arranque.medir("fuente"):
+        LabelBase.register(...)
+
+informe() imprime cada etapa con su inicio y su duración, contados desde
+que se importó este módulo.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+INICIO = time.perf_counter()
+
+_etapas = []  # (nombre, hilo, inicio, duración) en segundos desde INICIO
+_candado = threading.Lock()
+
+
+@contextmanager
+def medir(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        fin = time.perf_counter()
+        with _candado:
+            _etapas.append((nombre, threading.current_thread().name, inicio - INICIO, fin - inicio))
+
+
+def marcar(nombre):
+    """Etapa instantánea (p. ej. 'primer frame')."""
+    with _candado:
+        _etapas.append((nombre, threading.current_thread().name, time.perf_counter() - INICIO, 0.0))
+
+
+def etapas():
+    with _candado:
+        return sorted(_etapas, key=lambda etapa: etapa[2])
+
+
+def informe():
+    lineas = ["Arranque (ms desde el inicio):"]
+    for nombre, hilo, inicio, duracion in etapas():
+        lineas.append(f"  {inicio * 1000:8.1f}  +{duracion * 1000:7.1f}  {nombre:<28} [{hilo}]")
+    print("\n".join(lineas))
@@ -0,0 +1,162 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolAgotado(Exception):
+    """No quedó ninguna conexión libre dentro del tiempo de espera."""
+
+
+class PoolConexiones:
+    """Pool de conexiones psycopg2 seguro entre hilos.
+
+    Mantiene entre `minimo` y `maximo` conexiones. Las que pasan más de
+    `tiempo_inactivo` segundos sin usarse se cierran (sin bajar del mínimo),
+    y las que llevan más de `intervalo_verificacion` segundos ociosas se
+    comprueban con SELECT 1 antes de entregarlas.
+    """
+
+    def __init__(self, minimo=1, maximo=10, tiempo_inactivo=300,
+                 intervalo_verificacion=30, espera_maxima=10, **parametros_conexion):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError("Tamaño de pool inválido")
+
+        self.minimo = minimo
+        self.maximo = maximo
+        self.tiempo_inactivo = tiempo_inactivo
+        self.intervalo_verificacion = intervalo_verificacion
+        self.espera_maxima = espera_maxima
+        self._parametros = parametros_conexion
+
+        self._libres = []  # (conexion, momento en que se devolvió)
+        self._total = 0
+        self._cerrado = False
+        self._condicion = threading.Condition()
+
+        # Si el servidor no responde al arrancar, el pool se llena después,
+        # a medida que se piden conexiones
+        try:
+            for _ in range(minimo):
+                self._libres.append((self._nueva_conexion(), time.monotonic()))
+                self._total += 1
+        except psycopg2.OperationalError as e:
+            print(f"Pool sin conexiones iniciales: {e}")
+
+    def _nueva_conexion(self):
+        return psycopg2.connect(**self._parametros)
+
+    def _esta_sana(self, conexion):
+        if conexion.closed:
+            return False
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conexion.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _cerrar_inactivas(self):
+        # Se llama con el candado tomado
+        ahora = time.monotonic()
+        conservadas = []
+        for conexion, devuelta in self._libres:
+            if self._total > self.minimo and ahora - devuelta > self.tiempo_inactivo:
+                conexion.close()
+                self._total -= 1
+            else:
+                conservadas.append((conexion, devuelta))
+        self._libres = conservadas
+
+    def obtener(self):
+        limite = time.monotonic() + self.espera_maxima
+
+        with self._condicion:
+            while True:
+                if self._cerrado:
+                    raise PoolAgotado("El pool está cerrado")
+
+                self._cerrar_inactivas()
+
+                if self._libres:
+                    # La más reciente primero: es la que menos probablemente caducó
+                    conexion, devuelta = self._libres.pop()
+                    break
+
+                if self._total < self.maximo:
+                    self._total += 1
+                    conexion, devuelta = None, None
+                    break
+
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise PoolAgotado(f"Sin conexiones libres tras {self.espera_maxima}s")
+                self._condicion.wait(restante)
+
+        # Conectar y verificar fuera del candado para no bloquear a otros hilos
+        try:
+            if conexion is not None and (
+                conexion.closed
+                or time.monotonic() - devuelta > self.intervalo_verificacion
+            ) and not self._esta_sana(conexion):
+                conexion.close()
+                conexion = None
+            if conexion is None:
+                conexion = self._nueva_conexion()
+        except Exception:
+            with self._condicion:
+                self._total -= 1
+                self._condicion.notify()
+            raise
+
+        return conexion
+
+    def devolver(self, conexion, descartar=False):
+        if not conexion.closed and not descartar:
+            try:
+                if conexion.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conexion.rollback()
+            except psycopg2.Error:
+                descartar = True
+
+        with self._condicion:
+            if self._cerrado or descartar or conexion.closed:
+                if not conexion.closed:
+                    conexion.close()
+                self._total -= 1
+            else:
+                self._libres.append((conexion, time.monotonic()))
+            self._condicion.notify()
+
+    @contextmanager
+    def conexion(self):
+        conexion = self.obtener()
+        descartar = False
+        try:
+            yield conexion
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # La conexión pudo quedar rota; no devolverla al pool
+            descartar = True
+            raise
+        finally:
+            self.devolver(conexion, descartar=descartar)
+
+    def estadisticas(self):
+        with self._condicion:
+            return {
+                "total": self._total,
+                "libres": len(self._libres),
+                "en_uso": self._total - len(self._libres),
+            }
+
+    def cerrar(self):
+        with self._condicion:
+            self._cerrado = True
+            for conexion, _ in self._libres:
+                conexion.close()
+            self._total -= len(self._libres)
+            self._libres = []
+            self._condicion.notify_all()
@@ -0,0 +1,154 @@
+"""Registros compactos para las filas del almacenamiento.
+
+Cada clase guarda sus campos en __slots__: sin diccionario por instancia,
+una fila ocupa poco más que sus valores. Los cursores de cada motor los
+construyen directamente desde la tupla de la fila (ver `Registro.constructor`).
+
+Se leen como atributos (habito.nombre) o como un diccionario de solo esos
+campos (habito['nombre'], habito.get(...), dict(habito)), así el código que
+recibía filas dict sigue funcionando sin cambios.
+"""
+from collections.abc import Mapping
+
+
+class Registro(Mapping):
+    """Base de los registros. Las subclases declaran `__slots__` con sus
+    campos y, si hace falta, `defectos` para los que falten en la consulta."""
+
+    __slots__ = ()
+    defectos = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        campos = []
+        for clase in reversed(cls.__mro__):
+            for campo in clase.__dict__.get("__slots__", ()):
+                if campo not in campos:
+                    campos.append(campo)
+        cls.campos = tuple(campos)
+        cls._conjunto_campos = frozenset(campos)
+        # Constructores por forma de la consulta (tupla de columnas)
+        cls._constructores = {}
+
+    def __init__(self, **valores):
+        desconocidos = valores.keys() - self._conjunto_campos
+        if desconocidos:
+            raise TypeError(f"{type(self).__name__} no tiene los campos {sorted(desconocidos)}")
+        for campo in self.campos:
+            setattr(self, campo, valores.get(campo, self.defectos.get(campo)))
+
+    @classmethod
+    def constructor(cls, columnas):
+        """Función fila -> registro para una consulta con esas columnas (en
+        orden). Las columnas que no son campos se ignoran; los campos que
+        no vienen en la consulta toman su valor de `defectos`."""
+        construir = cls._constructores.get(columnas)
+        if construir is not None:
+            return construir
+
+        posiciones = {columna: indice for indice, columna in enumerate(columnas)}
+        # El descriptor de cada slot asigna sin pasar por __setattr__
+        leidos = [(getattr(cls, campo).__set__, posiciones[campo])
+                  for campo in cls.campos if campo in posiciones]
+        fijos = [(getattr(cls, campo).__set__, cls.defectos.get(campo))
+                 for campo in cls.campos if campo not in posiciones]
+        nuevo = cls.__new__
+
+        def construir(fila):
+            registro = nuevo(cls)
+            for asignar, indice in leidos:
+                asignar(registro, fila[indice])
+            for asignar, valor in fijos:
+                asignar(registro, valor)
+            return registro
+
+        cls._constructores[columnas] = construir
+        return construir
+
+    # Interfaz de diccionario, restringida a los campos
+    def __getitem__(self, campo):
+        if campo in self._conjunto_campos:
+            return getattr(self, campo)
+        raise KeyError(campo)
+
+    def __setitem__(self, campo, valor):
+        if campo not in self._conjunto_campos:
+            raise KeyError(campo)
+        setattr(self, campo, valor)
+
+    def __contains__(self, campo):
+        return campo in self._conjunto_campos
+
+    def __iter__(self):
+        return iter(self.campos)
+
+    def __len__(self):
+        return len(self.campos)
+
+    def get(self, campo, defecto=None):
+        if campo in self._conjunto_campos:
+            return getattr(self, campo)
+        return defecto
+
+    def update(self, otro=(), **valores):
+        for campo, valor in dict(otro, **valores).items():
+            self[campo] = valor
+
+    def a_dict(self):
+        return {campo: getattr(self, campo) for campo in self.campos}
+
+    def __copy__(self):
+        copia = type(self).__new__(type(self))
+        for campo in self.campos:
+            setattr(copia, campo, getattr(self, campo))
+        return copia
+
+    def __deepcopy__(self, memo):
+        # Los valores son inmutables (números, texto, fechas): basta la copia superficial
+        return self.__copy__()
+
+    def __repr__(self):
+        valores = ", ".join(f"{campo}={getattr(self, campo)!r}" for campo in self.campos)
+        return f"{type(self).__name__}({valores})"
+
+
+class Habito(Registro):
+    """Hábito con sus estadísticas (las consultas que no las calculan
+    dejan los valores de un hábito sin sesiones)."""
+
+    __slots__ = (
+        "id", "usuario_id", "nombre", "descripcion", "objetivo_diario_minutos",
+        "categoria", "icono", "color", "fecha_creacion",
+        "total_sesiones", "total_segundos", "minutos_hoy", "promedio_minutos",
+        "ultima_sesion", "racha_dias", "racha_maxima", "inicio_racha",
+    )
+    defectos = {
+        "total_sesiones": 0, "total_segundos": 0, "minutos_hoy": 0,
+        "promedio_minutos": 0, "racha_dias": 0, "racha_maxima": 0,
+    }
+    # Lo que cambia actualizar_habito; el resto (estadísticas) no se toca
+    editables = ("nombre", "descripcion", "objetivo_diario_minutos", "categoria", "icono", "color")
+
+
+class HabitoResumen(Habito):
+    """Fila de obtener_resumen_inicio: trae además la racha del usuario."""
+
+    __slots__ = ("racha_total",)
+    defectos = {**Habito.defectos, "racha_total": 0}
+
+
+class Sesion(Registro):
+    __slots__ = (
+        "id", "habito_id", "fecha", "hora_inicio", "hora_fin",
+        "duracion_segundos", "completada", "notas",
+    )
+
+
+class Recordatorio(Registro):
+    __slots__ = ("habito_id", "activo", "hora_inicio", "hora_fin")
+    defectos = {"activo": False}
+
+
+class EstadisticasUsuario(Registro):
+    __slots__ = ("total_habitos", "total_sesiones", "total_segundos", "racha_total")
+    defectos = {campo: 0 for campo in __slots__}
@@ -1,22 +1,52 @@
 from kivymd.uix.screen import MDScreen
-from kivy.clock import Clock
-import time
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.properties import StringProperty
+
+SESIONES_POR_PAGINA = 20
+
+class FilaSesion(RecycleDataViewBehavior, BoxLayout):
+    """Una sesión del historial; el RecycleView reutiliza las filas. Sus
+    datos son los registros Sesion de la página, que se formatean al pintar."""
+    fecha = StringProperty("")
+    hora = StringProperty("")
+    duracion = StringProperty("")
+    
+    def refresh_view_attrs(self, rv, index, sesion):
+        duracion = sesion.duracion_segundos or 0
+        self.fecha = sesion.fecha.strftime("%d/%m/%Y")
+        self.hora = sesion.hora_inicio.strftime("%H:%M") if sesion.hora_inicio else ""
+        self.duracion = f"{duracion // 60}m {duracion % 60:02d}s"
 
 class DetalleHabitoScreen(MDScreen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.app = None
         self.habito_actual = None
-        self.temporizador_activo = False
-        self.tiempo_inicio = None
-        self.tiempo_transcurrido = 0
-        self.evento_temporizador = None
         self.recordatorio_activo = False
+        # Paginación del historial: clave de la siguiente página y una
+        # generación para descartar páginas de un hábito anterior
+        self.historial_siguiente = None
+        self.historial_fin = False
+        self.historial_generacion = 0
     
     def on_pre_enter(self):
         if self.app and hasattr(self.app, 'habito_seleccionado'):
             self.habito_actual = self.app.habito_seleccionado
             self.actualizar_pantalla()
+            self.app.temporizadores.bind(
+                on_segundo=self.actualizar_temporizador,
+                on_sesion_guardada=self.sesion_guardada
+            )
+            self.mostrar_temporizador()
+    
+    def on_leave(self):
+        # Los temporizadores siguen en marcha; solo deja de pintarlos
+        if self.app:
+            self.app.temporizadores.unbind(
+                on_segundo=self.actualizar_temporizador,
+                on_sesion_guardada=self.sesion_guardada
+            )
     
     def actualizar_pantalla(self):
         if not self.habito_actual:
@@ -29,28 +59,113 @@ class DetalleHabitoScreen(MDScreen):
             desc = self.habito_actual.get('descripcion', '')
             self.ids.descripcion_habito.text = desc
         
-        self.actualizar_barra_progreso()
-        self.actualizar_estadisticas()
+        if hasattr(self.ids, 'tendencia_valor'):
+            self.ids.tendencia_valor.text = ""
+        
+        self.cargar_estadisticas()
+        self.cargar_historial(reiniciar=True)
     
-    def obtener_estadisticas_habito(self):
+    def cargar_estadisticas(self):
+        """Pide las estadísticas del hábito en segundo plano y refresca barra y tarjetas"""
         if self.app and self.habito_actual and hasattr(self.app, 'base_datos'):
-            habito_completo = self.app.base_datos.obtener_habito_por_id(self.habito_actual['id'])
-            if habito_completo:
-                return {
-                    'minutos_hoy': habito_completo.get('minutos_hoy', 0),
-                    'total_minutos': habito_completo.get('total_segundos', 0) // 60,
-                    'racha_dias': habito_completo.get('racha_dias', 0),
-                    'promedio_minutos': habito_completo.get('promedio_minutos', 0)
-                }
-        return {'minutos_hoy': 0, 'total_minutos': 0, 'racha_dias': 0, 'promedio_minutos': 0}
-    
-    def actualizar_barra_progreso(self):
+            self.app.despachador.ejecutar(
+                self.app.diario.obtener_habito_por_id, self.habito_actual['id'],
+                al_terminar=self.mostrar_estadisticas,
+                clave=('habito', self.habito_actual['id'])
+            )
+            if self.app.usuario_actual:
+                # Un solo informe por usuario, compartido por todos sus hábitos
+                usuario_id = self.app.usuario_actual['id']
+                self.app.despachador.ejecutar(
+                    self.app.base_datos.obtener_informe_usuario, usuario_id,
+                    al_terminar=self.mostrar_tendencia,
+                    clave=('informe', usuario_id)
+                )
+    
+    def mostrar_estadisticas(self, habito_completo):
+        # La respuesta puede llegar después de cambiar de hábito
+        if not habito_completo or not self.habito_actual or habito_completo.id != self.habito_actual['id']:
+            return
+        
+        # El registro Habito ya trae las estadísticas; se pinta tal cual
+        self.actualizar_barra_progreso(habito_completo)
+        self.actualizar_estadisticas(habito_completo)
+    
+    def mostrar_tendencia(self, informe):
+        if not informe or not self.habito_actual:
+            return
+        
+        tendencia = informe['habitos'].get(self.habito_actual['id'])
+        if tendencia and hasattr(self.ids, 'tendencia_valor'):
+            self.ids.tendencia_valor.text = (
+                f"7d: {tendencia['media_7_dias']:g}m/día · {tendencia['cumplimiento']}% objetivo"
+            )
+    
+    # =================== HISTORIAL ===================
+    def cargar_historial(self, reiniciar=False):
+        """Pide la siguiente página del historial; con reiniciar, la primera"""
+        if not self.app or not self.habito_actual or not hasattr(self.app, 'base_datos'):
+            return
+        
+        if reiniciar:
+            self.historial_generacion += 1
+            self.historial_siguiente = None
+            self.historial_fin = False
+            if hasattr(self.ids, 'historial_lista'):
+                self.ids.historial_lista.data = []
+                self.ids.historial_lista.scroll_y = 1
+        elif self.historial_fin:
+            return
+        
+        habito_id = self.habito_actual['id']
+        clave = ('historial', habito_id, self.historial_siguiente)
+        if self.app.despachador.esta_cargando(clave):
+            return
+        
+        if hasattr(self.ids, 'historial_estado'):
+            self.ids.historial_estado.text = "Cargando..."
+        
+        generacion = self.historial_generacion
+        self.app.despachador.ejecutar(
+            self.app.base_datos.obtener_historial_sesiones,
+            habito_id, self.historial_siguiente, SESIONES_POR_PAGINA,
+            al_terminar=lambda pagina: self.historial_cargado(pagina, generacion),
+            clave=clave
+        )
+    
+    def historial_cargado(self, pagina, generacion):
+        # Página de un hábito o una recarga anteriores
+        if generacion != self.historial_generacion:
+            return
+        
+        self.historial_siguiente = pagina['siguiente']
+        self.historial_fin = pagina['siguiente'] is None
+        
+        if hasattr(self.ids, 'historial_lista'):
+            self.ids.historial_lista.data.extend(pagina['sesiones'])
+            vacio = not self.ids.historial_lista.data
+        else:
+            vacio = not pagina['sesiones']
+        
+        if hasattr(self.ids, 'historial_estado'):
+            if vacio:
+                self.ids.historial_estado.text = "Sin sesiones registradas"
+            elif self.historial_fin:
+                self.ids.historial_estado.text = "No hay más sesiones"
+            else:
+                self.ids.historial_estado.text = ""
+    
+    def historial_desplazado(self, scroll_y):
+        # scroll_y va de 1 (arriba) a 0 (abajo): cerca del final, otra página
+        if scroll_y <= 0.1 and not self.historial_fin:
+            self.cargar_historial()
+    
+    def actualizar_barra_progreso(self, habito):
         if not self.habito_actual:
             return
         
-        estadisticas = self.obtener_estadisticas_habito()
         objetivo = self.habito_actual.get('objetivo_diario_minutos', 30)
-        hoy = estadisticas.get('minutos_hoy', 0)
+        hoy = habito.minutos_hoy
         porcentaje = min(100, int((hoy / objetivo) * 100)) if objetivo > 0 else 0
         
         if hasattr(self.ids, 'barra_progreso'):
@@ -62,77 +177,62 @@ class DetalleHabitoScreen(MDScreen):
         if hasattr(self.ids, 'progreso_minutos'):
             self.ids.progreso_minutos.text = f"{hoy}/{objetivo} min"
     
-    def actualizar_estadisticas(self):
-        estadisticas = self.obtener_estadisticas_habito()
-        
+    def actualizar_estadisticas(self, habito):
         if hasattr(self.ids, 'hoy_valor'):
-            self.ids.hoy_valor.text = f"{estadisticas['minutos_hoy']}m"
+            self.ids.hoy_valor.text = f"{habito.minutos_hoy}m"
         
         if hasattr(self.ids, 'total_valor'):
-            self.ids.total_valor.text = f"{estadisticas['total_minutos']}m"
+            self.ids.total_valor.text = f"{habito.total_segundos // 60}m"
         
         if hasattr(self.ids, 'racha_valor'):
-            self.ids.racha_valor.text = f"{estadisticas['racha_dias']}d"
+            self.ids.racha_valor.text = f"{habito.racha_dias}d"
         
         if hasattr(self.ids, 'promedio_valor'):
-            self.ids.promedio_valor.text = f"{estadisticas['promedio_minutos']}m"
+            self.ids.promedio_valor.text = f"{habito.promedio_minutos}m"
     
     def iniciar_temporizador(self):
-        if not self.temporizador_activo:
-            self.temporizador_activo = True
-            self.tiempo_inicio = time.time()
-            
-            if hasattr(self.ids, 'boton_iniciar'):
-                self.ids.boton_iniciar.disabled = True
-            
-            if hasattr(self.ids, 'boton_detener'):
-                self.ids.boton_detener.disabled = False
-            
-            self.evento_temporizador = Clock.schedule_interval(self.actualizar_temporizador, 0.1)
+        if self.habito_actual:
+            self.app.temporizadores.iniciar(self.habito_actual['id'])
+            self.mostrar_temporizador()
     
     def detener_temporizador(self):
-        if self.temporizador_activo:
-            self.temporizador_activo = False
-            tiempo_final = time.time()
-            duracion_segundos = int(tiempo_final - self.tiempo_inicio)
-            
-            self.guardar_sesion(duracion_segundos)
-            self.actualizar_barra_progreso()
-            self.actualizar_estadisticas()
-            
-            if hasattr(self.ids, 'boton_iniciar'):
-                self.ids.boton_iniciar.disabled = False
-            
-            if hasattr(self.ids, 'boton_detener'):
-                self.ids.boton_detener.disabled = True
-            
-            if hasattr(self.ids, 'display_tiempo'):
-                self.ids.display_tiempo.text = "00:00:00"
-            
-            if self.evento_temporizador:
-                Clock.unschedule(self.evento_temporizador)
-    
-    def actualizar_temporizador(self, dt):
-        if self.temporizador_activo and self.tiempo_inicio:
-            tiempo_actual = time.time()
-            duracion = int(tiempo_actual - self.tiempo_inicio)
-            
-            horas = duracion // 3600
-            minutos = (duracion % 3600) // 60
-            segundos = duracion % 60
-            
-            if hasattr(self.ids, 'display_tiempo'):
-                self.ids.display_tiempo.text = f"{horas:02d}:{minutos:02d}:{segundos:02d}"
-    
-    def guardar_sesion(self, duracion_segundos):
-        if self.habito_actual and self.app and hasattr(self.app, 'base_datos'):
-            resultado = self.app.base_datos.registrar_sesion(
-                self.habito_actual['id'],
-                duracion_segundos
-            )
-            
-            if resultado:
-                print(f"Sesión registrada: {duracion_segundos} segundos")
+        if self.habito_actual:
+            # El gestor guarda la sesión con su hora de inicio y fin y
+            # avisa con on_sesion_guardada
+            self.app.temporizadores.detener(self.habito_actual['id'])
+            self.mostrar_temporizador()
+    
+    def mostrar_temporizador(self):
+        """Botones y display según si el hábito actual tiene temporizador en marcha"""
+        habito_id = self.habito_actual['id']
+        en_marcha = self.app.temporizadores.en_marcha(habito_id)
+        
+        if hasattr(self.ids, 'boton_iniciar'):
+            self.ids.boton_iniciar.disabled = en_marcha
+        
+        if hasattr(self.ids, 'boton_detener'):
+            self.ids.boton_detener.disabled = not en_marcha
+        
+        self.actualizar_temporizador(None, habito_id, self.app.temporizadores.segundos(habito_id))
+    
+    def actualizar_temporizador(self, gestor, habito_id, duracion):
+        if not self.habito_actual or habito_id != self.habito_actual['id']:
+            return
+        
+        horas = duracion // 3600
+        minutos = (duracion % 3600) // 60
+        segundos = duracion % 60
+        
+        if hasattr(self.ids, 'display_tiempo'):
+            self.ids.display_tiempo.text = f"{horas:02d}:{minutos:02d}:{segundos:02d}"
+    
+    def sesion_guardada(self, gestor, habito_id, duracion_segundos):
+        # Queda en el diario local; las estadísticas cambian al sincronizar
+        print(f"Sesión registrada: {duracion_segundos} segundos")
+    
+    def datos_sincronizados(self):
+        self.cargar_estadisticas()
+        self.cargar_historial(reiniciar=True)
     
     def activar_recordatorio(self, activo):
         self.recordatorio_activo = activo
@@ -154,16 +254,21 @@ class DetalleHabitoScreen(MDScreen):
             print("Error: Debes ingresar horas de inicio y fin")
             return
         
-        if self.habito_actual and self.app and hasattr(self.app, 'base_datos'):
-            resultado = self.app.base_datos.actualizar_recordatorio(
+        if self.habito_actual and self.app and hasattr(self.app, 'diario'):
+            # La escritura del diario local hace fsync: fuera del hilo de la interfaz
+            self.app.despachador.ejecutar(
+                self.app.diario.actualizar_recordatorio,
                 self.habito_actual['id'],
                 self.recordatorio_activo,
                 hora_inicio,
-                hora_fin
+                hora_fin,
+                al_terminar=lambda resultado: self.recordatorio_guardado(resultado, hora_inicio, hora_fin),
+                al_fallar=lambda error: print(f"Error guardando recordatorio: {error}")
             )
-            
-            if resultado:
-                print(f"Recordatorio guardado: {hora_inicio} - {hora_fin}")
+    
+    def recordatorio_guardado(self, resultado, hora_inicio, hora_fin):
+        if resultado:
+            print(f"Recordatorio guardado: {hora_inicio} - {hora_fin}")
     
     def volver_atras(self):
         self.manager.current = 'inicio'
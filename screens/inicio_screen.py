@@ -1,17 +1,23 @@
 from kivymd.uix.screen import MDScreen
 from kivymd.uix.card import MDCard
-from kivymd.uix.label import MDLabel
 from kivymd.uix.button import MDRaisedButton, MDFlatButton
 from kivymd.uix.dialog import MDDialog
 from kivymd.uix.textfield import MDTextField
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.menu import MDDropdownMenu
-from kivy.uix.screenmanager import SlideTransition
-from kivy.properties import StringProperty, NumericProperty
-from datetime import datetime
+from kivymd.app import MDApp
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.clock import Clock
+from kivy.properties import StringProperty, NumericProperty, BooleanProperty
 
-class HabitCard(MDCard):
-    habit_id = None
+from almacenamiento import totalizar_resumen, validar_habito, LIMITES_HABITO
+from registros import Habito
+
+class HabitCard(RecycleDataViewBehavior, MDCard):
+    """Vista reutilizable de un hábito. El RecycleView crea solo las que
+    caben en pantalla y les va cambiando los datos al hacer scroll. Sus
+    datos son los propios registros Habito del resumen, sin copias."""
+    habit_id = NumericProperty(0)
     nombre = StringProperty("")
     descripcion = StringProperty("")
     sesiones = NumericProperty(0)
@@ -19,80 +25,33 @@ class HabitCard(MDCard):
     total_min = NumericProperty(0)
     objetivo = NumericProperty(30)
     
-    def __init__(self, **kwargs):
-        self.habit_id = kwargs.pop('habit_id', None)
-        
-        # Extraer valores antes de llamar a super()
-        nombre_value = kwargs.pop('nombre', "")
-        descripcion_value = kwargs.pop('descripcion', "")
-        sesiones_value = kwargs.pop('sesiones', 0)
-        racha_value = kwargs.pop('racha', 0)
-        total_min_value = kwargs.pop('total_min', 0)
-        objetivo_value = kwargs.pop('objetivo', 30)
-        
-        super().__init__(**kwargs)
-        
-        # Asignar valores después de inicializar
-        self.nombre = nombre_value
-        self.descripcion = descripcion_value
-        self.sesiones = sesiones_value
-        self.racha = racha_value
-        self.total_min = total_min_value
-        self.objetivo = objetivo_value
-        
-        # Crear menú contextual
-        self.menu = None
-        self.crear_menu_contextual()
-    
-    def crear_menu_contextual(self):
-        menu_items = [
-            {
-                "text": "Editar",
-                "viewclass": "OneLineListItem",
-                "on_release": lambda: self.editar_habito(),
-            },
-            {
-                "text": "Eliminar",
-                "viewclass": "OneLineListItem", 
-                "on_release": lambda: self.eliminar_habito(),
-            },
-        ]
-        
-        self.menu = MDDropdownMenu(
-            caller=self,
-            items=menu_items,
-            width_mult=4,
-        )
+    def refresh_view_attrs(self, rv, index, habito):
+        # Solo los campos que pinta la tarjeta (el registro trae más, como
+        # color, que no deben llegar a las propiedades del MDCard)
+        self.index = index
+        self.habit_id = habito.id
+        self.nombre = habito.nombre
+        self.descripcion = habito.descripcion or ''
+        self.sesiones = habito.total_sesiones
+        self.racha = habito.racha_dias
+        self.total_min = (habito.total_segundos or 0) // 60
+        self.objetivo = habito.objetivo_diario_minutos or 30
     
-    def editar_habito(self):
-        self.menu.dismiss()
-        # Buscar la pantalla InicioScreen
-        if hasattr(self, 'app') and hasattr(self.app, 'gestor_pantallas'):
-            for screen in self.app.gestor_pantallas.screens:
-                if isinstance(screen, InicioScreen):
-                    screen.editar_habito_dialog(self.habit_id)
-                    break
-    
-    def eliminar_habito(self):
-        self.menu.dismiss()
-        # Buscar la pantalla InicioScreen
-        if hasattr(self, 'app') and hasattr(self.app, 'gestor_pantallas'):
-            for screen in self.app.gestor_pantallas.screens:
-                if isinstance(screen, InicioScreen):
-                    screen.eliminar_habito_dialog(self.habit_id)
-                    break
+    def pantalla_inicio(self):
+        return MDApp.get_running_app().gestor_pantallas.get_screen('inicio')
+    
+    def abrir_menu(self):
+        self.pantalla_inicio().abrir_menu_habito(self)
     
     def on_touch_down(self, touch):
         if self.collide_point(*touch.pos):
             if touch.button == 'right':  # Click derecho para menú contextual
-                if self.menu:
-                    self.menu.open()
+                self.abrir_menu()
                 return True
         return super().on_touch_down(touch)
     
     def on_release(self):
-        # Solo para click normal (izquierdo)
-        pass
+        self.pantalla_inicio().ver_detalle_habito(self.habit_id)
 
 class NuevoHabitoForm(MDBoxLayout):
     def __init__(self, **kwargs):
@@ -106,6 +65,7 @@ class NuevoHabitoForm(MDBoxLayout):
         self.nombre_field = MDTextField(
             hint_text="Nombre del hábito",
             mode="rectangle",
+            max_text_length=LIMITES_HABITO["nombre"],
             size_hint_y=None,
             height=50
         )
@@ -133,6 +93,7 @@ class NuevoHabitoForm(MDBoxLayout):
         self.cat_field = MDTextField(
             hint_text="Categoría (Salud, Aprendizaje, etc.)",
             mode="rectangle",
+            max_text_length=LIMITES_HABITO["categoria"],
             size_hint_y=None,
             height=50
         )
@@ -140,11 +101,19 @@ class NuevoHabitoForm(MDBoxLayout):
         self.add_widget(self.cat_field)
 
 class InicioScreen(MDScreen):
+    cargando = BooleanProperty(False)
+    sin_habitos = BooleanProperty(False)
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.app = None 
         self.current_user_id = None
         self.dialog = None
+        # Un solo menú contextual para todas las tarjetas, creado al abrirlo
+        self.menu = None
+        self.habito_menu = None
+        # Último resumen pintado; las mutaciones lo parchean en lugar de recargarlo
+        self.resumen = None
     
     def on_pre_enter(self):
         if self.app and self.app.usuario_actual:
@@ -154,67 +123,54 @@ class InicioScreen(MDScreen):
             if hasattr(self.ids, 'bienvenido'):
                 self.ids.bienvenido.text = f"¡Hola, {username}!"
             
-            self.cargar_estadisticas()
-            self.calcular_progreso_general()
-            self.load_habits()
+            self.cargar_resumen()
     
-    def cargar_estadisticas(self):
+    def cargar_resumen(self):
+        """Pide el resumen del panel en un solo viaje a la base de datos y lo pinta"""
         if not self.app or not hasattr(self.app, 'base_datos'):
             return
-            
+        
+        self.cargando = True
+        self.app.despachador.ejecutar(
+            self.app.diario.obtener_resumen_inicio, self.current_user_id,
+            al_terminar=self.mostrar_resumen,
+            al_fallar=self.fallo_carga,
+            clave=('resumen', self.current_user_id)
+        )
+    
+    def mostrar_resumen(self, resumen):
+        self.cargando = False
+        self.resumen = resumen
+        self.cargar_estadisticas(resumen)
+        self.calcular_progreso_general(resumen)
+        self.load_habits(resumen['habitos'])
+    
+    def fallo_carga(self, error):
+        self.cargando = False
+        print(f"Error cargando resumen: {error}")
+    
+    def cargar_estadisticas(self, resumen):
         try:
-            estadisticas = self.app.base_datos.obtener_estadisticas_usuario(self.current_user_id)
-            
             if hasattr(self.ids, 'sesiones'):
-                self.ids.sesiones.text = str(estadisticas.get('total_sesiones', 0))
+                self.ids.sesiones.text = str(resumen.get('total_sesiones', 0))
             
             if hasattr(self.ids, 'tiempo'):
-                total_min = estadisticas.get('total_segundos', 0) // 60
+                total_min = resumen.get('total_segundos', 0) // 60
                 self.ids.tiempo.text = str(total_min)
             
             if hasattr(self.ids, 'racha'):
-                self.ids.racha.text = str(estadisticas.get('racha_total', 0))
+                self.ids.racha.text = str(resumen.get('racha_total', 0))
             
             if hasattr(self.ids, 'hoy'):
-                minutos_hoy = self.obtener_minutos_hoy_usuario()
-                self.ids.hoy.text = str(minutos_hoy)
+                self.ids.hoy.text = str(resumen.get('minutos_hoy', 0))
                 
         except Exception as e:
             print(f"Error cargando estadísticas: {e}")
     
-    def calcular_progreso_general(self):
-        """Calcula el progreso general de todos los hábitos"""
-        if not self.app or not hasattr(self.app, 'base_datos'):
-            return
-        
+    def calcular_progreso_general(self, resumen):
+        """Muestra el progreso general de todos los hábitos"""
         try:
-            habits = self.app.base_datos.obtener_habitos_usuario(self.current_user_id)
-            
-            if not habits:
-                # Si no hay hábitos, progreso 0%
-                if hasattr(self.ids, 'barra_progreso_general'):
-                    self.ids.barra_progreso_general.value = 0
-                if hasattr(self.ids, 'progreso_general_porcentaje'):
-                    self.ids.progreso_general_porcentaje.text = "0%"
-                if hasattr(self.ids, 'progreso_general_texto'):
-                    self.ids.progreso_general_texto.text = "Progreso General"
-                return
-            
-            total_objetivo = 0
-            total_realizado = 0
-            
-            for habit in habits:
-                objetivo = habit.get('objetivo_diario_minutos', 30)
-                total_objetivo += objetivo
-                
-                # Obtener minutos de hoy para este hábito
-                minutos_hoy = self.app.base_datos.obtener_minutos_hoy(habit['id'])
-                total_realizado += min(minutos_hoy, objetivo)  # Máximo el objetivo
-            
-            if total_objetivo > 0:
-                porcentaje = int((total_realizado / total_objetivo) * 100)
-            else:
-                porcentaje = 0
+            porcentaje = resumen.get('progreso_general', 0)
             
             # Actualizar la barra de progreso
             if hasattr(self.ids, 'barra_progreso_general'):
@@ -224,90 +180,66 @@ class InicioScreen(MDScreen):
                 self.ids.progreso_general_porcentaje.text = f"{porcentaje}%"
             
             if hasattr(self.ids, 'progreso_general_texto'):
-                self.ids.progreso_general_texto.text = f"Progreso General"
+                self.ids.progreso_general_texto.text = "Progreso General"
                 
         except Exception as e:
             print(f"Error calculando progreso general: {e}")
     
-    def obtener_minutos_hoy_usuario(self):
-        if not self.app or not hasattr(self.app, 'base_datos'):
-            return 0
-            
-        try:
-            habits = self.app.base_datos.obtener_habitos_usuario(self.current_user_id)
-            total_minutos_hoy = 0
-            
-            for habit in habits:
-                minutos_hoy = self.app.base_datos.obtener_minutos_hoy(habit['id'])
-                total_minutos_hoy += minutos_hoy
-            
-            return total_minutos_hoy
-        except Exception as e:
-            print(f"Error obteniendo minutos hoy: {e}")
-            return 0
-    
-    def load_habits(self):
+    def load_habits(self, habits):
         try:
-            if hasattr(self.ids, 'habits_container'):
-                self.ids.habits_container.clear_widgets()
-                
-                if hasattr(self.app, 'base_datos'):
-                    habits = self.app.base_datos.obtener_habitos_usuario(self.current_user_id)
-                    print(f"Cargando {len(habits)} hábitos para usuario {self.current_user_id}")
-                else:
-                    habits = []
-                
-                if not habits:
-                    empty_label = MDLabel(
-                        text="No tienes hábitos aún.\n\n¡Agrega uno para empezar!",
-                        halign="center",
-                        valign="middle",
-                        theme_text_color="Custom",
-                        text_color=(0.6, 0.6, 0.6, 1),
-                        font_style="H6",
-                        size_hint_y=None,
-                        height=200
-                    )
-                    self.ids.habits_container.add_widget(empty_label)
-                else:
-                    for habit in habits:
-                        sesiones = habit.get('total_sesiones', 0)
-                        racha = habit.get('racha_dias', 0)
-                        total_min = habit.get('total_segundos', 0) // 60 if habit.get('total_segundos') else 0
-                        objetivo = habit.get('objetivo_diario_minutos', 30)
-                        desc = habit.get('descripcion', '')
-                        
-                        card = HabitCard(
-                            habit_id=habit['id'],
-                            nombre=habit['nombre'],
-                            descripcion=desc,
-                            sesiones=sesiones,
-                            racha=racha,
-                            total_min=total_min,
-                            objetivo=objetivo
-                        )
-                        
-                        # Asignar referencia a la app
-                        card.app = self.app
-                        
-                        card.bind(on_release=lambda x, h=habit['id']: self.ver_detalle_habito(h))
-                        self.ids.habits_container.add_widget(card)
+            if hasattr(self.ids, 'habits_list'):
+                print(f"Cargando {len(habits)} hábitos para usuario {self.current_user_id}")
+                self.sin_habitos = not habits
+                # Solo datos: las tarjetas visibles se reutilizan al hacer scroll
+                self.ids.habits_list.data = habits
                         
         except Exception as e:
             print(f"Error cargando hábitos: {e}")
             import traceback
             traceback.print_exc()
     
+    def abrir_menu_habito(self, card):
+        if self.menu is None:
+            menu_items = [
+                {
+                    "text": "Editar",
+                    "viewclass": "OneLineListItem",
+                    "on_release": lambda: self.opcion_menu(self.editar_habito_dialog),
+                },
+                {
+                    "text": "Eliminar",
+                    "viewclass": "OneLineListItem", 
+                    "on_release": lambda: self.opcion_menu(self.eliminar_habito_dialog),
+                },
+            ]
+            self.menu = MDDropdownMenu(
+                caller=card,
+                items=menu_items,
+                width_mult=4,
+            )
+        
+        self.habito_menu = card.habit_id
+        self.menu.caller = card
+        self.menu.open()
+    
+    def opcion_menu(self, accion):
+        self.menu.dismiss()
+        if self.habito_menu is not None:
+            accion(self.habito_menu)
+    
     def ver_detalle_habito(self, habit_id):
         if self.app and hasattr(self.app, 'base_datos'):
-            try:
-                habito = self.app.base_datos.obtener_habito_por_id(habit_id)
-                if habito:
-                    self.app.habito_seleccionado = habito
-                    self.manager.current = 'detalle_habito'
-                    self.manager.transition.direction = 'left'
-            except Exception as e:
-                print(f"Error al obtener hábito: {e}")
+            self.app.despachador.ejecutar(
+                self.app.diario.obtener_habito_por_id, habit_id,
+                al_terminar=self.abrir_detalle_habito,
+                clave=('habito', habit_id)
+            )
+    
+    def abrir_detalle_habito(self, habito):
+        if habito:
+            self.app.habito_seleccionado = habito
+            self.manager.current = 'detalle_habito'
+            self.manager.transition.direction = 'left'
 
     def add_new_habit(self):
         self.dialog = MDDialog(
@@ -352,24 +284,107 @@ class InicioScreen(MDScreen):
         if not categoria:
             categoria = "Salud"
         
+        try:
+            validar_habito(nombre, descripcion, objetivo, categoria)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        
         if hasattr(self.app, 'base_datos'):
-            habito = self.app.base_datos.crear_habito(
+            self.app.despachador.ejecutar(
+                self.app.base_datos.crear_habito,
                 self.current_user_id,
                 nombre,
                 descripcion,
                 objetivo,
-                categoria
+                categoria,
+                al_terminar=self.habito_creado,
+                clave=('crear_habito', self.current_user_id, nombre)
             )
-            
-            if habito:
-                self.dialog.dismiss()
-                self.cargar_estadisticas()
-                self.calcular_progreso_general()
-                self.load_habits()
+    
+    # Tras crear, editar o eliminar se parchea solo la tarjeta afectada y se
+    # recalculan los totales en memoria: sin recargar ni perder el scroll
+
+    def habito_creado(self, habito):
+        if self.aplicar_mutacion(habito):
+            # El resumen va ordenado por id descendente: el nuevo va primero
+            self.resumen['habitos'].insert(0, habito)
+            self.ids.habits_list.data.insert(0, habito)
+            self.recalcular_totales()
+    
+    def habito_actualizado(self, habito):
+        if self.aplicar_mutacion(habito):
+            indice = self.indice_habito(habito['id'])
+            if indice is None:
+                return self.cargar_resumen()
+            # El registro es el mismo en el resumen y en la lista: se
+            # actualizan en su sitio los datos editados (no las
+            # estadísticas) y se vuelve a asignar para repintar
+            fila = self.resumen['habitos'][indice]
+            fila.update({campo: habito[campo] for campo in Habito.editables})
+            self.ids.habits_list.data[indice] = fila
+            self.recalcular_totales()
+    
+    def habito_eliminado(self, resultado):
+        if self.aplicar_mutacion(resultado):
+            indice = self.indice_habito(resultado['id'])
+            if indice is None:
+                return self.cargar_resumen()
+            del self.resumen['habitos'][indice]
+            self.ids.habits_list.data.pop(indice)
+            self.resumen['racha_total'] = resultado['racha_total']
+            self.recalcular_totales()
+    
+    def aplicar_mutacion(self, resultado):
+        """Cierra el diálogo. Devuelve False si la mutación falló o si no
+        hay un resumen que parchear (en ese caso recarga entero)."""
+        if not resultado:
+            return False
+        if self.dialog:
+            self.dialog.dismiss()
+        if self.resumen is None or not hasattr(self.ids, 'habits_list'):
+            self.cargar_resumen()
+            return False
+        self.conservar_scroll()
+        return True
+    
+    def indice_habito(self, habit_id):
+        for indice, habito in enumerate(self.resumen['habitos']):
+            if habito['id'] == habit_id:
+                return indice
+        return None
+    
+    def recalcular_totales(self):
+        self.resumen = totalizar_resumen(self.resumen['habitos'], self.resumen['racha_total'])
+        self.sin_habitos = not self.resumen['habitos']
+        self.cargar_estadisticas(self.resumen)
+        self.calcular_progreso_general(self.resumen)
+    
+    def conservar_scroll(self):
+        """Mantiene la distancia al borde superior de la lista cuando cambia
+        su altura (scroll_y es relativo y movería las tarjetas)"""
+        rv = self.ids.habits_list
+        desplazable = rv.children[0].height - rv.height if rv.children else 0
+        if desplazable <= 0:
+            return
+        desde_arriba = (1 - rv.scroll_y) * desplazable
+        
+        def restaurar(dt):
+            nuevo = rv.children[0].height - rv.height
+            rv.scroll_y = max(0, 1 - desde_arriba / nuevo) if nuevo > 0 else 1
+        
+        # Después de que el layout haya recolocado las tarjetas
+        Clock.schedule_once(restaurar, 0)
     
     def editar_habito_dialog(self, habit_id):
         """Muestra diálogo para editar hábito"""
-        habito = self.app.base_datos.obtener_habito_por_id(habit_id)
+        self.app.despachador.ejecutar(
+            self.app.diario.obtener_habito_por_id, habit_id,
+            al_terminar=lambda habito: self.mostrar_dialogo_edicion(habit_id, habito),
+            clave=('habito', habit_id)
+        )
+    
+    def mostrar_dialogo_edicion(self, habit_id, habito):
         if not habito:
             return
         
@@ -422,24 +437,31 @@ class InicioScreen(MDScreen):
         if not categoria:
             categoria = "Salud"
         
-        if hasattr(self.app, 'base_datos'):
-            resultado = self.app.base_datos.actualizar_habito(
-                habit_id,
-                nombre,
-                descripcion,
-                objetivo,
-                categoria
+        try:
+            validar_habito(nombre, descripcion, objetivo, categoria)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        
+        if hasattr(self.app, 'diario'):
+            # Se anota en local (con su fsync, fuera del hilo de la interfaz)
+            # y se pinta al volver; el servidor lo recibe después
+            self.app.despachador.ejecutar(
+                self.app.diario.actualizar_habito,
+                habit_id, nombre, descripcion, objetivo, categoria,
+                al_terminar=self.habito_actualizado,
+                al_fallar=lambda error: print(f"Error actualizando hábito: {error}")
             )
-            
-            if resultado:
-                self.dialog.dismiss()
-                self.cargar_estadisticas()
-                self.calcular_progreso_general()
-                self.load_habits()
     
     def eliminar_habito_dialog(self, habit_id):
         """Muestra diálogo de confirmación para eliminar hábito"""
-        habito = self.app.base_datos.obtener_habito_por_id(habit_id)
+        self.app.despachador.ejecutar(
+            self.app.diario.obtener_habito_por_id, habit_id,
+            al_terminar=lambda habito: self.mostrar_dialogo_eliminacion(habit_id, habito),
+            clave=('habito', habit_id)
+        )
+    
+    def mostrar_dialogo_eliminacion(self, habit_id, habito):
         if not habito:
             return
         
@@ -466,13 +488,14 @@ class InicioScreen(MDScreen):
     def eliminar_habito(self, habit_id):
         """Elimina un hábito"""
         if hasattr(self.app, 'base_datos'):
-            resultado = self.app.base_datos.eliminar_habito(habit_id)
-            
-            if resultado:
-                self.dialog.dismiss()
-                self.cargar_estadisticas()
-                self.calcular_progreso_general()
-                self.load_habits()
+            self.app.despachador.ejecutar(
+                self.app.base_datos.eliminar_habito, habit_id,
+                al_terminar=self.habito_eliminado,
+                clave=('eliminar_habito', habit_id)
+            )
+    
+    def datos_sincronizados(self):
+        self.cargar_resumen()
     
     def logout(self):
         if self.app:
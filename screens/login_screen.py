@@ -1,7 +1,10 @@
 from kivymd.uix.screen import MDScreen
 from kivy.uix.screenmanager import SlideTransition
+from kivy.properties import BooleanProperty
 
 class LoginScreen(MDScreen):
+    cargando = BooleanProperty(False)
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.app = None  # Se asignará desde main.py
@@ -23,8 +26,17 @@ class LoginScreen(MDScreen):
             self.ids.error_form.text = "Por favor completa todos los campos"
             return
         
-        # Intentar login con la base de datos
-        result = self.app.base_datos.iniciar_sesion(email, password)
+        # Intentar login con la base de datos sin bloquear la interfaz
+        self.cargando = True
+        self.app.despachador.ejecutar(
+            self.app.base_datos.iniciar_sesion, email, password,
+            al_terminar=self.login_terminado,
+            al_fallar=self.login_fallido,
+            clave=('login', email)
+        )
+    
+    def login_terminado(self, result):
+        self.cargando = False
         
         if result["exito"]:
             self.app.usuario_actual = result["usuario"]
@@ -32,7 +44,12 @@ class LoginScreen(MDScreen):
             self.manager.current = 'inicio'
             self.manager.transition = SlideTransition(direction='left')
         else:
-            self.ids.error_form.text = result["message"]
+            self.ids.error_form.text = result["mensaje"]
+    
+    def login_fallido(self, error):
+        self.cargando = False
+        self.ids.error_form.text = "No se pudo iniciar sesión"
+        print(f"Error en login: {error}")
     
     def go_to_registro(self):
         self.manager.current = 'registro'
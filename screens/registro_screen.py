@@ -3,9 +3,12 @@ from kivymd.uix.screen import MDScreen
 from kivymd.uix.dialog import MDDialog
 from kivymd.uix.button import MDFlatButton
 from kivy.uix.screenmanager import SlideTransition
+from kivy.properties import BooleanProperty
 import re
 
 class RegisterScreen(MDScreen):
+    cargando = BooleanProperty(False)
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.app = None  # Se asignará desde main.py
@@ -53,13 +56,27 @@ class RegisterScreen(MDScreen):
         email = self.ids.email.text.strip()
         contrasena = self.ids.contrasena.text
         
-        # Registrar usuario
-        result = self.app.base_datos.registrar_usuario(username, email, contrasena)
+        # Registrar usuario (el hash de la contraseña es lento: fuera del hilo de la interfaz)
+        self.cargando = True
+        self.app.despachador.ejecutar(
+            self.app.base_datos.registrar_usuario, username, email, contrasena,
+            al_terminar=self.registro_terminado,
+            al_fallar=self.registro_fallido,
+            clave=('registro', username, email)
+        )
+    
+    def registro_terminado(self, result):
+        self.cargando = False
         
         if result["exito"]:
             self.show_success("¡Registro exitoso!\nAhora puedes iniciar sesión")
         else:
-            self.ids.error_form.text = result["message"]
+            self.ids.error_form.text = result["mensaje"]
+    
+    def registro_fallido(self, error):
+        self.cargando = False
+        self.ids.error_form.text = "No se pudo completar el registro"
+        print(f"Error en registro: {error}")
     
     def show_success(self, message):
         self.dialog = MDDialog(
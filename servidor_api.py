@@ -0,0 +1,627 @@
+"""Servidor HTTP/JSON asíncrono sobre los datos de hábitos.
+
+Sirve a clientes web y móviles lo mismo que ve la aplicación de escritorio:
+inicio de sesión, hábitos, sesiones, estadísticas y recordatorios. Corre en
+un solo proceso asyncio con un pool de asyncpg, así que miles de clientes
+concurrentes comparten unas pocas conexiones a Postgres sin un hilo por
+petición. asyncpg prepara cada sentencia una vez por conexión (como
+BaseDatos.ejecutar_preparada) y reutiliza el plan.
+
+Usa el mismo esquema (migraciones.py, que se aplica al arrancar) y las
+mismas sentencias SQL que database.py. Las contraseñas se comprueban en el
+pool de procesos de HasheadorContrasenas, fuera del bucle de eventos.
+
+Autenticación: POST /login devuelve un token firmado con HMAC-SHA256
+("usuario_id.expira.firma") que se manda como "Authorization: Bearer ...".
+No se guarda en ningún sitio; el secreto sale de HABITOS_API_SECRETO.
+
+    python servidor_api.py --puerto 8080 --base-datos habitos_bd
+
+    POST   /login                          {usuario, contrasena}
+    POST   /usuarios                       {nombre_usuario, email, contrasena}
+    GET    /habitos
+    POST   /habitos                        {nombre, descripcion, objetivo_diario_minutos, categoria}
+    GET    /habitos/{id}
+    PUT    /habitos/{id}
+    DELETE /habitos/{id}
+    GET    /habitos/{id}/sesiones          ?despues_de=...&limite=20
+    POST   /habitos/{id}/sesiones          {duracion_segundos, hora_inicio, hora_fin, notas, clave_idempotencia}
+    GET    /habitos/{id}/recordatorio
+    PUT    /habitos/{id}/recordatorio      {activo, hora_inicio, hora_fin}
+    GET    /estadisticas
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from datetime import date, datetime
+from functools import partial
+
+import asyncpg
+import psycopg2
+from aiohttp import web
+
+from almacenamiento import (CONFIG_HASH, MAPEO_CATEGORIAS, CATEGORIA_POR_DEFECTO, LIMITES_HABITO,
+                            LIMITES_USUARIO, MAXIMO_ENTERO, totalizar_resumen)
+from contrasenas import HasheadorContrasenas
+from database import CONFIG_CONEXION, CONFIG_PARTICIONES, SENTENCIAS_PREPARADAS, SQL_ACUMULAR_DIARIO, sql_rachas
+from migraciones import aplicar_migraciones
+
+CONFIG_API = {
+    "host": "0.0.0.0",
+    "puerto": 8080,
+    "pool_minimo": 2,               # conexiones abiertas desde el arranque
+    "pool_maximo": 20,              # tope de conexiones a Postgres del proceso
+    "duracion_token": 7 * 24 * 3600,  # segundos de validez de un token
+    "limite_historial": 100,        # sesiones máximas por página
+}
+
+# Rutas que no piden token
+RUTAS_PUBLICAS = {("POST", "/login"), ("POST", "/usuarios")}
+
+POOL = web.AppKey("pool", asyncpg.Pool)
+HASHEADOR = web.AppKey("hasheador", HasheadorContrasenas)
+SECRETO = web.AppKey("secreto", bytes)
+CONFIG = web.AppKey("config", dict)
+
+# Hábitos del usuario con totales de hoy y rachas, como el panel de inicio
+SQL_RESUMEN = f"""
+    WITH dias_habito AS (
+        SELECT d.habito_id AS clave, d.fecha
+        FROM sesiones_diarias d
+        JOIN habitos h ON h.id = d.habito_id
+        WHERE h.usuario_id = $1
+    ),
+    dias_usuario AS (
+        SELECT DISTINCT 0 AS clave, fecha FROM dias_habito
+    ),
+    {sql_rachas("dias_habito", "rachas")},
+    {sql_rachas("dias_usuario", "racha_usuario")}
+    SELECT h.*,
+        COALESCE(SUM(d.total_sesiones), 0) as total_sesiones,
+        COALESCE(SUM(d.total_segundos), 0) as total_segundos,
+        COALESCE(SUM(d.total_segundos) FILTER (WHERE d.fecha = CURRENT_DATE), 0) / 60 as minutos_hoy,
+        COALESCE(r.racha_actual, 0) as racha_dias,
+        COALESCE(r.racha_maxima, 0) as racha_maxima,
+        r.inicio_racha,
+        (SELECT racha_actual FROM racha_usuario) as racha_total
+    FROM habitos h
+    LEFT JOIN sesiones_diarias d ON h.id = d.habito_id
+    LEFT JOIN rachas r ON r.clave = h.id
+    WHERE h.usuario_id = $1
+    GROUP BY h.id, r.racha_actual, r.racha_maxima, r.inicio_racha
+    ORDER BY h.id DESC
+"""
+
+# La fecha sale de hora_inicio; sin ella, ahora. Con la clave de
+# idempotencia un reintento del cliente no duplica la sesión.
+SQL_REGISTRAR_SESION = f"""
+    WITH nueva AS (
+        INSERT INTO sesiones (habito_id, fecha, hora_inicio, hora_fin, duracion_segundos,
+                              notas, clave_idempotencia)
+        VALUES ($1, COALESCE($2::timestamp, LOCALTIMESTAMP)::date, COALESCE($2::timestamp, LOCALTIMESTAMP),
+                $3, $4, $5, $6)
+        ON CONFLICT DO NOTHING
+        RETURNING id, habito_id, fecha, hora_inicio, hora_fin, duracion_segundos
+    ),
+    acumulado AS ({SQL_ACUMULAR_DIARIO.format(origen="nueva")})
+    SELECT id, fecha, hora_inicio, hora_fin, duracion_segundos FROM nueva
+"""
+
+
+class ErrorApi(Exception):
+    """Error que llega al cliente con su código HTTP."""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+# =================== TOKENS ===================
+def _firma(secreto, carga):
+    return hmac.new(secreto, carga.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def crear_token(usuario_id, secreto, duracion):
+    carga = f"{usuario_id}.{int(time.time()) + duracion}"
+    return f"{carga}.{_firma(secreto, carga)}"
+
+
+def leer_token(token, secreto):
+    """usuario_id del token, o None si la firma no cuadra o ha caducado."""
+    try:
+        usuario_id, expira, firma = token.split(".")
+        # En bytes: compare_digest no acepta texto con caracteres no ASCII
+        esperada = _firma(secreto, f"{usuario_id}.{expira}")
+        if not hmac.compare_digest(firma.encode("utf-8"), esperada.encode("utf-8")):
+            return None
+        if int(expira) < time.time():
+            return None
+        return int(usuario_id)
+    except ValueError:
+        return None
+
+
+# =================== RESPUESTAS Y DATOS DE ENTRADA ===================
+def _valor_json(valor):
+    # Fechas y horas en ISO 8601; Decimal y el resto, como texto
+    return valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+
+
+_dumps = partial(json.dumps, default=_valor_json, ensure_ascii=False)
+
+
+def respuesta(datos, estado=200):
+    return web.json_response(datos, status=estado, dumps=_dumps)
+
+
+def _fila(registro):
+    return dict(registro) if registro is not None else None
+
+
+async def _cuerpo(request):
+    try:
+        datos = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise ErrorApi(400, "El cuerpo debe ser JSON")
+    if not isinstance(datos, dict):
+        raise ErrorApi(400, "El cuerpo debe ser un objeto JSON")
+    return datos
+
+
+def _texto(datos, campo, obligatorio=True, defecto="", maximo=None):
+    valor = datos.get(campo, defecto)
+    if not isinstance(valor, str) or (obligatorio and not valor.strip()):
+        raise ErrorApi(400, f"Falta el campo '{campo}'")
+    # El VARCHAR de la columna lo rechazaría con un error de Postgres (500)
+    if maximo is not None and len(valor) > maximo:
+        raise ErrorApi(400, f"'{campo}' admite como mucho {maximo} caracteres")
+    return valor
+
+
+def _entero(valor, campo, minimo=0, maximo=MAXIMO_ENTERO):
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+        raise ErrorApi(400, f"'{campo}' debe ser un número entero")
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ErrorApi(400, f"'{campo}' debe ser un número entero")
+    if numero < minimo:
+        raise ErrorApi(400, f"'{campo}' debe ser al menos {minimo}")
+    if numero > maximo:
+        raise ErrorApi(400, f"'{campo}' debe ser como mucho {maximo}")
+    return numero
+
+
+def _momento(valor, campo):
+    """datetime ISO 8601 o None. Con zona horaria se pasa a la hora local,
+    que es como se guardan las sesiones."""
+    if valor is None:
+        return None
+    try:
+        momento = datetime.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise ErrorApi(400, f"'{campo}' debe ser una fecha y hora ISO 8601")
+    if momento.tzinfo is not None:
+        momento = momento.astimezone().replace(tzinfo=None)
+    return momento
+
+
+def _hora(valor, campo):
+    if valor in (None, ""):
+        return None
+    try:
+        return datetime.strptime(valor, "%H:%M").time()
+    except (TypeError, ValueError):
+        raise ErrorApi(400, f"'{campo}' debe tener el formato HH:MM")
+
+
+def _id_ruta(request, nombre="id"):
+    return _entero(request.match_info[nombre], nombre, minimo=1)
+
+
+def codificar_siguiente(siguiente):
+    """Clave (fecha, hora_inicio, id) de la siguiente página como texto
+    para la URL."""
+    if siguiente is None:
+        return None
+    fecha, hora_inicio, sesion_id = siguiente
+    return f"{fecha.isoformat()},{hora_inicio.isoformat()},{sesion_id}"
+
+
+def decodificar_siguiente(texto):
+    try:
+        fecha, hora_inicio, sesion_id = texto.split(",")
+        return date.fromisoformat(fecha), datetime.fromisoformat(hora_inicio), int(sesion_id)
+    except ValueError:
+        raise ErrorApi(400, "'despues_de' no es válido")
+
+
+# =================== MIDDLEWARES ===================
+@web.middleware
+async def gestionar_errores(request, handler):
+    try:
+        return await handler(request)
+    except ErrorApi as e:
+        return respuesta({"error": e.mensaje}, e.estado)
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error en {request.method} {request.path}: {e}")
+        return respuesta({"error": "Error interno"}, 500)
+
+
+@web.middleware
+async def autenticar(request, handler):
+    if (request.method, request.path) not in RUTAS_PUBLICAS:
+        cabecera = request.headers.get("Authorization", "")
+        usuario_id = None
+        if cabecera.startswith("Bearer "):
+            usuario_id = leer_token(cabecera[len("Bearer "):], request.app[SECRETO])
+        if usuario_id is None:
+            raise ErrorApi(401, "Token ausente, caducado o no válido")
+        request["usuario_id"] = usuario_id
+    return await handler(request)
+
+
+async def _habito_propio(conexion, habito_id, usuario_id):
+    # 404 tanto si no existe como si es de otro usuario
+    if not await conexion.fetchval(
+        "SELECT 1 FROM habitos WHERE id = $1 AND usuario_id = $2", habito_id, usuario_id
+    ):
+        raise ErrorApi(404, "Hábito no encontrado")
+
+
+# =================== USUARIOS ===================
+async def iniciar_sesion(request):
+    datos = await _cuerpo(request)
+    usuario_o_email = _texto(datos, "usuario")
+    contrasena = _texto(datos, "contrasena")
+    hasheador = request.app[HASHEADOR]
+
+    async with request.app[POOL].acquire() as conexion:
+        usuario = await conexion.fetchrow("""
+            SELECT id, nombre_usuario, email, contrasena
+            FROM usuarios
+            WHERE nombre_usuario = $1 OR email = $1
+        """, usuario_o_email)
+
+    # bcrypt en el pool de procesos: el bucle sigue atendiendo a los demás
+    if not usuario or not await asyncio.wrap_future(
+        hasheador.verificar_async(contrasena, usuario["contrasena"])
+    ):
+        raise ErrorApi(401, "Usuario o contraseña incorrectos")
+
+    if hasheador.necesita_rehash(usuario["contrasena"]):
+        nueva = await asyncio.wrap_future(hasheador.encriptar_async(contrasena))
+        async with request.app[POOL].acquire() as conexion:
+            await conexion.execute("""
+                UPDATE usuarios SET contrasena = $1
+                WHERE id = $2 AND contrasena = $3
+            """, nueva, usuario["id"], usuario["contrasena"])
+
+    return respuesta({
+        "token": crear_token(usuario["id"], request.app[SECRETO], request.app[CONFIG]["duracion_token"]),
+        "usuario": {"id": usuario["id"], "nombre_usuario": usuario["nombre_usuario"], "email": usuario["email"]},
+    })
+
+
+async def registrar_usuario(request):
+    datos = await _cuerpo(request)
+    nombre_usuario = _texto(datos, "nombre_usuario", maximo=LIMITES_USUARIO["nombre_usuario"])
+    email = _texto(datos, "email", maximo=LIMITES_USUARIO["email"])
+    contrasena = _texto(datos, "contrasena")
+
+    # bcrypt es lento: no retener una conexión del pool mientras tanto
+    contrasena_encriptada = await asyncio.wrap_future(request.app[HASHEADOR].encriptar_async(contrasena))
+    async with request.app[POOL].acquire() as conexion:
+        usuario = await conexion.fetchrow("""
+            INSERT INTO usuarios (nombre_usuario, email, contrasena)
+            VALUES ($1, $2, $3)
+            ON CONFLICT DO NOTHING
+            RETURNING id, nombre_usuario, email, fecha_creacion
+        """, nombre_usuario, email, contrasena_encriptada)
+
+    if not usuario:
+        raise ErrorApi(409, "Usuario o email ya existen")
+    return respuesta({
+        "token": crear_token(usuario["id"], request.app[SECRETO], request.app[CONFIG]["duracion_token"]),
+        "usuario": _fila(usuario),
+    }, 201)
+
+
+# =================== HÁBITOS ===================
+async def _resumen(request):
+    async with request.app[POOL].acquire() as conexion:
+        filas = await conexion.fetch(SQL_RESUMEN, request["usuario_id"])
+
+    habitos = [dict(fila) for fila in filas]
+    racha_total = 0
+    for habito in habitos:
+        racha_total = habito.pop("racha_total") or 0
+    return totalizar_resumen(habitos, racha_total)
+
+
+async def listar_habitos(request):
+    return respuesta((await _resumen(request))["habitos"])
+
+
+def _datos_habito(datos):
+    categoria = _texto(datos, "categoria", obligatorio=False, defecto="Salud",
+                       maximo=LIMITES_HABITO["categoria"])
+    categoria_info = MAPEO_CATEGORIAS.get(categoria, CATEGORIA_POR_DEFECTO)
+    return (
+        _texto(datos, "nombre", maximo=LIMITES_HABITO["nombre"]),
+        _texto(datos, "descripcion", obligatorio=False),
+        _entero(datos.get("objetivo_diario_minutos", 30), "objetivo_diario_minutos", minimo=1),
+        categoria,
+        categoria_info["icono"],
+        categoria_info["color"],
+    )
+
+
+async def crear_habito(request):
+    valores = _datos_habito(await _cuerpo(request))
+    async with request.app[POOL].acquire() as conexion:
+        async with conexion.transaction():
+            habito = await conexion.fetchrow("""
+                INSERT INTO habitos (usuario_id, nombre, descripcion, objetivo_diario_minutos, categoria, icono, color)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+                RETURNING *
+            """, request["usuario_id"], *valores)
+            # Recordatorio por defecto, como en la aplicación
+            await conexion.execute("INSERT INTO recordatorios (habito_id) VALUES ($1)", habito["id"])
+    return respuesta(_fila(habito), 201)
+
+
+async def obtener_habito(request):
+    async with request.app[POOL].acquire() as conexion:
+        habito = await conexion.fetchrow(SENTENCIAS_PREPARADAS["habito_por_id"], _id_ruta(request))
+
+    if not habito or habito["usuario_id"] != request["usuario_id"]:
+        raise ErrorApi(404, "Hábito no encontrado")
+    return respuesta(_fila(habito))
+
+
+async def actualizar_habito(request):
+    valores = _datos_habito(await _cuerpo(request))
+    async with request.app[POOL].acquire() as conexion:
+        habito = await conexion.fetchrow("""
+            UPDATE habitos
+            SET nombre = $3, descripcion = $4, objetivo_diario_minutos = $5,
+                categoria = $6, icono = $7, color = $8
+            WHERE id = $1 AND usuario_id = $2
+            RETURNING *
+        """, _id_ruta(request), request["usuario_id"], *valores)
+
+    if not habito:
+        raise ErrorApi(404, "Hábito no encontrado")
+    return respuesta(_fila(habito))
+
+
+async def eliminar_habito(request):
+    async with request.app[POOL].acquire() as conexion:
+        borrado = await conexion.fetchval(
+            "DELETE FROM habitos WHERE id = $1 AND usuario_id = $2 RETURNING id",
+            _id_ruta(request), request["usuario_id"],
+        )
+
+    if not borrado:
+        raise ErrorApi(404, "Hábito no encontrado")
+    return web.Response(status=204)
+
+
+# =================== SESIONES ===================
+async def listar_sesiones(request):
+    """Historial paginado por clave, igual que obtener_historial_sesiones:
+    'siguiente' se pasa tal cual como ?despues_de= para la página siguiente."""
+    habito_id = _id_ruta(request)
+    limite = min(_entero(request.query.get("limite", 20), "limite", minimo=1),
+                 request.app[CONFIG]["limite_historial"])
+    despues_de = request.query.get("despues_de")
+
+    filtro = ""
+    parametros = [habito_id, limite + 1]
+    if despues_de:
+        # fecha <= redundante: descarta las particiones de meses posteriores
+        filtro = "AND fecha <= $3 AND (fecha, hora_inicio, id) < ($3, $4, $5)"
+        parametros.extend(decodificar_siguiente(despues_de))
+
+    async with request.app[POOL].acquire() as conexion:
+        await _habito_propio(conexion, habito_id, request["usuario_id"])
+        filas = await conexion.fetch(f"""
+            SELECT id, fecha, hora_inicio, hora_fin, duracion_segundos, notas
+            FROM sesiones
+            WHERE habito_id = $1 {filtro}
+            ORDER BY fecha DESC, hora_inicio DESC, id DESC
+            LIMIT $2
+        """, *parametros)
+
+    # Una fila de más dice si queda otra página sin contar el total
+    sesiones = [dict(fila) for fila in filas[:limite]]
+    siguiente = None
+    if len(filas) > limite:
+        ultima = sesiones[-1]
+        siguiente = (ultima["fecha"], ultima["hora_inicio"], ultima["id"])
+    return respuesta({"sesiones": sesiones, "siguiente": codificar_siguiente(siguiente)})
+
+
+async def registrar_sesion(request):
+    habito_id = _id_ruta(request)
+    datos = await _cuerpo(request)
+    hora_inicio = _momento(datos.get("hora_inicio"), "hora_inicio")
+    hora_fin = _momento(datos.get("hora_fin"), "hora_fin")
+    duracion = _entero(datos.get("duracion_segundos"), "duracion_segundos", minimo=1)
+    notas = _texto(datos, "notas", obligatorio=False)
+    clave = datos.get("clave_idempotencia")
+    if clave is not None and not isinstance(clave, str):
+        raise ErrorApi(400, "'clave_idempotencia' debe ser texto")
+
+    async with request.app[POOL].acquire() as conexion:
+        async with conexion.transaction():
+            await _habito_propio(conexion, habito_id, request["usuario_id"])
+            if hora_inicio is not None:
+                # La hora la pone el cliente y puede ser de un mes sin
+                # partición; sin esto iría a sesiones_default
+                await conexion.execute(
+                    "SELECT crear_particiones_sesiones($1::date, $1::date)", hora_inicio.date()
+                )
+            sesion = await conexion.fetchrow(
+                SQL_REGISTRAR_SESION, habito_id, hora_inicio, hora_fin, duracion, notas, clave
+            )
+
+    if sesion:
+        return respuesta(_fila(sesion), 201)
+    # Ya estaba: la misma clave de idempotencia o la misma hora de inicio
+    if clave is not None:
+        return respuesta({"duplicada": True})
+    raise ErrorApi(409, "Ya hay una sesión con esa hora de inicio")
+
+
+# =================== ESTADÍSTICAS ===================
+async def obtener_estadisticas(request):
+    resumen = await _resumen(request)
+    resumen.pop("habitos")
+    return respuesta(resumen)
+
+
+# =================== RECORDATORIOS ===================
+async def obtener_recordatorio(request):
+    habito_id = _id_ruta(request)
+    async with request.app[POOL].acquire() as conexion:
+        await _habito_propio(conexion, habito_id, request["usuario_id"])
+        recordatorio = await conexion.fetchrow("""
+            SELECT activo, hora_inicio, hora_fin
+            FROM recordatorios
+            WHERE habito_id = $1
+        """, habito_id)
+    return respuesta(_fila(recordatorio) or {"activo": False, "hora_inicio": None, "hora_fin": None})
+
+
+async def actualizar_recordatorio(request):
+    habito_id = _id_ruta(request)
+    datos = await _cuerpo(request)
+    activo = datos.get("activo", False)
+    if not isinstance(activo, bool):
+        raise ErrorApi(400, "'activo' debe ser true o false")
+    hora_inicio = _hora(datos.get("hora_inicio"), "hora_inicio")
+    hora_fin = _hora(datos.get("hora_fin"), "hora_fin")
+
+    async with request.app[POOL].acquire() as conexion:
+        await _habito_propio(conexion, habito_id, request["usuario_id"])
+        recordatorio = await conexion.fetchrow("""
+            UPDATE recordatorios
+            SET activo = $2, hora_inicio = $3, hora_fin = $4
+            WHERE habito_id = $1
+            RETURNING activo, hora_inicio, hora_fin
+        """, habito_id, activo, hora_inicio, hora_fin)
+    return respuesta(_fila(recordatorio))
+
+
+# =================== APLICACIÓN ===================
+def config_asyncpg(config_conexion):
+    """Parámetros de CONFIG_CONEXION (los de psycopg2) en la forma de asyncpg."""
+    return {
+        "host": config_conexion["host"],
+        "port": int(config_conexion["port"]),
+        "user": config_conexion["user"],
+        "password": config_conexion["password"],
+        "database": config_conexion["database"],
+        "timeout": config_conexion.get("connect_timeout", 5),
+    }
+
+
+def crear_aplicacion(config_conexion=None, config_api=None, config_hash=None, secreto=None):
+    config_conexion = {**CONFIG_CONEXION, **(config_conexion or {})}
+    config = {**CONFIG_API, **(config_api or {})}
+    # Procesos y no hilos: el bucle de eventos no debe competir con bcrypt
+    config_hash = {**CONFIG_HASH, "ejecutor": "procesos", **(config_hash or {})}
+
+    if secreto is None:
+        secreto = os.environ.get("HABITOS_API_SECRETO", "").encode("utf-8")
+    if not secreto:
+        secreto = secrets.token_bytes(32)
+        print("Aviso: sin HABITOS_API_SECRETO; los tokens dejan de valer al reiniciar")
+
+    app = web.Application(middlewares=[gestionar_errores, autenticar])
+    app[SECRETO] = secreto
+    app[CONFIG] = config
+
+    async def al_arrancar(app):
+        # Migraciones con psycopg2, como la aplicación; una vez por arranque.
+        # Después, como BaseDatos.migrar, las particiones de los próximos meses
+        def migrar():
+            conexion = psycopg2.connect(**config_conexion)
+            try:
+                aplicar_migraciones(conexion)
+                with conexion.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT crear_particiones_sesiones(
+                            CURRENT_DATE, (CURRENT_DATE + make_interval(months => %s))::date
+                        )
+                    """, (CONFIG_PARTICIONES["meses_futuros"],))
+                conexion.commit()
+            finally:
+                conexion.close()
+
+        await asyncio.to_thread(migrar)
+        app[POOL] = await asyncpg.create_pool(
+            min_size=config["pool_minimo"], max_size=config["pool_maximo"],
+            **config_asyncpg(config_conexion),
+        )
+        app[HASHEADOR] = HasheadorContrasenas(**config_hash)
+
+    async def al_cerrar(app):
+        await app[POOL].close()
+        app[HASHEADOR].cerrar()
+
+    app.on_startup.append(al_arrancar)
+    app.on_cleanup.append(al_cerrar)
+
+    app.router.add_post("/login", iniciar_sesion)
+    app.router.add_post("/usuarios", registrar_usuario)
+    app.router.add_get("/habitos", listar_habitos)
+    app.router.add_post("/habitos", crear_habito)
+    app.router.add_get("/habitos/{id}", obtener_habito)
+    app.router.add_put("/habitos/{id}", actualizar_habito)
+    app.router.add_delete("/habitos/{id}", eliminar_habito)
+    app.router.add_get("/habitos/{id}/sesiones", listar_sesiones)
+    app.router.add_post("/habitos/{id}/sesiones", registrar_sesion)
+    app.router.add_get("/habitos/{id}/recordatorio", obtener_recordatorio)
+    app.router.add_put("/habitos/{id}/recordatorio", actualizar_recordatorio)
+    app.router.add_get("/estadisticas", obtener_estadisticas)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=CONFIG_API["host"])
+    parser.add_argument("--puerto", type=int, default=CONFIG_API["puerto"])
+    parser.add_argument("--pool-maximo", type=int, default=CONFIG_API["pool_maximo"])
+    parser.add_argument("--bd-host", default=CONFIG_CONEXION["host"])
+    parser.add_argument("--bd-puerto", default=CONFIG_CONEXION["port"])
+    parser.add_argument("--bd-usuario", default=CONFIG_CONEXION["user"])
+    parser.add_argument("--bd-contrasena", default=CONFIG_CONEXION["password"])
+    parser.add_argument("--base-datos", default=CONFIG_CONEXION["database"])
+    args = parser.parse_args()
+
+    app = crear_aplicacion(
+        config_conexion={
+            "host": args.bd_host,
+            "port": args.bd_puerto,
+            "user": args.bd_usuario,
+            "password": args.bd_contrasena,
+            "database": args.base_datos,
+        },
+        config_api={"pool_maximo": args.pool_maximo},
+    )
+    web.run_app(app, host=args.host, port=args.puerto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+
+# Cada cuántos segundos se guarda el estado en disco mientras hay
+# temporizadores en marcha (además de al iniciar y al detener)
+INTERVALO_PUNTO_CONTROL = 10
+
+# Tras un cierre inesperado, si la aplicación vuelve antes de este margen
+# los temporizadores siguen corriendo contando el hueco; si tarda más se
+# cierran con el tiempo del último punto de control.
+MARGEN_REANUDAR = 10 * 60
+
+
+class Temporizador:
+    """Un temporizador en marcha. Mide con el reloj monotónico; la hora de
+    pared solo se usa para hora_inicio/hora_fin de la sesión."""
+
+    def __init__(self, habito_id, hora_inicio, segundos_previos=0):
+        self.habito_id = habito_id
+        self.hora_inicio = hora_inicio
+        self.segundos_previos = segundos_previos
+        self.inicio_monotonico = time.monotonic()
+
+    def transcurrido(self):
+        return self.segundos_previos + time.monotonic() - self.inicio_monotonico
+
+    def segundos(self):
+        return int(self.transcurrido())
+
+    def a_dict(self):
+        return {
+            "habito_id": self.habito_id,
+            "hora_inicio": self.hora_inicio.isoformat(),
+            "segundos": self.transcurrido(),
+            "punto_control": datetime.now().isoformat(),
+        }
+
+
+class GestorTemporizadores(EventDispatcher):
+    """Temporizadores de varios hábitos a la vez.
+
+    Emite on_segundo(habito_id, segundos) justo cuando cada temporizador
+    cambia de segundo, con un solo Clock.schedule_once programado para el
+    siguiente cambio (nada de sondeos cada 0.1 s), y on_sesion_guardada
+    cuando una sesión detenida llega a la base de datos.
+
+    El estado se guarda en `ruta` (JSON, escritura atómica) para que un
+    cierre inesperado no pierda la sesión: recuperar() lo lee al arrancar.
+    Las sesiones detenidas quedan en el archivo hasta que `guardar` confirma
+    que están en la base de datos.
+
+    guardar(habito_id, duracion_segundos, hora_inicio, hora_fin, al_terminar)
+    debe llamar a al_terminar(resultado) cuando acabe.
+    """
+
+    __events__ = ("on_segundo", "on_sesion_guardada")
+
+    def __init__(self, ruta, guardar, **kwargs):
+        super().__init__(**kwargs)
+        self.ruta = ruta
+        self.guardar = guardar
+        self.activos = {}         # habito_id -> Temporizador
+        self.por_guardar = {}     # clave -> sesión detenida aún sin confirmar
+        self._evento = None
+        self._ultimo_punto_control = 0
+
+    def on_segundo(self, habito_id, segundos):
+        pass
+
+    def on_sesion_guardada(self, habito_id, duracion_segundos):
+        pass
+
+    # =================== CONTROL ===================
+    def iniciar(self, habito_id):
+        if habito_id in self.activos:
+            return self.activos[habito_id]
+
+        temporizador = Temporizador(habito_id, datetime.now())
+        self.activos[habito_id] = temporizador
+        self.punto_control()
+        self.dispatch("on_segundo", habito_id, 0)
+        self._programar()
+        return temporizador
+
+    def detener(self, habito_id):
+        """Detiene el temporizador y manda guardar la sesión. Devuelve la
+        duración en segundos, o None si no estaba en marcha."""
+        temporizador = self.activos.pop(habito_id, None)
+        if temporizador is None:
+            return None
+
+        duracion = temporizador.segundos()
+        self._encolar_sesion(habito_id, temporizador.hora_inicio, duracion)
+        self._programar()
+        return duracion
+
+    def cancelar(self, habito_id):
+        """Descarta el temporizador sin guardar sesión."""
+        if self.activos.pop(habito_id, None) is not None:
+            self.punto_control()
+            self._programar()
+
+    def en_marcha(self, habito_id):
+        return habito_id in self.activos
+
+    def segundos(self, habito_id):
+        temporizador = self.activos.get(habito_id)
+        return temporizador.segundos() if temporizador else 0
+
+    def _encolar_sesion(self, habito_id, hora_inicio, duracion):
+        clave = f"{habito_id}:{hora_inicio.isoformat()}"
+        sesion = {
+            "habito_id": habito_id,
+            "duracion_segundos": duracion,
+            "hora_inicio": hora_inicio.isoformat(),
+            "hora_fin": (hora_inicio + timedelta(seconds=duracion)).isoformat(),
+        }
+        self.por_guardar[clave] = sesion
+        # Primero al disco, después a la base de datos
+        self.punto_control()
+        self._enviar(clave, sesion)
+
+    def _enviar(self, clave, sesion):
+        def al_terminar(resultado):
+            if resultado:
+                self.por_guardar.pop(clave, None)
+                self.punto_control()
+                self.dispatch("on_sesion_guardada", sesion["habito_id"], sesion["duracion_segundos"])
+            else:
+                print(f"Sesión pendiente de guardar: {clave}")
+
+        self.guardar(
+            sesion["habito_id"],
+            sesion["duracion_segundos"],
+            datetime.fromisoformat(sesion["hora_inicio"]),
+            datetime.fromisoformat(sesion["hora_fin"]),
+            al_terminar,
+        )
+
+    # =================== TICS ===================
+    def _programar(self):
+        if self._evento is not None:
+            self._evento.cancel()
+            self._evento = None
+        if not self.activos:
+            return
+
+        # Espera hasta el próximo cambio de segundo de cualquier temporizador
+        espera = min(1 - t.transcurrido() % 1 for t in self.activos.values())
+        self._evento = Clock.schedule_once(self._tic, espera + 0.001)
+
+    def _tic(self, dt):
+        self._evento = None
+        for habito_id, temporizador in list(self.activos.items()):
+            self.dispatch("on_segundo", habito_id, temporizador.segundos())
+
+        if time.monotonic() - self._ultimo_punto_control >= INTERVALO_PUNTO_CONTROL:
+            self.punto_control()
+        self._programar()
+
+    # =================== PERSISTENCIA ===================
+    def punto_control(self):
+        estado = {
+            "activos": [t.a_dict() for t in self.activos.values()],
+            "por_guardar": self.por_guardar,
+        }
+        temporal = self.ruta + ".tmp"
+        try:
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                json.dump(estado, archivo)
+                archivo.flush()
+                os.fsync(archivo.fileno())
+            # Reemplazo atómico: el archivo siempre está entero, viejo o nuevo
+            os.replace(temporal, self.ruta)
+            self._ultimo_punto_control = time.monotonic()
+        except OSError as e:
+            print(f"Error guardando temporizadores: {e}")
+
+    def recuperar(self):
+        """Restaura lo que había en marcha antes de cerrar la aplicación.
+        Devuelve los habito_id que siguen corriendo."""
+        try:
+            with open(self.ruta, encoding="utf-8") as archivo:
+                estado = json.load(archivo)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f"Error leyendo temporizadores: {e}")
+            return []
+
+        ahora = datetime.now()
+        for datos in estado.get("activos", []):
+            habito_id = datos["habito_id"]
+            hora_inicio = datetime.fromisoformat(datos["hora_inicio"])
+            hueco = (ahora - datetime.fromisoformat(datos["punto_control"])).total_seconds()
+
+            if 0 <= hueco <= MARGEN_REANUDAR:
+                self.activos[habito_id] = Temporizador(habito_id, hora_inicio, datos["segundos"] + hueco)
+                print(f"Temporizador recuperado: hábito {habito_id}")
+            else:
+                # Demasiado tiempo cerrada: se guarda lo que consta
+                self._encolar_sesion(habito_id, hora_inicio, int(datos["segundos"]))
+
+        for clave, sesion in estado.get("por_guardar", {}).items():
+            if clave not in self.por_guardar:
+                self.por_guardar[clave] = sesion
+                self._enviar(clave, sesion)
+
+        self.punto_control()
+        self._programar()
+        return list(self.activos)
+
+    def apagar(self):
+        """Guarda el estado y deja de emitir tics. Los temporizadores en
+        marcha se recuperan en el próximo arranque."""
+        if self._evento is not None:
+            self._evento.cancel()
+            self._evento = None
+        self.punto_control()
@@ -0,0 +1,47 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# Los módulos del proyecto están en la raíz, sin paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Conexión a un servidor Postgres de pruebas, p. ej.
+#   HABITOS_TEST_DSN="host=localhost port=5432 user=postgres password=..."
+# En él se crea y se borra una base de datos por prueba. Sin la variable,
+# las pruebas de Postgres se saltan.
+DSN_PRUEBAS = os.environ.get("HABITOS_TEST_DSN")
+
+
+@pytest.fixture
+def config_postgres():
+    """CONFIG_CONEXION de una base de datos vacía que se borra al terminar."""
+    if not DSN_PRUEBAS:
+        pytest.skip("HABITOS_TEST_DSN no está definida")
+
+    import psycopg2
+    from psycopg2.extensions import parse_dsn
+    from database import CONFIG_CONEXION
+
+    parametros = parse_dsn(DSN_PRUEBAS)
+    nombre = f"habitos_prueba_{uuid.uuid4().hex[:12]}"
+    config = {
+        **CONFIG_CONEXION,
+        "host": parametros.get("host", CONFIG_CONEXION["host"]),
+        "port": parametros.get("port", CONFIG_CONEXION["port"]),
+        "user": parametros.get("user", CONFIG_CONEXION["user"]),
+        "password": parametros.get("password", ""),
+        "database": nombre,
+    }
+
+    administracion = psycopg2.connect(DSN_PRUEBAS)
+    administracion.autocommit = True
+    try:
+        with administracion.cursor() as cursor:
+            cursor.execute(f'CREATE DATABASE "{nombre}"')
+        yield config
+        with administracion.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{nombre}" WITH (FORCE)')
+    finally:
+        administracion.close()
@@ -0,0 +1,259 @@
+"""Contrato de Almacenamiento: las mismas pruebas contra BaseDatosSQLite
+(archivo temporal) y BaseDatos (con HABITOS_TEST_DSN, ver conftest.py)."""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from almacenamiento import COLUMNAS_EXPORTACION
+from contrasenas import costo_de
+from registros import Habito
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def abrir(request, tmp_path):
+    """abrir(costo=4) crea una instancia del motor sobre la misma base de
+    datos de la prueba; todas se cierran al terminar."""
+    if request.param == "sqlite":
+        from database_sqlite import BaseDatosSQLite
+        ruta = str(tmp_path / "habitos.sqlite3")
+
+        def crear(config_hash):
+            return BaseDatosSQLite(ruta, config_hash=config_hash)
+    else:
+        from database import BaseDatos
+        config = request.getfixturevalue("config_postgres")
+
+        def crear(config_hash):
+            return BaseDatos(config_conexion=config, config_hash=config_hash)
+
+    abiertas = []
+
+    def abrir(costo=4):
+        bd = crear({"costo": costo, "procesos": 0})
+        abiertas.append(bd)
+        return bd
+
+    yield abrir
+    for bd in abiertas:
+        bd.cerrar_conexion()
+
+
+@pytest.fixture
+def bd(abrir):
+    return abrir()
+
+
+def _usuario(bd, nombre="ana"):
+    resultado = bd.registrar_usuario(nombre, f"{nombre}@example.com", "secreto")
+    assert resultado["exito"], resultado
+    return resultado["usuario"]["id"]
+
+
+def _sesion(dias_atras, hora, minuto=0):
+    """Hora de inicio `dias_atras` días antes de hoy."""
+    return datetime.combine(date.today() - timedelta(days=dias_atras), datetime.min.time()) \
+        + timedelta(hours=hora, minutes=minuto)
+
+
+# =================== USUARIOS ===================
+def test_registro_login_y_rehash(abrir):
+    bd = abrir(costo=4)
+    usuario_id = _usuario(bd)
+    assert not bd.registrar_usuario("ana", "otra@example.com", "x")["exito"]
+    assert costo_de(bd._buscar_usuario("ana")["contrasena"]) == 4
+
+    assert not bd.iniciar_sesion("ana", "mala")["exito"]
+    assert not bd.iniciar_sesion("nadie", "secreto")["exito"]
+
+    # Con un coste nuevo, el primer login correcto rehace el hash
+    bd = abrir(costo=5)
+    resultado = bd.iniciar_sesion("ana@example.com", "secreto")
+    assert resultado["exito"]
+    assert resultado["usuario"]["id"] == usuario_id
+    assert costo_de(bd._buscar_usuario("ana")["contrasena"]) == 5
+    assert bd.iniciar_sesion("ana", "secreto")["exito"]
+
+
+# =================== HÁBITOS ===================
+def test_crear_actualizar_y_eliminar_habito(bd):
+    usuario_id = _usuario(bd)
+    habito = bd.crear_habito(usuario_id, "Leer", "Un rato", 20, "Aprendizaje")
+    assert isinstance(habito, Habito)
+    assert (habito.usuario_id, habito.nombre, habito.icono, habito.total_sesiones) == \
+        (usuario_id, "Leer", "book-open", 0)
+    assert bd.obtener_habito_por_id(habito.id).nombre == "Leer"  # queda en la caché
+
+    actualizado = bd.actualizar_habito(habito.id, "Leer más", "", 45, "Salud")
+    assert (actualizado.nombre, actualizado.objetivo_diario_minutos, actualizado.icono) == \
+        ("Leer más", 45, "dumbbell")
+    assert actualizado.usuario_id == usuario_id
+    assert bd.obtener_habito_por_id(habito.id).nombre == "Leer más"
+    assert [h.nombre for h in bd.obtener_habitos_usuario(usuario_id)] == ["Leer más"]
+    assert bd.actualizar_habito(habito.id + 1000, "No existe") is False
+
+    bd.registrar_sesion(habito.id, 600, hora_inicio=_sesion(0, 8))
+    eliminado = bd.eliminar_habito(habito.id)
+    assert (eliminado["id"], eliminado["usuario_id"]) == (habito.id, usuario_id)
+    assert bd.obtener_habito_por_id(habito.id) is None
+    assert bd.obtener_habitos_usuario(usuario_id) == []
+    assert bd.eliminar_habito(habito.id) is False
+
+
+# =================== SESIONES Y TOTALES ===================
+def test_registrar_sesion_y_totales(bd):
+    usuario_id = _usuario(bd)
+    leer = bd.crear_habito(usuario_id, "Leer", objetivo_minutos=30)
+    correr = bd.crear_habito(usuario_id, "Correr", objetivo_minutos=20)
+
+    sesion = bd.registrar_sesion(leer.id, 600, hora_inicio=_sesion(0, 8))
+    assert sesion["usuario_id"] == usuario_id
+    bd.registrar_sesion(leer.id, 1200, hora_inicio=_sesion(0, 9))
+    bd.registrar_sesion(correr.id, 900, hora_inicio=_sesion(0, 7))
+    # registrar_sesion anota siempre en el día de hoy; lo atrasado entra importado
+    anterior = _sesion(3, 9)
+    assert bd.importar_sesiones([(leer.id, anterior.date(), anterior, None, 300, "")])["insertadas"] == 1
+
+    habito = bd.obtener_habito_por_id(leer.id)
+    assert (habito.total_sesiones, habito.total_segundos, habito.minutos_hoy) == (3, 2100, 30)
+
+    resumen = bd.obtener_resumen_inicio(usuario_id)
+    assert [h.id for h in resumen['habitos']] == [correr.id, leer.id]
+    assert (resumen['total_habitos'], resumen['total_sesiones'], resumen['total_segundos']) == (2, 4, 3000)
+    assert resumen['minutos_hoy'] == 45
+    assert resumen['progreso_general'] == 90  # (30 + 15) / (30 + 20)
+
+    estadisticas = bd.obtener_estadisticas_usuario(usuario_id)
+    assert (estadisticas.total_habitos, estadisticas.total_sesiones, estadisticas.total_segundos) == (2, 4, 3000)
+
+    # Borrar una sesión resta del acumulado
+    assert bd.eliminar_sesion(sesion["id"])
+    habito = bd.obtener_habito_por_id(leer.id)
+    assert (habito.total_sesiones, habito.total_segundos) == (2, 1500)
+
+
+def test_rachas_con_varias_sesiones_el_mismo_dia(bd):
+    usuario_id = _usuario(bd)
+    habito = bd.crear_habito(usuario_id, "Leer")
+    # Hoy y los dos días anteriores, con varias sesiones por día; antes, un hueco
+    for hora in (7, 8, 9):
+        bd.registrar_sesion(habito.id, 60, hora_inicio=_sesion(0, hora))
+    anteriores = [_sesion(dias_atras, hora) for dias_atras, hora in
+                  ((1, 7), (1, 20), (2, 7), (5, 7), (5, 8), (6, 7))]
+    bd.importar_sesiones([(habito.id, inicio.date(), inicio, None, 60, "") for inicio in anteriores])
+
+    leido = bd.obtener_habito_por_id(habito.id)
+    assert (leido.racha_dias, leido.racha_maxima) == (3, 3)
+    assert leido.inicio_racha == date.today() - timedelta(days=2)
+    assert bd.calcular_racha_habito(habito.id) == 3
+    assert bd.calcular_racha_total(usuario_id) == 3
+    assert bd.obtener_resumen_inicio(usuario_id)['racha_total'] == 3
+
+
+def test_importar_sesiones_dos_veces_no_duplica(bd):
+    usuario_id = _usuario(bd)
+    habito = bd.crear_habito(usuario_id, "Leer")
+    filas = [
+        (habito.id, date(2023, 5, 1), datetime(2023, 5, 1, 8, 0), None, 600, "una"),
+        (habito.id, date(2023, 5, 1), datetime(2023, 5, 1, 9, 0), None, 300, ""),
+        # Otro año: en Postgres, otra partición
+        {"habito_id": habito.id, "fecha": "2021-11-02", "hora_inicio": None, "hora_fin": None,
+         "duracion_segundos": 120, "notas": None},
+        (habito.id + 1000, date(2023, 5, 1), datetime(2023, 5, 1, 8, 0), None, 60, "hábito inexistente"),
+    ]
+
+    reporte = bd.importar_sesiones(filas)
+    assert reporte["exito"]
+    assert (reporte["leidas"], reporte["insertadas"], reporte["descartadas"]) == (4, 3, 1)
+
+    reporte = bd.importar_sesiones(filas, tamano_lote=2)
+    assert reporte["exito"]
+    assert (reporte["insertadas"], reporte["descartadas"]) == (0, 4)
+
+    leido = bd.obtener_habito_por_id(habito.id)
+    assert (leido.total_sesiones, leido.total_segundos) == (3, 1020)
+
+
+def test_historial_por_clave_sin_duplicados(bd):
+    usuario_id = _usuario(bd)
+    habito = bd.crear_habito(usuario_id, "Leer")
+    otro = bd.crear_habito(usuario_id, "Correr")
+    # Varias por día, y la misma hora en días distintos
+    inicios = [_sesion(dias_atras, hora, minuto) for dias_atras in range(6)
+               for hora, minuto in ((7, 0), (8, 0), (8, 30), (21, 0))]
+    bd.importar_sesiones([(habito.id, inicio.date(), inicio, None, 60, "") for inicio in inicios])
+    bd.registrar_sesion(otro.id, 60, hora_inicio=_sesion(0, 10))
+
+    vistas = []
+    despues_de = None
+    while True:
+        pagina = bd.obtener_historial_sesiones(habito.id, despues_de=despues_de, limite=5)
+        assert len(pagina['sesiones']) <= 5
+        vistas.extend(pagina['sesiones'])
+        despues_de = pagina['siguiente']
+        if despues_de is None:
+            break
+
+    assert len(vistas) == len({sesion.id for sesion in vistas}) == 24
+    claves = [(sesion.fecha, sesion.hora_inicio, sesion.id) for sesion in vistas]
+    assert claves == sorted(claves, reverse=True)
+
+
+# =================== DIARIO LOCAL ===================
+def test_aplicar_diario_es_idempotente(bd):
+    usuario_id = _usuario(bd)
+    habito = bd.crear_habito(usuario_id, "Leer")
+    hora_inicio = _sesion(0, 8)
+    lote = [
+        {'clave': 'sesion-1', 'tipo': 'sesion', 'datos': {
+            'habito_id': habito.id, 'fecha': hora_inicio.date().isoformat(),
+            'hora_inicio': hora_inicio.isoformat(), 'hora_fin': None,
+            'duracion_segundos': 600, 'notas': ""}},
+        # Sesión de un mes atrasado, sin partición todavía en Postgres
+        {'clave': 'sesion-2', 'tipo': 'sesion', 'datos': {
+            'habito_id': habito.id, 'fecha': "2019-07-04",
+            'hora_inicio': "2019-07-04T08:00:00", 'hora_fin': None,
+            'duracion_segundos': 300, 'notas': ""}},
+        {'clave': 'habito-1', 'tipo': 'habito', 'datos': {
+            'habito_id': habito.id, 'nombre': "Leer más", 'descripcion': "",
+            'objetivo_minutos': 40, 'categoria': "Aprendizaje"}},
+        {'clave': 'recordatorio-1', 'tipo': 'recordatorio', 'datos': {
+            'habito_id': habito.id, 'activo': True, 'hora_inicio': "07:30", 'hora_fin': "08:00"}},
+    ]
+
+    assert bd.aplicar_diario(lote) == 2
+    # La confirmación se perdió y el diario reenvía el mismo lote
+    assert bd.aplicar_diario(lote) == 0
+
+    leido = bd.obtener_habito_por_id(habito.id)
+    assert (leido.total_sesiones, leido.total_segundos) == (2, 900)
+    assert (leido.nombre, leido.objetivo_diario_minutos, leido.icono) == ("Leer más", 40, "book-open")
+    assert bd.obtener_recordatorio(habito.id).activo
+    assert bd.obtener_historial_sesiones(habito.id)['sesiones'][-1].fecha == date(2019, 7, 4)
+
+
+# =================== EXPORTACIÓN ===================
+def test_recorrer_exportacion(bd):
+    ana = _usuario(bd, "ana")
+    luis = _usuario(bd, "luis")
+    habitos_ana = [bd.crear_habito(ana, f"Hábito {i}") for i in range(4)]
+    habito_luis = bd.crear_habito(luis, "De Luis")
+    for habito in habitos_ana:
+        for hora in (7, 8):
+            bd.registrar_sesion(habito.id, 60, hora_inicio=_sesion(0, hora))
+    bd.registrar_sesion(habito_luis.id, 60, hora_inicio=_sesion(0, 7))
+
+    lotes = list(bd.recorrer_exportacion("sesiones", usuario_id=ana, tamano_lote=3))
+    assert all(1 <= len(lote) <= 3 for lote in lotes)
+    filas = [fila for lote in lotes for fila in lote]
+    assert len(filas) == 8
+    assert all(len(fila) == len(COLUMNAS_EXPORTACION["sesiones"]) for fila in filas)
+    posicion = COLUMNAS_EXPORTACION["sesiones"].index("habito_id")
+    assert {fila[posicion] for fila in filas} == {habito.id for habito in habitos_ana}
+
+    habitos = [fila for lote in bd.recorrer_exportacion("habitos", usuario_id=ana) for fila in lote]
+    posicion = COLUMNAS_EXPORTACION["habitos"].index("nombre")
+    assert sorted(fila[posicion] for fila in habitos) == [f"Hábito {i}" for i in range(4)]
+
+    # Sin usuario, toda la base de datos
+    todas = sum(len(lote) for lote in bd.recorrer_exportacion("sesiones", tamano_lote=4))
+    assert todas == 9
@@ -0,0 +1,88 @@
+"""Diario local contra BaseDatosSQLite: descarte de entradas imposibles y
+ediciones pendientes superpuestas a las lecturas."""
+from datetime import datetime, time
+
+import pytest
+
+from database_sqlite import BaseDatosSQLite
+from diario import DiarioLocal
+
+
+@pytest.fixture
+def base_datos(tmp_path):
+    bd = BaseDatosSQLite(str(tmp_path / "habitos.sqlite3"), config_hash={"costo": 4, "procesos": 0})
+    yield bd
+    bd.cerrar_conexion()
+
+
+@pytest.fixture
+def diario(tmp_path, base_datos):
+    diario = DiarioLocal(str(tmp_path / "diario.sqlite3"), base_datos)
+    yield diario
+    diario.cerrar()
+
+
+@pytest.fixture
+def habito(base_datos):
+    usuario = base_datos.registrar_usuario("ana", "ana@example.com", "secreto")
+    return base_datos.crear_habito(usuario["usuario"]["id"], "Leer", objetivo_minutos=20)
+
+
+def test_valida_antes_de_anotar(diario, habito):
+    with pytest.raises(ValueError):
+        diario.actualizar_habito(habito.id, "x" * 101)
+    with pytest.raises(ValueError):
+        diario.actualizar_habito(habito.id, "Leer", categoria="c" * 51)
+    with pytest.raises(ValueError):
+        diario.actualizar_habito(habito.id, "Leer", objetivo_minutos=2**31)
+    with pytest.raises(ValueError):
+        diario.actualizar_recordatorio(habito.id, True, "25:99", "10:00")
+    assert diario.pendientes() == 0
+
+
+def test_entrada_rechazada_se_descarta_sin_bloquear_el_resto(diario, base_datos, habito):
+    diario.registrar_sesion(habito.id, 600, hora_inicio=datetime(2024, 5, 1, 8, 0))
+    # Saltándose la validación: el servidor la rechaza (nombre NOT NULL)
+    diario.anotar('habito', {'habito_id': habito.id, 'nombre': None, 'descripcion': "",
+                             'objetivo_minutos': 20, 'categoria': "Salud"})
+    diario.actualizar_habito(habito.id, "Leer más", objetivo_minutos=40)
+
+    assert diario.vaciar() == 3
+    assert diario.pendientes() == 0
+
+    descartadas = diario.descartadas()
+    assert len(descartadas) == 1
+    assert descartadas[0]['tipo'] == 'habito'
+    assert descartadas[0]['datos']['nombre'] is None
+    assert "IntegrityError" in descartadas[0]['error']
+
+    guardado = base_datos.obtener_habito_por_id(habito.id)
+    assert guardado.nombre == "Leer más"
+    assert guardado.objetivo_diario_minutos == 40
+    assert guardado.total_sesiones == 1
+
+
+def test_lecturas_con_ediciones_pendientes(diario, base_datos, habito):
+    # Se cachea la versión del servidor antes de editar
+    assert base_datos.obtener_habito_por_id(habito.id).nombre == "Leer"
+
+    diario.actualizar_habito(habito.id, "Leer más", objetivo_minutos=40, categoria="Aprendizaje")
+    diario.actualizar_recordatorio(habito.id, True, "07:30", "08:00")
+
+    leido = diario.obtener_habito_por_id(habito.id)
+    assert leido.nombre == "Leer más"
+    assert leido.icono == "book-open"
+    # La caché del almacenamiento no se toca
+    assert base_datos.obtener_habito_por_id(habito.id).nombre == "Leer"
+
+    resumen = diario.obtener_resumen_inicio(habito.usuario_id)
+    assert [h.nombre for h in resumen['habitos']] == ["Leer más"]
+    assert resumen['total_habitos'] == 1
+
+    recordatorio = diario.obtener_recordatorio(habito.id)
+    assert recordatorio.activo is True
+    assert recordatorio.hora_inicio == time(7, 30)
+
+    diario.vaciar()
+    assert diario.obtener_habito_por_id(habito.id).nombre == "Leer más"
+    assert base_datos.obtener_habito_por_id(habito.id).objetivo_diario_minutos == 40
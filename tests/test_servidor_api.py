@@ -0,0 +1,183 @@
+"""Servidor API con el cliente de pruebas de aiohttp contra una base de
+datos Postgres desechable (ver config_postgres en conftest.py)."""
+import asyncio
+from datetime import datetime, timedelta
+
+import psycopg2
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from servidor_api import crear_aplicacion
+
+
+@pytest.fixture
+def api(config_postgres):
+    """api(prueba) ejecuta `await prueba(cliente)` con un servidor recién
+    arrancado (migraciones incluidas) sobre la base de datos de la prueba."""
+    async def con_cliente(prueba):
+        app = crear_aplicacion(
+            config_conexion=config_postgres,
+            config_hash={"costo": 4, "procesos": 0},
+            secreto=b"secreto de pruebas",
+        )
+        async with TestClient(TestServer(app)) as cliente:
+            await prueba(cliente)
+
+    return lambda prueba: asyncio.run(con_cliente(prueba))
+
+
+async def _registrar(cliente, nombre):
+    respuesta = await cliente.post("/usuarios", json={
+        "nombre_usuario": nombre, "email": f"{nombre}@example.com", "contrasena": "secreto",
+    })
+    assert respuesta.status == 201
+    datos = await respuesta.json()
+    return {"Authorization": f"Bearer {datos['token']}"}
+
+
+async def _crear_habito(cliente, cabeceras, nombre="Leer"):
+    respuesta = await cliente.post("/habitos", json={"nombre": nombre}, headers=cabeceras)
+    assert respuesta.status == 201
+    return (await respuesta.json())["id"]
+
+
+def test_login(api):
+    async def prueba(cliente):
+        await _registrar(cliente, "ana")
+
+        respuesta = await cliente.post("/login", json={"usuario": "ana", "contrasena": "secreto"})
+        assert respuesta.status == 200
+        datos = await respuesta.json()
+        assert datos["usuario"]["nombre_usuario"] == "ana"
+        respuesta = await cliente.get("/habitos", headers={"Authorization": f"Bearer {datos['token']}"})
+        assert respuesta.status == 200
+
+        respuesta = await cliente.post("/login", json={"usuario": "ana@example.com", "contrasena": "otra"})
+        assert respuesta.status == 401
+        respuesta = await cliente.post("/login", json={"usuario": "nadie", "contrasena": "secreto"})
+        assert respuesta.status == 401
+
+    api(prueba)
+
+
+def test_tokens_no_validos(api):
+    async def prueba(cliente):
+        cabeceras = await _registrar(cliente, "ana")
+        token = cabeceras["Authorization"][len("Bearer "):]
+        usuario_id, expira, firma = token.split(".")
+
+        for falso in (
+            f"{usuario_id}.{expira}.{firma[:-1]}{'0' if firma[-1] != '0' else '1'}",
+            f"{int(usuario_id) + 1}.{expira}.{firma}",
+            f"{usuario_id}.{expira}.ñ{firma[1:]}",
+            "basura",
+        ):
+            respuesta = await cliente.get("/habitos", headers={"Authorization": f"Bearer {falso}"})
+            assert respuesta.status == 401, falso
+        assert (await cliente.get("/habitos")).status == 401
+
+    api(prueba)
+
+
+def test_crud_habitos_y_acceso_ajeno(api):
+    async def prueba(cliente):
+        ana = await _registrar(cliente, "ana")
+        luis = await _registrar(cliente, "luis")
+        habito_id = await _crear_habito(cliente, ana)
+
+        respuesta = await cliente.put(f"/habitos/{habito_id}", headers=ana, json={
+            "nombre": "Leer más", "objetivo_diario_minutos": 45, "categoria": "Aprendizaje",
+        })
+        assert respuesta.status == 200
+        habito = await respuesta.json()
+        assert (habito["nombre"], habito["objetivo_diario_minutos"], habito["icono"]) == ("Leer más", 45, "book-open")
+
+        listado = await (await cliente.get("/habitos", headers=ana)).json()
+        assert [h["id"] for h in listado] == [habito_id]
+        assert await (await cliente.get("/habitos", headers=luis)).json() == []
+
+        # Para otro usuario el hábito no existe
+        assert (await cliente.get(f"/habitos/{habito_id}", headers=luis)).status == 404
+        assert (await cliente.put(f"/habitos/{habito_id}", headers=luis, json={"nombre": "Mío"})).status == 404
+        assert (await cliente.delete(f"/habitos/{habito_id}", headers=luis)).status == 404
+        assert (await cliente.get(f"/habitos/{habito_id}/sesiones", headers=luis)).status == 404
+        respuesta = await cliente.post(f"/habitos/{habito_id}/sesiones", headers=luis,
+                                       json={"duracion_segundos": 60})
+        assert respuesta.status == 404
+
+        assert (await cliente.delete(f"/habitos/{habito_id}", headers=ana)).status == 204
+        assert (await cliente.get(f"/habitos/{habito_id}", headers=ana)).status == 404
+
+    api(prueba)
+
+
+def test_validacion_habito(api):
+    async def prueba(cliente):
+        ana = await _registrar(cliente, "ana")
+        for cuerpo in (
+            {"nombre": "Leer", "categoria": ["Salud"]},
+            {"nombre": "Leer", "categoria": {"a": 1}},
+            {"nombre": "Leer", "categoria": "c" * 51},
+            {"nombre": "x" * 101},
+            {"nombre": "Leer", "objetivo_diario_minutos": 2**31},
+            {"descripcion": "sin nombre"},
+        ):
+            respuesta = await cliente.post("/habitos", json=cuerpo, headers=ana)
+            assert respuesta.status == 400, cuerpo
+
+        respuesta = await cliente.post("/habitos", json={"nombre": "Leer", "categoria": "c" * 50}, headers=ana)
+        assert respuesta.status == 201
+
+    api(prueba)
+
+
+def test_sesion_atrasada_crea_su_particion(api, config_postgres):
+    async def prueba(cliente):
+        ana = await _registrar(cliente, "ana")
+        habito_id = await _crear_habito(cliente, ana)
+        respuesta = await cliente.post(f"/habitos/{habito_id}/sesiones", headers=ana, json={
+            "duracion_segundos": 900, "hora_inicio": "2017-03-05T08:00:00",
+        })
+        assert respuesta.status == 201
+        assert (await respuesta.json())["fecha"] == "2017-03-05"
+
+    api(prueba)
+
+    conexion = psycopg2.connect(**config_postgres)
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM sesiones")
+            assert cursor.fetchall() == [("sesiones_2017_03",)]
+    finally:
+        conexion.close()
+
+
+def test_paginas_de_sesiones(api):
+    async def prueba(cliente):
+        ana = await _registrar(cliente, "ana")
+        habito_id = await _crear_habito(cliente, ana)
+        inicio = datetime(2024, 1, 30, 8, 0)
+        # Varias el mismo día y dos a la misma hora en días distintos
+        for horas in (0, 1, 2, 24, 48, 49, 72):
+            respuesta = await cliente.post(f"/habitos/{habito_id}/sesiones", headers=ana, json={
+                "duracion_segundos": 60, "hora_inicio": (inicio + timedelta(hours=horas)).isoformat(),
+            })
+            assert respuesta.status == 201
+
+        vistas = []
+        parametros = {"limite": "2"}
+        while True:
+            respuesta = await cliente.get(f"/habitos/{habito_id}/sesiones", headers=ana, params=parametros)
+            assert respuesta.status == 200
+            pagina = await respuesta.json()
+            assert len(pagina["sesiones"]) <= 2
+            vistas.extend(pagina["sesiones"])
+            if pagina["siguiente"] is None:
+                break
+            parametros = {"limite": "2", "despues_de": pagina["siguiente"]}
+
+        horas_inicio = [sesion["hora_inicio"] for sesion in vistas]
+        assert len({sesion["id"] for sesion in vistas}) == len(vistas) == 7
+        assert horas_inicio == sorted(horas_inicio, reverse=True)
+
+    api(prueba)